@@ -1,8 +1,9 @@
 #!/usr/bin/env python
 import click
 import uvicorn
+from config.config import Config
 from src.database.db import init_db, Session
-from src.database.models import Crop, User, UserRole, Future
+from src.database.models import Crop, User, UserRole, Market
 from datetime import datetime
 import os
 from dotenv import load_dotenv
@@ -32,7 +33,7 @@ def initdb():
     click.echo("Initializing database...")
     try:
         init_db()
-        click.echo("✅ Database tables created successfully!")
+        click.echo("✅ Database schema migrated successfully!")
         
         # Create initial data
         session = Session()
@@ -45,6 +46,26 @@ def initdb():
     except Exception as e:
         click.echo(f"❌ Error: {str(e)}")
 
+@cli.command()
+@click.option('--revision', default='head', help='Revision to upgrade to')
+@click.option('--sql', 'show_sql', is_flag=True, help='Print the SQL instead of applying it')
+@click.option('--url', default=None, help='Database URL (default: DATABASE_URL)')
+def migrate(revision, show_sql, url):
+    """Apply schema migrations to the database"""
+    from src.database.migrations import current_revision, migrate as run_migrations, migration_sql
+
+    try:
+        if show_sql:
+            migration_sql(revision, start=current_revision(url), url=url)
+            return
+        before, after = run_migrations(revision, url=url)
+        if before == after:
+            click.echo(f"✅ Database already at revision {after}")
+        else:
+            click.echo(f"✅ Migrated database from {before or 'empty'} to {after}")
+    except Exception as e:
+        click.echo(f"❌ Error: {str(e)}")
+
 @cli.command()
 def create_stellar():
     """Create and fund a Stellar testnet account"""
@@ -113,7 +134,7 @@ def create_user(phone):
         session.close()
 
 def create_initial_data(session):
-    """Create initial crop data"""
+    """Create initial crop and market data"""
     crops = [
         Crop(name='corn', current_price=2.5, last_updated=datetime.now()),
         Crop(name='wheat', current_price=3.0, last_updated=datetime.now()),
@@ -126,6 +147,16 @@ def create_initial_data(session):
     if not existing:
         session.add_all(crops)
         session.commit()
+    
+    known = {name for name, in session.query(Market.name)}
+    markets = [
+        Market(name=name, latitude=latitude, longitude=longitude)
+        for name, (latitude, longitude) in Config.MARKETS.items()
+        if name not in known
+    ]
+    if markets:
+        session.add_all(markets)
+        session.commit()
 
 def update_env_file(public_key, secret_key):
     """Update .env file with Stellar keys"""
@@ -149,39 +180,79 @@ def update_env_file(public_key, secret_key):
 
 @cli.command()
 @click.argument('phone', required=False)
-def list_futures(phone):
+@click.option('--status', default=None, help='Only futures with this status (active, expired, exercised)')
+@click.option('--after-id', type=int, default=None, help='Start after this future id')
+@click.option('--limit', type=int, default=None, help='Stop after this many futures (default: all)')
+@click.option('--format', 'output_format', type=click.Choice(['table', 'csv', 'json']), default='table', help='table, csv, or json (one object per line)')
+@click.option('--include-archived', is_flag=True, help='Also list archived contracts')
+def list_futures(phone, status, after_id, limit, output_format, include_archived):
     """List all futures contracts or filter by phone number"""
+    import csv
+    import json
+    import sys
+    from src.database.listings import iter_futures
+    from src.payments.money import from_minor
+    
+    def record(future):
+        return {
+            'id': future.id,
+            'farmer': future.user.name,
+            'phone': future.user.phone_number,
+            'crop': future.crop.name,
+            'quantity': future.quantity,
+            'strike_price': future.strike_price,
+            'premium': from_minor(future.premium),
+            'status': future.status,
+            'created_at': future.created_at.isoformat(),
+            'expiration_date': future.expiration_date.isoformat()
+        }
+    
+    session = Session()
     try:
-        session = Session()
-        query = session.query(Future).join(User)
-        
-        if phone:
-            query = query.filter(User.phone_number == phone)
-            
-        futures = query.all()
+        futures = iter_futures(
+            session, phone=phone, status=status, after_id=after_id, limit=limit, include_archived=include_archived
+        )
         
-        if not futures:
-            click.echo("No futures contracts found.")
+        # Rows are written as pages arrive, so dumps of any size use constant memory
+        if output_format == 'csv':
+            writer = None
+            for future in futures:
+                row = record(future)
+                if writer is None:
+                    writer = csv.DictWriter(sys.stdout, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+            return
+        if output_format == 'json':
+            for future in futures:
+                click.echo(json.dumps(record(future)))
             return
-            
-        click.echo("\n🌾 Futures Contracts")
-        click.echo("=" * 80)
-        click.echo(f"{'ID':4} {'Farmer':15} {'Crop':10} {'Quantity':10} {'Strike':8} {'Premium':8} {'Status':10} {'Created'}")
-        click.echo("-" * 80)
         
+        shown, last_id = 0, None
         for future in futures:
+            if not shown:
+                click.echo("\n🌾 Futures Contracts")
+                click.echo("=" * 80)
+                click.echo(f"{'ID':4} {'Farmer':15} {'Crop':10} {'Quantity':10} {'Strike':8} {'Premium':8} {'Status':10} {'Created'}")
+                click.echo("-" * 80)
             click.echo(
                 f"{future.id:<4} "
                 f"{future.user.name[:15]:<15} "
                 f"{future.crop.name:<10} "
                 f"{future.quantity:<10.2f} "
                 f"{future.strike_price:<8.2f} "
-                f"{future.premium:<8.2f} "
+                f"{from_minor(future.premium):<8.2f} "
                 f"{future.status:<10} "
                 f"{future.created_at.strftime('%Y-%m-%d')}"
             )
+            shown, last_id = shown + 1, future.id
             
+        if not shown:
+            click.echo("No futures contracts found.")
+            return
         click.echo("-" * 80)
+        if limit is not None and shown == limit:
+            click.echo(f"Next page: --after-id {last_id}")
         
     except Exception as e:
         click.echo(f"❌ Error: {str(e)}")
@@ -192,9 +263,14 @@ def list_futures(phone):
 @click.argument('future_id', type=int)
 def show_future(future_id):
     """Show detailed information about a specific future contract"""
+    from src.database.archive import future_history
+    from src.payments.money import format_amount
+    
     try:
         session = Session()
-        future = session.query(Future).filter_by(id=future_id).first()
+        # Archived contracts are shown too
+        history = future_history()
+        future = session.query(history).filter(history.id == future_id).first()
         
         if not future:
             click.echo(f"No future contract found with ID {future_id}")
@@ -207,8 +283,8 @@ def show_future(future_id):
         click.echo(f"Phone:         {future.user.phone_number}")
         click.echo(f"Crop:          {future.crop.name}")
         click.echo(f"Quantity:      {future.quantity} kg")
-        click.echo(f"Strike Price:  {future.strike_price} KES/kg")
-        click.echo(f"Premium:       {future.premium} KES")
+        click.echo(f"Strike Price:  {future.strike_price} {Config.BASE_CURRENCY}/kg")
+        click.echo(f"Premium:       {format_amount(future.premium)} {Config.BASE_CURRENCY}")
         click.echo(f"Status:        {future.status}")
         click.echo(f"Created:       {future.created_at.strftime('%Y-%m-%d %H:%M:%S')}")
         click.echo(f"Expires:       {future.expiration_date.strftime('%Y-%m-%d %H:%M:%S')}")
@@ -216,12 +292,12 @@ def show_future(future_id):
         
         # Get current price
         crop = session.query(Crop).filter_by(id=future.crop_id).first()
-        click.echo(f"Current Price: {crop.current_price} KES/kg")
+        click.echo(f"Current Price: {crop.current_price} {Config.BASE_CURRENCY}/kg")
         
         # Calculate potential payout
         if crop.current_price < future.strike_price:
             payout = (future.strike_price - crop.current_price) * future.quantity
-            click.echo(f"Potential Payout: {payout} KES")
+            click.echo(f"Potential Payout: {payout} {Config.BASE_CURRENCY}")
         
         click.echo("=" * 50)
         
@@ -230,5 +306,348 @@ def show_future(future_id):
     finally:
         session.close()
 
+@cli.command()
+@click.option('--scenarios', type=int, default=None, help='Number of simulated scenarios')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+@click.option('--confidence', type=float, default=None, help='VaR confidence level, e.g. 0.99')
+@click.option('--seed', type=int, default=None, help='Random seed for reproducible runs')
+def risk(scenarios, workers, confidence, seed):
+    """Estimate payout liability, VaR and expected shortfall on active futures"""
+    from src.oracle.volatility import get_volatility_tracker
+    from src.risk import load_book, run_risk
+    
+    try:
+        session = Session()
+        book = load_book(session)
+        click.echo(f"Loaded {len(book)} active contracts across {len(book.crops)} crops")
+        
+        report = run_risk(
+            book,
+            scenarios=scenarios,
+            workers=workers,
+            confidence=confidence,
+            seed=seed,
+            volatilities=get_volatility_tracker().volatilities(book.crops)
+        )
+        
+        click.echo(f"\n📉 Issuer Risk ({report['scenarios']} scenarios, {report['confidence']:.1%} confidence)")
+        click.echo("=" * 80)
+        click.echo(f"{'Crop':10} {'Contracts':>10} {'Open kg':>12} {'Expected':>14} {'VaR':>14} {'ES':>14}")
+        click.echo("-" * 80)
+        rows = list(report['crops'].items()) + [('TOTAL', report['total'])]
+        for name, stats in rows:
+            click.echo(
+                f"{name:10} "
+                f"{stats['contracts']:>10} "
+                f"{stats['open_quantity']:>12.2f} "
+                f"{stats['expected_payout']:>14.2f} "
+                f"{stats['var']:>14.2f} "
+                f"{stats['expected_shortfall']:>14.2f}"
+            )
+        click.echo("-" * 80)
+        click.echo(f"Completed in {report['elapsed_seconds']:.1f}s")
+        
+    except Exception as e:
+        click.echo(f"❌ Error: {str(e)}")
+    finally:
+        session.close()
+
+@cli.command()
+@click.option('--csv', 'csv_path', type=click.Path(exists=True, dir_okay=False), default=None, help='Price history CSV (default: recorded ticks)')
+@click.option('--days', type=int, default=365, help='Days of recorded ticks to replay when no CSV is given')
+@click.option('--contracts', type=int, default=100000, help='Synthetic contracts to buy over the history')
+@click.option('--real-book', is_flag=True, help='Replay stored futures instead of a synthetic book')
+@click.option('--policy', type=click.Choice(['expiry', 'first_itm']), default='expiry', help='When in-the-money contracts are exercised')
+@click.option('--seed', type=int, default=None, help='Random seed for the synthetic book')
+def backtest(csv_path, days, contracts, real_book, policy, seed):
+    """Replay premiums and payouts against historical prices"""
+    from datetime import timedelta
+    from src.oracle.ticks import get_tick_store
+    from src.risk import PriceHistory, book_from_futures, run_backtest, synthetic_book
+    
+    try:
+        session = Session()
+        if csv_path:
+            history = PriceHistory.from_csv(csv_path)
+        else:
+            end = datetime.now()
+            crops = [crop.name for crop in session.query(Crop).order_by(Crop.id)]
+            history = PriceHistory.from_ticks(get_tick_store(), crops, end - timedelta(days=days), end)
+        if not history.crops:
+            click.echo("❌ No price history found")
+            return
+        click.echo(f"Loaded {len(history)} days of prices for {', '.join(history.crops)} from {history.start}")
+        
+        book = book_from_futures(session, history) if real_book else synthetic_book(history, contracts, seed=seed)
+        report = run_backtest(history, book, policy=policy)
+        
+        click.echo(f"\n📊 Backtest ({len(book)} contracts, exercise at {policy})")
+        click.echo("=" * 80)
+        click.echo(f"{'Crop':10} {'Contracts':>10} {'Exercised':>10} {'Premiums':>14} {'Payouts':>14} {'Net':>12} {'Loss %':>7}")
+        click.echo("-" * 80)
+        rows = list(report['crops'].items()) + [('TOTAL', report['total'])]
+        for name, stats in rows:
+            click.echo(
+                f"{name:10} "
+                f"{stats['contracts']:>10} "
+                f"{stats['exercised']:>10} "
+                f"{stats['premiums']:>14.2f} "
+                f"{stats['payouts']:>14.2f} "
+                f"{stats['net']:>12.2f} "
+                f"{stats['loss_ratio']:>7.1%}"
+            )
+        click.echo("-" * 80)
+        click.echo(f"Worst cumulative drawdown: {report['total']['max_drawdown']:.2f}")
+        if report['skipped']:
+            click.echo(f"Skipped {report['skipped']} contracts expiring after the history or bought before a price")
+        click.echo(f"Completed in {report['elapsed_seconds']:.1f}s")
+        
+    except Exception as e:
+        click.echo(f"❌ Error: {str(e)}")
+    finally:
+        session.close()
+
+@cli.command('simulate-prices')
+@click.option('--paths', type=int, default=1, help='Number of simulated price paths')
+@click.option('--days', type=int, default=90, help='Days per path')
+@click.option('--seed', type=int, default=None, help='Random seed for reproducible paths')
+@click.option('--output', type=click.File('w'), default='-', help='CSV file to write (default: stdout)')
+def simulate_prices(paths, days, seed, output):
+    """Write correlated daily price paths for every crop as CSV (for load tests and stress scenarios)"""
+    import csv
+    from src.oracle.simulator import PriceSimulator
+    
+    try:
+        session = Session()
+        crops = session.query(Crop).order_by(Crop.id).all()
+        if not crops:
+            click.echo("❌ No crops found. Run initdb first.")
+            return
+            
+        simulator = PriceSimulator([crop.name for crop in crops], [crop.current_price for crop in crops], seed=seed)
+        prices = simulator.paths(paths, days)
+        
+        writer = csv.writer(output)
+        writer.writerow(['path', 'day', 'crop', 'price'])
+        for path in range(paths):
+            for day in range(days):
+                for i, crop in enumerate(simulator.crops):
+                    writer.writerow([path, day + 1, crop, f"{prices[path, day, i]:.4f}"])
+                    
+    except Exception as e:
+        click.echo(f"❌ Error: {str(e)}")
+    finally:
+        session.close()
+
+@cli.command()
+@click.option('--crop', default=None, help='Only this crop')
+@click.option('--strike-below', type=float, default=None, help='Only strikes below this price')
+@click.option('--expiry-from', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='First expiry date (YYYY-MM-DD)')
+@click.option('--expiry-to', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Last expiry date (YYYY-MM-DD)')
+def exposure(crop, strike_below, expiry_from, expiry_to):
+    """Show open protection per crop and expiry week"""
+    from src.database.exposure import query_exposure
+    
+    try:
+        session = Session()
+        rows = query_exposure(
+            session,
+            crop=crop,
+            strike_below=strike_below,
+            expiry_from=expiry_from.date() if expiry_from else None,
+            expiry_to=expiry_to.date() if expiry_to else None
+        )
+        
+        if not rows:
+            click.echo("No open exposure found.")
+            return
+            
+        click.echo("\n🛡️ Open Exposure")
+        click.echo("=" * 80)
+        click.echo(f"{'Crop':10} {'Expiry Week':12} {'Contracts':>10} {'Quantity kg':>14} {'Premium':>12} {'Avg Strike':>12}")
+        click.echo("-" * 80)
+        for row in rows:
+            click.echo(
+                f"{row['crop']:10} "
+                f"{row['expiry_week'].strftime('%Y-%m-%d'):12} "
+                f"{row['open_contracts']:>10} "
+                f"{row['open_quantity']:>14.2f} "
+                f"{row['premium_collected']:>12.2f} "
+                f"{row['average_strike'] or 0:>12.2f}"
+            )
+        click.echo("-" * 80)
+        click.echo(f"Total: {sum(row['open_quantity'] for row in rows):.2f} kg")
+        
+    except Exception as e:
+        click.echo(f"❌ Error: {str(e)}")
+    finally:
+        session.close()
+
+@cli.command()
+def rebuild_exposure():
+    """Recompute exposure aggregates from the active futures"""
+    from src.database.exposure import rebuild_exposure as rebuild
+    
+    try:
+        session = Session()
+        buckets = rebuild(session)
+        session.commit()
+        click.echo(f"✅ Rebuilt {buckets} exposure buckets")
+    except Exception as e:
+        session.rollback()
+        click.echo(f"❌ Error: {str(e)}")
+    finally:
+        session.close()
+
+@cli.command()
+def expire_futures():
+    """Settle or expire lapsed futures and queue farmer notifications"""
+    from src.jobs import ExpirySweeper, SettlementEngine
+    
+    try:
+        if Config.AUTO_SETTLE_AT_EXPIRY:
+            engine = SettlementEngine()
+            closed = engine.run()
+            click.echo(f"✅ Closed {closed} futures, settled {engine.settled} (payout {engine.paid_out:.2f} {Config.BASE_CURRENCY})")
+        else:
+            expired = ExpirySweeper().run()
+            click.echo(f"✅ Expired {expired} futures")
+    except Exception as e:
+        click.echo(f"❌ Error: {str(e)}")
+
+@cli.command()
+@click.option('--batch-size', type=int, default=None, help='Rows moved per database transaction')
+def archive(batch_size):
+    """Move closed futures and old transactions into the archive tables"""
+    from src.jobs import HistoryArchiver
+    
+    try:
+        moved = HistoryArchiver(batch_size=batch_size).run()
+        click.echo(f"✅ Archived {moved['futures']} futures and {moved['transactions']} transactions")
+    except Exception as e:
+        click.echo(f"❌ Error: {str(e)}")
+
+@cli.command('assign-markets')
+@click.option('--all', 'reassign', is_flag=True, help='Reassign farmers who already have a market')
+def assign_markets(reassign):
+    """Geocode farmer locations and attach each farmer's nearest market"""
+    from src.markets import MarketRegistry
+
+    session = Session()
+    try:
+        registry = MarketRegistry()
+        query = session.query(User)
+        if not reassign:
+            query = query.filter(User.market_id.is_(None))
+        assigned = unknown = 0
+        for user in query.yield_per(1000):
+            if registry.assign(user) is None:
+                unknown += 1
+            else:
+                assigned += 1
+        session.commit()
+        click.echo(f"✅ Assigned {assigned} farmers to markets ({unknown} locations not in the gazetteer)")
+    except Exception as e:
+        session.rollback()
+        click.echo(f"❌ Error: {str(e)}")
+    finally:
+        session.close()
+
+@cli.command('verify-ledger')
+@click.option('--snapshot', is_flag=True, help='Take balance snapshots after verifying')
+@click.option('--batch-size', type=int, default=None, help='Entries fetched per round trip')
+def verify_ledger(snapshot, batch_size):
+    """Re-derive every wallet balance from the ledger and report differences"""
+    from src.payments.ledger import snapshot_balances, verify_ledger as run_verification
+    from src.payments.money import format_amount
+
+    session = Session()
+    try:
+        report = run_verification(session, batch_size)
+        click.echo("\n📒 Ledger Verification")
+        click.echo("=" * 80)
+        click.echo(f"Entries:             {report['entries']}")
+        click.echo(f"Wallets:             {report['wallets']}")
+        click.echo(f"Unbalanced journals: {report['unbalanced_count']}")
+        click.echo(f"Mismatched wallets:  {report['mismatched_count']}")
+        for account, total in report['accounts'].items():
+            click.echo(f"  {account:<32} {format_amount(total):>16}")
+        if report['mismatched']:
+            click.echo("-" * 80)
+            click.echo(f"{'Wallet':>8} {'Balance':>16} {'Ledger':>16} {'Snapshot':>16}")
+            for row in report['mismatched']:
+                click.echo(
+                    f"{row['wallet_id']:>8} {format_amount(row['balance']):>16} "
+                    f"{format_amount(row['ledger']):>16} {format_amount(row['snapshot']):>16}"
+                )
+        for journal_id in report['unbalanced_journals']:
+            click.echo(f"  unbalanced journal {journal_id}")
+        for wallet_id in report['orphan_wallet_ids']:
+            click.echo(f"  entries for missing wallet {wallet_id}")
+        click.echo("=" * 80)
+        click.echo("✅ Ledger balances" if report['ok'] else "❌ Ledger does not balance")
+
+        if snapshot:
+            changed = snapshot_balances(session)
+            session.commit()
+            click.echo(f"✅ Snapshotted {changed} wallets")
+    except Exception as e:
+        session.rollback()
+        click.echo(f"❌ Error: {str(e)}")
+    finally:
+        session.close()
+
+@cli.command()
+@click.option('--url', 'urls', multiple=True, help='Database URL to benchmark (repeatable; default: scratch SQLite with and without tuning)')
+@click.option('--workers', type=int, default=4, help='Concurrent worker processes')
+@click.option('--operations', type=int, default=1000, help='Transactions per worker')
+@click.option('--read-ratio', type=float, default=0.8, help='Fraction of transactions that only read')
+def benchdb(urls, workers, operations, read_ratio):
+    """Compare concurrent transaction throughput across database configurations"""
+    import tempfile
+    from sqlalchemy.engine import make_url
+    from src.database.bench import default_targets, run_benchmark
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            click.echo(f"\n🗄️  Database benchmark: {workers} workers x {operations} transactions, {read_ratio:.0%} reads")
+            click.echo("=" * 80)
+            click.echo(f"{'Database':<44} {'Tx/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'Locked':>7}")
+            click.echo("-" * 80)
+            for url, tuned in default_targets(directory, list(urls)):
+                result = run_benchmark(url, tuned, workers, operations, read_ratio=read_ratio)
+                if url.startswith('sqlite'):
+                    name = f"sqlite {'WAL + pragmas' if tuned else 'driver defaults'}"
+                else:
+                    name = make_url(url).render_as_string(hide_password=True)
+                p50 = f"{result['p50_ms']:.2f}" if result['p50_ms'] is not None else '-'
+                p99 = f"{result['p99_ms']:.2f}" if result['p99_ms'] is not None else '-'
+                click.echo(f"{name:<44} {result['throughput']:>9.0f} {p50:>8} {p99:>8} {result['locked']:>7}")
+            click.echo("=" * 80)
+    except Exception as e:
+        click.echo(f"❌ Error: {str(e)}")
+
+@cli.command()
+@click.option('--once', 'run_once', default=None, help='Run a single job now and exit')
+def worker(run_once):
+    """Run the periodic job scheduler without the API"""
+    import asyncio
+    from src.jobs.tasks import build_scheduler
+    
+    scheduler = build_scheduler()
+    if run_once:
+        if run_once not in scheduler.jobs:
+            click.echo(f"❌ Unknown job: {run_once}. Jobs: {', '.join(scheduler.jobs)}")
+            return
+        ran = asyncio.run(scheduler.run_once(run_once))
+        click.echo(f"✅ Ran {run_once}" if ran else f"ℹ️ {run_once} is locked or not due")
+        return
+        
+    click.echo(f"Starting worker with jobs: {', '.join(scheduler.jobs)}")
+    try:
+        asyncio.run(scheduler.run_forever())
+    except KeyboardInterrupt:
+        click.echo("Worker stopped")
+
 if __name__ == '__main__':
     cli() 
\ No newline at end of file
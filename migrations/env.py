@@ -0,0 +1,65 @@
+from logging.config import fileConfig
+
+from alembic import context
+
+from config.config import Config as AppConfig
+from src.database.db import DEFAULT_DATABASE_URL, create_db_engine
+from src.database.models import Base
+
+config = context.config
+if config.config_file_name is not None and config.attributes.get('configure_logger', True):
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = Base.metadata
+
+
+def database_url() -> str:
+    """URL given by the caller (manage.py migrate), else the application's"""
+    return config.get_main_option('sqlalchemy.url') or AppConfig.DATABASE_URL or DEFAULT_DATABASE_URL
+
+
+def run_migrations_offline():
+    """Emit the migration SQL without connecting"""
+    url = database_url()
+    context.configure(
+        url=url,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        render_as_batch=url.startswith('sqlite'),
+        compare_type=True
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    """Apply migrations over a connection configured like the application's"""
+    connectable = config.attributes.get('connection')
+    if connectable is not None:
+        _run(connectable)
+        return
+
+    engine = create_db_engine(database_url())
+    try:
+        with engine.connect() as connection:
+            _run(connection)
+    finally:
+        engine.dispose()
+
+
+def _run(connection):
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        # SQLite cannot ALTER most things in place; batch mode copies the table
+        render_as_batch=connection.dialect.name == 'sqlite',
+        compare_type=True
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
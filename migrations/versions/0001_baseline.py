@@ -0,0 +1,74 @@
+"""Baseline: the five tables the original Base.metadata.create_all created
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'crops',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('current_price', sa.Float(), nullable=False),
+        sa.Column('last_updated', sa.DateTime(), nullable=False)
+    )
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('phone_number', sa.String(), nullable=False, unique=True),
+        sa.Column('stellar_public_key', sa.String(), nullable=False, unique=True),
+        sa.Column('stellar_private_key', sa.String(), nullable=False, unique=True),
+        sa.Column('role', sa.Enum('FARMER', 'ADMIN', name='userrole')),
+        sa.Column('language_preference', sa.String()),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('gender', sa.String(), nullable=False),
+        sa.Column('location', sa.String(), nullable=False),
+        sa.Column('farm_size', sa.Float()),
+        sa.Column('primary_crop', sa.Integer(), sa.ForeignKey('crops.id'))
+    )
+    op.create_table(
+        'futures',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id')),
+        sa.Column('crop_id', sa.Integer(), sa.ForeignKey('crops.id')),
+        sa.Column('quantity', sa.Float(), nullable=False),
+        sa.Column('strike_price', sa.Float(), nullable=False),
+        sa.Column('premium', sa.Float(), nullable=False),
+        sa.Column('expiration_date', sa.DateTime(), nullable=False),
+        sa.Column('contract_address', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False)
+    )
+    op.create_table(
+        'wallets',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), unique=True),
+        sa.Column('balance', sa.Float()),
+        sa.Column('rapyd_wallet_id', sa.String(), nullable=False, unique=True)
+    )
+    op.create_table(
+        'transactions',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('wallet_id', sa.Integer(), sa.ForeignKey('wallets.id')),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('transaction_type', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('rapyd_transaction_id', sa.String(), unique=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False)
+    )
+
+
+def downgrade():
+    for table in ('transactions', 'wallets', 'futures', 'users', 'crops'):
+        op.drop_table(table)
+    sa.Enum(name='userrole').drop(op.get_bind(), checkfirst=True)
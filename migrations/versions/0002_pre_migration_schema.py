@@ -0,0 +1,132 @@
+"""Tables and columns added before the schema was migrated
+
+Exposure buckets, the notification outbox, job locks, crop volatility,
+markets and their prices, price sources, farmer and contract markets, and
+wallet currencies. A database created with create_all while these were
+being added already has some of them, so each table, column and index is
+only created if it is missing. Existing wallets are given KES, the
+currency every wallet held before currencies were recorded.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+# table -> columns added to it
+NEW_COLUMNS = {
+    'crops': [lambda: sa.Column('price_sources', sa.String())],
+    'users': [
+        lambda: sa.Column('latitude', sa.Float()),
+        lambda: sa.Column('longitude', sa.Float()),
+        lambda: sa.Column('market_id', sa.Integer(), sa.ForeignKey('markets.id', name='fk_users_market_id_markets'))
+    ],
+    'futures': [
+        lambda: sa.Column('market_id', sa.Integer(), sa.ForeignKey('markets.id', name='fk_futures_market_id_markets'))
+    ],
+    'wallets': [lambda: sa.Column('currency', sa.String(3), nullable=False, server_default='KES')]
+}
+
+
+def new_tables():
+    """(name, create_table arguments) in dependency order"""
+    return [
+        ('markets', [
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('name', sa.String(), nullable=False, unique=True),
+            sa.Column('latitude', sa.Float(), nullable=False),
+            sa.Column('longitude', sa.Float(), nullable=False)
+        ]),
+        ('market_prices', [
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('market_id', sa.Integer(), sa.ForeignKey('markets.id'), nullable=False),
+            sa.Column('crop_id', sa.Integer(), sa.ForeignKey('crops.id'), nullable=False),
+            sa.Column('price', sa.Float(), nullable=False),
+            sa.Column('last_updated', sa.DateTime(), nullable=False),
+            sa.Column('source', sa.String()),
+            sa.UniqueConstraint('market_id', 'crop_id')
+        ]),
+        ('notifications', [
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+            sa.Column('event_type', sa.String(), nullable=False),
+            sa.Column('payload', sa.Text(), nullable=False),
+            sa.Column('status', sa.String(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('sent_at', sa.DateTime())
+        ]),
+        ('job_locks', [
+            sa.Column('name', sa.String(), primary_key=True),
+            sa.Column('owner', sa.String()),
+            sa.Column('locked_until', sa.DateTime()),
+            sa.Column('next_run_at', sa.DateTime()),
+            sa.Column('last_started_at', sa.DateTime()),
+            sa.Column('last_finished_at', sa.DateTime()),
+            sa.Column('last_duration', sa.Float()),
+            sa.Column('last_status', sa.String()),
+            sa.Column('last_error', sa.Text()),
+            sa.Column('run_count', sa.Integer(), nullable=False)
+        ]),
+        ('crop_volatility', [
+            sa.Column('crop', sa.String(), primary_key=True),
+            sa.Column('observations', sa.Integer(), nullable=False),
+            sa.Column('ewma_volatility', sa.Float()),
+            sa.Column('state', sa.Text()),
+            sa.Column('updated_at', sa.DateTime())
+        ]),
+        ('exposure_buckets', [
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('crop_id', sa.Integer(), sa.ForeignKey('crops.id'), nullable=False),
+            sa.Column('strike_bucket', sa.Integer(), nullable=False),
+            sa.Column('expiry_week', sa.Date(), nullable=False),
+            sa.Column('open_contracts', sa.Integer(), nullable=False),
+            sa.Column('open_quantity', sa.Float(), nullable=False),
+            sa.Column('premium_collected', sa.Float(), nullable=False),
+            sa.Column('strike_exposure', sa.Float(), nullable=False),
+            sa.UniqueConstraint('crop_id', 'strike_bucket', 'expiry_week')
+        ])
+    ]
+
+
+INDEXES = [
+    ('ix_futures_status_expiration_date', 'futures', ['status', 'expiration_date']),
+    ('ix_notifications_status_id', 'notifications', ['status', 'id'])
+]
+
+
+def upgrade():
+    # Offline (--sql) there is nothing to inspect; assume the baseline schema
+    inspector = None if op.get_context().as_sql else sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names()) if inspector else set()
+
+    for name, columns in new_tables():
+        if name not in tables:
+            op.create_table(name, *columns)
+
+    for table, columns in NEW_COLUMNS.items():
+        existing = {column['name'] for column in inspector.get_columns(table)} if inspector else set()
+        missing = [column() for column in columns if column().name not in existing]
+        if missing:
+            with op.batch_alter_table(table) as batch:
+                for column in missing:
+                    batch.add_column(column)
+
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, _ in INDEXES:
+        op.drop_index(name, table_name=table, if_exists=True)
+    for table, columns in NEW_COLUMNS.items():
+        with op.batch_alter_table(table) as batch:
+            for column in reversed(columns):
+                batch.drop_column(column().name)
+    for name, _ in reversed(new_tables()):
+        op.drop_table(name)
@@ -0,0 +1,48 @@
+"""Indexes for the hot lookups
+
+- futures (user_id, status): a farmer's active contracts (GET /users/{phone}/futures,
+  SMS exercise, manage.py list-futures --phone); status and expiration_date lookups
+  are already served by ix_futures_status_expiration_date
+- crops (name): every SMS price check and buy resolves the crop by name
+- transactions (wallet_id): a wallet's payments and payouts
+
+On PostgreSQL the indexes are built CONCURRENTLY outside a transaction so
+writes to the tables continue while they build; SQLite builds them in place.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from contextlib import nullcontext
+
+from alembic import op
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_futures_user_id_status', 'futures', ['user_id', 'status']),
+    ('ix_crops_name', 'crops', ['name']),
+    ('ix_transactions_wallet_id', 'transactions', ['wallet_id'])
+]
+
+
+def _online():
+    """CREATE INDEX CONCURRENTLY cannot run inside a transaction block"""
+    if op.get_bind().dialect.name == 'postgresql':
+        return op.get_context().autocommit_block()
+    return nullcontext()
+
+
+def upgrade():
+    with _online():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade():
+    with _online():
+        for name, table, _ in INDEXES:
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
@@ -0,0 +1,56 @@
+"""Hold money as integer minor units
+
+Wallet balances, transaction amounts, premiums and collected premiums move
+from floating point to integer hundredths of their currency, so balance
+checks and decrements can be exact conditional UPDATEs. Existing values
+are multiplied by 100 and rounded; null balances become 0.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+MINOR_UNITS = 100
+
+# (table, column, nullable before, nullable after)
+MONEY_COLUMNS = [
+    ('wallets', 'balance', True, False),
+    ('transactions', 'amount', False, False),
+    ('futures', 'premium', False, False),
+    ('exposure_buckets', 'premium_collected', False, False)
+]
+
+
+def upgrade():
+    op.execute("UPDATE wallets SET balance = 0 WHERE balance IS NULL")
+    for table, column, nullable, new_nullable in MONEY_COLUMNS:
+        op.execute(f"UPDATE {table} SET {column} = ROUND({column} * {MINOR_UNITS})")
+        with op.batch_alter_table(table) as batch:
+            batch.alter_column(
+                column,
+                existing_type=sa.Float(),
+                type_=sa.Integer(),
+                existing_nullable=nullable,
+                nullable=new_nullable,
+                postgresql_using=f"{column}::integer"
+            )
+
+
+def downgrade():
+    for table, column, nullable, new_nullable in MONEY_COLUMNS:
+        with op.batch_alter_table(table) as batch:
+            batch.alter_column(
+                column,
+                existing_type=sa.Integer(),
+                type_=sa.Float(),
+                existing_nullable=new_nullable,
+                nullable=nullable
+            )
+        op.execute(f"UPDATE {table} SET {column} = {column} / {MINOR_UNITS}.0")
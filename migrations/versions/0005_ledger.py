@@ -0,0 +1,58 @@
+"""Double-entry ledger and balance snapshots
+
+Every wallet with a balance gets an 'opening' journal for it, so the
+ledger accounts for balances that predate it.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ledger_entries',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('journal_id', sa.String(32), nullable=False),
+        sa.Column('account', sa.String(), nullable=False),
+        sa.Column('wallet_id', sa.Integer(), sa.ForeignKey('wallets.id')),
+        sa.Column('amount', sa.Integer(), nullable=False),
+        sa.Column('currency', sa.String(3), nullable=False),
+        sa.Column('entry_type', sa.String(), nullable=False),
+        sa.Column('future_id', sa.Integer(), sa.ForeignKey('futures.id')),
+        sa.Column('created_at', sa.DateTime(), nullable=False)
+    )
+    op.create_index('ix_ledger_entries_wallet_id_id', 'ledger_entries', ['wallet_id', 'id'])
+    op.create_table(
+        'balance_snapshots',
+        sa.Column('wallet_id', sa.Integer(), sa.ForeignKey('wallets.id'), primary_key=True),
+        sa.Column('balance', sa.Integer(), nullable=False),
+        sa.Column('last_entry_id', sa.Integer(), nullable=False),
+        sa.Column('taken_at', sa.DateTime(), nullable=False)
+    )
+
+    # Local time, like every other timestamp the application writes
+    opened_at = datetime.now()
+    for account, wallet_id, sign in (('wallet', 'id', ''), ('opening_balance', 'NULL', '-')):
+        op.execute(
+            sa.text(
+                "INSERT INTO ledger_entries (journal_id, account, wallet_id, amount, currency, entry_type, created_at) "
+                f"SELECT 'opening' || id, '{account}', {wallet_id}, {sign}balance, currency, 'opening', :opened_at "
+                "FROM wallets WHERE balance <> 0 ORDER BY id"
+            ).bindparams(opened_at=opened_at)
+        )
+
+
+def downgrade():
+    op.drop_table('balance_snapshots')
+    op.drop_index('ix_ledger_entries_wallet_id_id', table_name='ledger_entries')
+    op.drop_table('ledger_entries')
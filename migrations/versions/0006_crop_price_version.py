@@ -0,0 +1,23 @@
+"""Crop price version for the in-process crop catalog
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('crops') as batch:
+        batch.add_column(sa.Column('price_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('crops') as batch:
+        batch.drop_column('price_version')
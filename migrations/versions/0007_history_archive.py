@@ -0,0 +1,68 @@
+"""Archive tables for closed futures and old transactions
+
+Ledger entries keep the id of an archived contract, so their foreign key
+to futures is dropped.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+# Name SQLite's unnamed foreign keys so batch mode can drop or recreate them
+LEDGER_FUTURE_FK = 'fk_ledger_entries_future_id_futures'
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+def ledger_future_fk_name():
+    # PostgreSQL named the constraint when 0005 created it without a name
+    return 'ledger_entries_future_id_fkey' if op.get_context().dialect.name == 'postgresql' else LEDGER_FUTURE_FK
+
+
+def upgrade():
+    op.create_table(
+        'futures_archive',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id')),
+        sa.Column('crop_id', sa.Integer(), sa.ForeignKey('crops.id')),
+        sa.Column('quantity', sa.Float(), nullable=False),
+        sa.Column('strike_price', sa.Float(), nullable=False),
+        sa.Column('premium', sa.Integer(), nullable=False),
+        sa.Column('expiration_date', sa.DateTime(), nullable=False),
+        sa.Column('contract_address', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('market_id', sa.Integer(), sa.ForeignKey('markets.id')),
+        sa.Column('archived_at', sa.DateTime(), nullable=False)
+    )
+    op.create_index('ix_futures_archive_user_id', 'futures_archive', ['user_id'])
+    op.create_table(
+        'transactions_archive',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('wallet_id', sa.Integer(), sa.ForeignKey('wallets.id')),
+        sa.Column('amount', sa.Integer(), nullable=False),
+        sa.Column('transaction_type', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('rapyd_transaction_id', sa.String()),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False)
+    )
+    op.create_index('ix_transactions_archive_wallet_id', 'transactions_archive', ['wallet_id'])
+
+    with op.batch_alter_table('ledger_entries', naming_convention=NAMING_CONVENTION) as batch:
+        batch.drop_constraint(ledger_future_fk_name(), type_='foreignkey')
+
+
+def downgrade():
+    with op.batch_alter_table('ledger_entries', naming_convention=NAMING_CONVENTION) as batch:
+        batch.create_foreign_key(ledger_future_fk_name(), 'futures', ['future_id'], ['id'])
+    op.drop_index('ix_transactions_archive_wallet_id', table_name='transactions_archive')
+    op.drop_table('transactions_archive')
+    op.drop_index('ix_futures_archive_user_id', table_name='futures_archive')
+    op.drop_table('futures_archive')
@@ -0,0 +1,43 @@
+"""Index ledger entries by journal
+
+A premium is journaled before its contract exists; both legs are then
+looked up by journal_id to attach the contract's id.
+
+On PostgreSQL the index is built CONCURRENTLY outside a transaction so
+ledger writes continue while it builds; SQLite builds it in place.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19
+"""
+from contextlib import nullcontext
+
+from alembic import op
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def _online():
+    """CREATE INDEX CONCURRENTLY cannot run inside a transaction block"""
+    if op.get_bind().dialect.name == 'postgresql':
+        return op.get_context().autocommit_block()
+    return nullcontext()
+
+
+def upgrade():
+    with _online():
+        op.create_index(
+            'ix_ledger_entries_journal_id', 'ledger_entries', ['journal_id'],
+            if_not_exists=True, postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    with _online():
+        op.drop_index(
+            'ix_ledger_entries_journal_id', table_name='ledger_entries',
+            if_exists=True, postgresql_concurrently=True
+        )
@@ -7,8 +7,11 @@ setup(
     install_requires=[
         "fastapi>=0.68.0",
         "uvicorn>=0.15.0",
-        "sqlalchemy>=1.4.23",
+        "sqlalchemy>=2.0.0",
         "psycopg2-binary>=2.9.1",
+        "aiosqlite>=0.17.0",
+        "asyncpg>=0.27.0",
+        "greenlet>=1.0.0",
         "python-dotenv>=0.19.0",
         "stellar-sdk>=8.1.0",
         "twilio>=7.11.0",
@@ -18,6 +21,7 @@ setup(
         "aiohttp>=3.8.0",
         "pytest>=6.2.5",
         "alembic>=1.7.1",
+        "numpy>=1.21.0",
     ],
     author="Your Name",
     author_email="your.email@example.com",
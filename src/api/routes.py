@@ -1,14 +1,34 @@
-from fastapi import FastAPI, HTTPException, Depends, Form, Request
+from fastapi import FastAPI, HTTPException, Depends, Form, Query, Request, Response, Header
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from datetime import datetime
-from typing import List
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from datetime import datetime, date
+from typing import List, Optional
+from contextlib import asynccontextmanager
+import hmac
+import json
 import logging
 
-from src.database.db import get_session
-from src.database.models import User, Crop, Future, Transaction
+from config.config import Config
+from src.database.async_db import dispose_async_engine, get_async_session
+from src.database.catalog import get_crop_catalog
+from src.database.db import session_factory
+from src.database.exposure import query_exposure
+from src.database.listings import futures_page
+from src.jobs.tasks import build_scheduler
+from src.oracle.refresher import price_age_seconds
+from src.oracle.ticks import INTERVALS, get_tick_store
+from src.oracle.volatility import get_volatility_tracker
+from src.database.models import User, Crop, Transaction, Market, MarketPrice
+from src.fx import get_fx_rates
+from src.markets import get_market_registry
 from src.blockchain.stellar import StellarBlockchain
 from src.payments.rapyd import RapydClient
+from src.payments import ledger
+from src.payments.money import from_minor, to_minor
 from src.sms.handler import SMSHandler
 from src.sms.messaging import SMSMessenger
 
@@ -16,7 +36,26 @@ from src.sms.messaging import SMSMessenger
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="AgriFutures API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load the crop catalog and run the periodic job scheduler alongside the API"""
+    try:
+        await run_in_threadpool(get_crop_catalog().reload)
+    except Exception as e:
+        # Lookups load it on first use instead
+        logger.warning(f"Could not load crop catalog at startup: {str(e)}")
+    scheduler = build_scheduler() if Config.SCHEDULER_ENABLED else None
+    app.state.scheduler = scheduler
+    if scheduler:
+        await scheduler.start()
+    try:
+        yield
+    finally:
+        if scheduler:
+            await scheduler.stop()
+        await dispose_async_engine()
+
+app = FastAPI(title="AgriFutures API", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -28,13 +67,13 @@ app.add_middleware(
 )
 
 # Dependencies
-def get_db():
-    """Dependency for database session"""
-    db = get_session()
+async def get_db():
+    """Dependency for an async database session, one per request"""
+    db = get_async_session()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
 
 def get_stellar():
     return StellarBlockchain()
@@ -45,12 +84,29 @@ def get_rapyd():
 def get_sms():
     return SMSMessenger()
 
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Dependency guarding admin endpoints with the ADMIN_API_TOKEN header"""
+    if not Config.ADMIN_API_TOKEN or not x_admin_token or not hmac.compare_digest(
+        x_admin_token, Config.ADMIN_API_TOKEN
+    ):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+def process_sms(from_number: str, message: str) -> str:
+    """
+    Run the SMS handler with its own session
+
+    The handler calls Stellar, Rapyd and the price oracle synchronously,
+    so it runs on a worker thread rather than the event loop.
+    """
+    session = session_factory()
+    try:
+        return SMSHandler(session).process_message(from_number=from_number, message=message)
+    finally:
+        session.close()
+
 # Routes
 @app.post("/webhook/sms")
-async def handle_sms(
-    request: Request,
-    db: Session = Depends(get_db)
-):
+async def handle_sms(request: Request):
     """Handle incoming SMS messages from Twilio"""
     try:
         # Get form data from request
@@ -60,16 +116,16 @@ async def handle_sms(
         logger.info(f"Received SMS - From: {form_data.get('From')} Body: {form_data.get('Body')}")
         
         # Process message
-        handler = SMSHandler(db)
-        response = handler.process_message(
-            from_number=form_data.get('From', ''),
-            message=form_data.get('Body', '')
+        response = await run_in_threadpool(
+            process_sms,
+            form_data.get('From', ''),
+            form_data.get('Body', '')
         )
         
         # Send response
         if response:
             sms = get_sms()
-            success = sms.send_sms(form_data.get('From'), response)
+            success = await run_in_threadpool(sms.send_sms, form_data.get('From'), response)
             if not success:
                 logger.error("Failed to send SMS response")
         
@@ -80,37 +136,195 @@ async def handle_sms(
         return {"status": "error", "message": str(e)}
 
 @app.get("/crops")
-async def get_crops(db: Session = Depends(get_db)) -> List[dict]:
+async def get_crops(db: AsyncSession = Depends(get_db)) -> List[dict]:
     """Get list of available crops and current prices"""
-    crops = db.query(Crop).all()
+    crops = (await db.execute(select(Crop).order_by(Crop.id))).scalars().all()
     return [
         {
             "id": crop.id,
             "name": crop.name,
             "current_price": crop.current_price,
-            "last_updated": crop.last_updated
+            "last_updated": crop.last_updated,
+            "price_age_seconds": price_age_seconds(crop.last_updated),
+            "price_sources": crop.price_sources.split(',') if crop.price_sources else []
         }
         for crop in crops
     ]
 
+@app.get("/crops/{crop_id}/history")
+async def get_crop_history(
+    crop_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    interval: str = 'hour',
+    db: AsyncSession = Depends(get_db)
+):
+    """Stream a crop's price history as newline-delimited JSON (raw ticks or OHLC bars)"""
+    crop = await db.get(Crop, crop_id)
+    if not crop:
+        raise HTTPException(status_code=404, detail="Crop not found")
+    if interval != 'raw' and interval not in INTERVALS:
+        raise HTTPException(status_code=400, detail=f"interval must be raw or one of {', '.join(INTERVALS)}")
+        
+    end_ts = (end or datetime.now()).timestamp()
+    start_ts = start.timestamp() if start else end_ts - 7 * 86400
+    store = get_tick_store()
+    
+    def rows():
+        if interval == 'raw':
+            for ticks in store.iter_range(crop.name, start_ts, end_ts):
+                for ts, price in ticks.tolist():
+                    yield json.dumps({"ts": datetime.fromtimestamp(ts).isoformat(), "price": price}) + "\n"
+        else:
+            for bars in store.iter_ohlc(crop.name, start_ts, end_ts, interval):
+                for ts, open_, high, low, close, count in bars.tolist():
+                    yield json.dumps({
+                        "ts": datetime.fromtimestamp(ts).isoformat(),
+                        "open": open_,
+                        "high": high,
+                        "low": low,
+                        "close": close,
+                        "count": count
+                    }) + "\n"
+                    
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+@app.get("/crops/{crop_id}/volatility")
+async def get_crop_volatility(crop_id: int, db: AsyncSession = Depends(get_db)) -> dict:
+    """Online volatility estimates for a crop and the volatility premiums are priced with"""
+    crop = await db.get(Crop, crop_id)
+    if not crop:
+        raise HTTPException(status_code=404, detail="Crop not found")
+        
+    tracker = get_volatility_tracker()
+    # The tracker reloads its cache from the database synchronously
+    estimate = await run_in_threadpool(tracker.estimate, crop.name)
+    estimate = estimate or {'observations': 0, 'ewma': None, 'realized': {}, 'as_of': None}
+    return {
+        "crop": crop.name,
+        "observations": estimate['observations'],
+        "ewma_volatility": estimate['ewma'],
+        "realized_volatility": estimate['realized'],
+        "as_of": estimate['as_of'],
+        "pricing_volatility": tracker.volatilities([crop.name])[crop.name]
+    }
+
+@app.get("/markets")
+async def get_markets(db: AsyncSession = Depends(get_db)) -> List[dict]:
+    """List markets with their latest price per crop"""
+    prices = {}
+    for market_id, crop_name, price, last_updated in await db.execute(
+        select(MarketPrice.market_id, Crop.name, MarketPrice.price, MarketPrice.last_updated)
+        .join(Crop, Crop.id == MarketPrice.crop_id)
+    ):
+        prices.setdefault(market_id, {})[crop_name] = {
+            "price": price,
+            "last_updated": last_updated,
+            "price_age_seconds": price_age_seconds(last_updated)
+        }
+    return [
+        {
+            "id": market.id,
+            "name": market.name,
+            "latitude": market.latitude,
+            "longitude": market.longitude,
+            "prices": prices.get(market.id, {})
+        }
+        for market in (await db.execute(select(Market).order_by(Market.id))).scalars()
+    ]
+
+@app.get("/markets/nearest")
+async def get_nearest_market(
+    location: Optional[str] = None,
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None
+) -> dict:
+    """Nearest market to a place name or to coordinates"""
+    # The registry reloads its index from the database synchronously when stale
+    registry = get_market_registry()
+    if location:
+        coords, market = await run_in_threadpool(registry.locate, location)
+        if coords is None:
+            raise HTTPException(status_code=404, detail="Location not found")
+    elif latitude is not None and longitude is not None:
+        market = await run_in_threadpool(registry.nearest, latitude, longitude)
+    else:
+        raise HTTPException(status_code=400, detail="Provide a location or latitude and longitude")
+    if market is None:
+        raise HTTPException(status_code=404, detail="No markets registered")
+    return {
+        "id": market.id,
+        "name": market.name,
+        "latitude": market.latitude,
+        "longitude": market.longitude,
+        "distance_km": round(market.distance_km, 1)
+    }
+
 @app.get("/users/{phone_number}/futures")
 async def get_user_futures(
     phone_number: str,
-    db: Session = Depends(get_db)
+    response: Response,
+    after_id: Optional[int] = None,
+    limit: int = Query(Config.API_PAGE_LIMIT, ge=1, le=Config.API_MAX_PAGE_LIMIT),
+    db: AsyncSession = Depends(get_db)
 ) -> List[dict]:
-    """Get user's active futures contracts"""
-    user = db.query(User).filter_by(phone_number=phone_number).first()
+    """
+    Get user's active futures contracts, one page at a time
+
+    Pass the X-Next-After-Id header of a full page as after_id to get the next one.
+    """
+    user = (await db.execute(select(User).filter_by(phone_number=phone_number))).scalar_one_or_none()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
         
-    futures = db.query(Future).filter_by(user_id=user.id, status='active').all()
+    futures = (await db.execute(
+        futures_page(user_id=user.id, status='active', after_id=after_id, limit=limit)
+    )).scalars().all()
+    if len(futures) == limit:
+        response.headers["X-Next-After-Id"] = str(futures[-1].id)
+    return [
+        {
+            "id": future.id,
+            "crop": future.crop.name,
+            "quantity": future.quantity,
+            "strike_price": future.strike_price,
+            "premium": from_minor(future.premium),
+            "expiration_date": future.expiration_date
+        }
+        for future in futures
+    ]
+
+@app.get("/users/{phone_number}/futures/history")
+async def get_user_future_history(
+    phone_number: str,
+    response: Response,
+    status: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: int = Query(Config.API_PAGE_LIMIT, ge=1, le=Config.API_MAX_PAGE_LIMIT),
+    db: AsyncSession = Depends(get_db)
+) -> List[dict]:
+    """
+    Get all of a user's futures contracts, archived ones included, one page at a time
+
+    Pages work like /users/{phone_number}/futures.
+    """
+    user = (await db.execute(select(User).filter_by(phone_number=phone_number))).scalar_one_or_none()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    futures = (await db.execute(
+        futures_page(user_id=user.id, status=status, after_id=after_id, limit=limit, include_archived=True)
+    )).scalars().all()
+    if len(futures) == limit:
+        response.headers["X-Next-After-Id"] = str(futures[-1].id)
     return [
         {
             "id": future.id,
             "crop": future.crop.name,
             "quantity": future.quantity,
             "strike_price": future.strike_price,
-            "premium": future.premium,
+            "premium": from_minor(future.premium),
+            "status": future.status,
             "expiration_date": future.expiration_date
         }
         for future in futures
@@ -121,27 +335,33 @@ async def deposit_funds(
     phone_number: str,
     amount: float,
     currency: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Process deposit to user's wallet"""
-    user = db.query(User).filter_by(phone_number=phone_number).first()
+    user = (await db.execute(
+        select(User).filter_by(phone_number=phone_number).options(selectinload(User.wallet))
+    )).scalar_one_or_none()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
         
     rapyd = get_rapyd()
-    transaction_id = rapyd.deposit_funds(user.wallet.rapyd_wallet_id, amount, currency)
+    transaction_id = await run_in_threadpool(rapyd.deposit_funds, user.wallet.rapyd_wallet_id, amount, currency)
     
     if transaction_id:
+        # Credited in the wallet's currency whatever the farmer paid in
+        wallet = user.wallet
+        credited = to_minor(get_fx_rates().table.convert(amount, wallet.currency, from_currency=currency))
+        await db.run_sync(ledger.credit, wallet.id, credited, wallet.currency, 'deposit')
         transaction = Transaction(
-            wallet_id=user.wallet.id,
-            amount=amount,
+            wallet_id=wallet.id,
+            amount=credited,
             transaction_type='deposit',
             status='completed',
             rapyd_transaction_id=transaction_id,
             created_at=datetime.now()
         )
         db.add(transaction)
-        db.commit()
+        await db.commit()
         return {"status": "success", "transaction_id": transaction_id}
     
     raise HTTPException(status_code=400, detail="Deposit failed")
@@ -149,8 +369,33 @@ async def deposit_funds(
 @app.post("/webhook/rapyd")
 async def handle_rapyd_webhook(
     data: dict,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Handle Rapyd payment webhooks"""
     # Implement webhook handling for payment status updates
-    pass
\ No newline at end of file
+    pass
+
+@app.get("/admin/exposure", dependencies=[Depends(require_admin)])
+async def get_exposure(
+    crop: Optional[str] = None,
+    strike_below: Optional[float] = None,
+    expiry_from: Optional[date] = None,
+    expiry_to: Optional[date] = None,
+    db: AsyncSession = Depends(get_db)
+) -> List[dict]:
+    """Open protection per crop and expiry week, read from the running aggregates"""
+    return await db.run_sync(
+        query_exposure,
+        crop=crop,
+        strike_below=strike_below,
+        expiry_from=expiry_from,
+        expiry_to=expiry_to
+    )
+
+@app.get("/admin/jobs", dependencies=[Depends(require_admin)])
+async def get_jobs(request: Request) -> dict:
+    """Run counts and durations of this process's scheduled jobs"""
+    scheduler = getattr(request.app.state, 'scheduler', None)
+    if scheduler is None:
+        return {"enabled": False, "jobs": {}}
+    return {"enabled": True, "owner": scheduler.owner, "jobs": scheduler.metrics()}
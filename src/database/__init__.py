@@ -1,7 +1,7 @@
-from .models import User, Crop, Future, Wallet, Transaction, UserRole
+from .models import User, Crop, Future, Wallet, Transaction, UserRole, ExposureBucket, Notification, JobLock
 from .db import get_db_session, init_db
 
 __all__ = [
-    'User', 'Crop', 'Future', 'Wallet', 'Transaction', 'UserRole',
+    'User', 'Crop', 'Future', 'Wallet', 'Transaction', 'UserRole', 'ExposureBucket', 'Notification', 'JobLock',
     'get_db_session', 'init_db'
 ] 
\ No newline at end of file
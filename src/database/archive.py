@@ -0,0 +1,102 @@
+from datetime import datetime
+from typing import List, Type
+
+from sqlalchemy import func, insert, literal, select, union_all
+from sqlalchemy.orm import aliased
+
+from .models import Future, FutureArchive, Transaction, TransactionArchive
+
+# Statuses a future never leaves, and so may be archived in
+CLOSED_FUTURE_STATUSES = ('expired', 'exercised')
+
+# Transactions still waiting on Rapyd stay in the hot table
+SETTLED_TRANSACTION_STATUSES = ('completed', 'failed')
+
+
+def _move(session, model: Type, archive: Type, ids: List[int], now: datetime) -> int:
+    """Copy rows to their archive table and delete them, in the caller's transaction"""
+    if not ids:
+        return 0
+    columns = [column.name for column in model.__table__.columns]
+    session.execute(
+        insert(archive).from_select(
+            columns + ['archived_at'],
+            select(*[model.__table__.c[name] for name in columns], literal(now, archive.archived_at.type))
+            .where(model.id.in_(ids))
+        )
+    )
+    session.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+    return len(ids)
+
+
+def _newest_id(model: Type):
+    # SQLite hands out max(id) + 1 again once the newest row is deleted, so
+    # the newest row is never archived and archived ids are never reused
+    return select(func.max(model.id)).scalar_subquery()
+
+
+def archive_futures(session, closed_before: datetime, batch_size: int, now: datetime) -> int:
+    """
+    Move up to batch_size closed futures that expired before closed_before
+
+    Returns:
+        Number of futures moved
+    """
+    ids = session.execute(
+        select(Future.id)
+        .where(
+            Future.status.in_(CLOSED_FUTURE_STATUSES),
+            Future.expiration_date < closed_before,
+            Future.id < _newest_id(Future)
+        )
+        .order_by(Future.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    return _move(session, Future, FutureArchive, ids, now)
+
+
+def archive_transactions(session, created_before: datetime, batch_size: int, now: datetime) -> int:
+    """
+    Move up to batch_size settled transactions created before created_before
+
+    Returns:
+        Number of transactions moved
+    """
+    ids = session.execute(
+        select(Transaction.id)
+        .where(
+            Transaction.status.in_(SETTLED_TRANSACTION_STATUSES),
+            Transaction.created_at < created_before,
+            Transaction.id < _newest_id(Transaction)
+        )
+        .order_by(Transaction.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    return _move(session, Transaction, TransactionArchive, ids, now)
+
+
+def _history(model: Type, archive: Type, name: str):
+    columns = [column.name for column in model.__table__.columns]
+    union = union_all(
+        select(*[model.__table__.c[column] for column in columns]),
+        select(*[archive.__table__.c[column] for column in columns])
+    ).subquery(name)
+    return aliased(model, union, name=name)
+
+
+def future_history():
+    """
+    Future entity over the futures and futures_archive tables together
+
+    Queries against it return Future objects from both tables, with the same
+    relationships, for read-only history views; ids never collide. Active
+    contracts are never archived, so queries for them use Future directly.
+    """
+    return _history(Future, FutureArchive, 'future_history')
+
+
+def transaction_history():
+    """Transaction entity over the transactions and transactions_archive tables together"""
+    return _history(Transaction, TransactionArchive, 'transaction_history')
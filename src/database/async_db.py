@@ -0,0 +1,86 @@
+import logging
+import threading
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+from config.config import Config
+from .db import DEFAULT_DATABASE_URL, engine_options, set_sqlite_pragmas
+
+logger = logging.getLogger(__name__)
+
+# Async driver used for each synchronous dialect in DATABASE_URL
+ASYNC_DRIVERS = {
+    'sqlite': 'aiosqlite',
+    'postgresql': 'asyncpg'
+}
+
+
+def async_url(url: Optional[str] = None) -> URL:
+    """DATABASE_URL (or the given URL) with its driver swapped for the async one"""
+    url = make_url(url or Config.DATABASE_URL or DEFAULT_DATABASE_URL)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for {url.get_backend_name()}")
+    return url.set(drivername=f"{url.get_backend_name()}+{driver}")
+
+
+def create_async_db_engine(url: Optional[str] = None, pragmas: Optional[Dict[str, object]] = None, **options) -> AsyncEngine:
+    """
+    Create an async engine for the same database as create_db_engine
+
+    Pool sizes and SQLite pragmas match the synchronous engine, so the API
+    and the CLI or workers sharing the database behave the same.
+    """
+    url = async_url(url)
+    kwargs, pragmas = engine_options(url, pragmas, options)
+    engine = create_async_engine(url, **kwargs)
+    set_sqlite_pragmas(engine.sync_engine, pragmas)
+    return engine
+
+
+_engine: Optional[AsyncEngine] = None
+_session_factory: Optional[async_sessionmaker] = None
+_lock = threading.Lock()
+
+
+def get_async_session_factory() -> async_sessionmaker:
+    """Process-wide async session factory, created on first use"""
+    global _engine, _session_factory
+    if _session_factory is None:
+        with _lock:
+            if _session_factory is None:
+                _engine = create_async_db_engine()
+                # Objects stay readable after commit without another await
+                _session_factory = async_sessionmaker(_engine, expire_on_commit=False)
+    return _session_factory
+
+
+def get_async_session() -> AsyncSession:
+    """Get a new async database session (one per request or task, never shared)"""
+    return get_async_session_factory()()
+
+
+@asynccontextmanager
+async def get_async_db_session() -> AsyncIterator[AsyncSession]:
+    """Async context manager for database sessions, committing on success"""
+    session = get_async_session()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
+
+async def dispose_async_engine():
+    """Close pooled connections, e.g. when the API shuts down"""
+    global _engine, _session_factory
+    with _lock:
+        engine, _engine, _session_factory = _engine, None, None
+    if engine is not None:
+        await engine.dispose()
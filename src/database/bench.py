@@ -0,0 +1,143 @@
+import logging
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import Column, Float, Integer, MetaData, Table, create_engine, select, update
+from sqlalchemy.exc import OperationalError
+
+from config.config import Config
+from .db import create_db_engine
+
+logger = logging.getLogger(__name__)
+
+# Scratch table of its own, so the benchmark never touches real data
+metadata = MetaData()
+bench_wallets = Table(
+    'bench_wallets',
+    metadata,
+    Column('id', Integer, primary_key=True),
+    Column('balance', Float, nullable=False)
+)
+
+
+def _engine(url: str, tuned: bool):
+    # The untuned engine is what db.py used to create: driver defaults only
+    return create_db_engine(url) if tuned else create_engine(url)
+
+
+def _worker(url: str, tuned: bool, operations: int, rows: int, read_ratio: float, seed: int) -> Dict[str, object]:
+    """Run short read or balance-update transactions and time each one"""
+    engine = _engine(url, tuned)
+    rng = random.Random(seed)
+    latencies, locked, failed = [], 0, 0
+    try:
+        for _ in range(operations):
+            wallet_id = rng.randint(1, rows)
+            started = time.perf_counter()
+            try:
+                with engine.begin() as connection:
+                    if rng.random() < read_ratio:
+                        connection.execute(select(bench_wallets.c.balance).where(bench_wallets.c.id == wallet_id)).scalar()
+                    else:
+                        connection.execute(
+                            update(bench_wallets)
+                            .where(bench_wallets.c.id == wallet_id)
+                            .values(balance=bench_wallets.c.balance + 1.0)
+                        )
+                latencies.append(time.perf_counter() - started)
+            except OperationalError as e:
+                if 'locked' in str(e) or 'busy' in str(e):
+                    locked += 1
+                else:
+                    failed += 1
+    finally:
+        engine.dispose()
+    return {'latencies': latencies, 'locked': locked, 'failed': failed}
+
+
+def run_benchmark(
+    url: str,
+    tuned: bool = True,
+    workers: int = 4,
+    operations: int = 1000,
+    rows: int = 1000,
+    read_ratio: float = 0.8
+) -> Dict[str, object]:
+    """
+    Measure concurrent transaction throughput against one database
+
+    Each worker process opens its own engine, as uvicorn workers do, and
+    runs `operations` single-statement transactions: a balance read with
+    probability read_ratio, otherwise a balance increment. The scratch
+    table is created fresh and dropped afterwards.
+
+    Returns:
+        Throughput, latency percentiles in milliseconds and the number of
+        transactions that failed on a locked database
+    """
+    setup = _engine(url, tuned)
+    try:
+        metadata.drop_all(setup)
+        metadata.create_all(setup)
+        with setup.begin() as connection:
+            connection.execute(bench_wallets.insert(), [{'id': i, 'balance': 0.0} for i in range(1, rows + 1)])
+    finally:
+        setup.dispose()
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(
+            _worker,
+            [url] * workers,
+            [tuned] * workers,
+            [operations] * workers,
+            [rows] * workers,
+            [read_ratio] * workers,
+            range(workers)
+        ))
+    elapsed = time.perf_counter() - started
+
+    cleanup = _engine(url, tuned)
+    try:
+        metadata.drop_all(cleanup)
+    finally:
+        cleanup.dispose()
+
+    latencies = np.array([latency for result in results for latency in result['latencies']]) * 1000
+    completed = len(latencies)
+    logger.info(f"Benchmarked {completed} transactions on {url} in {elapsed:.2f}s")
+    return {
+        'url': url,
+        'tuned': tuned,
+        'workers': workers,
+        'completed': completed,
+        'locked': sum(result['locked'] for result in results),
+        'failed': sum(result['failed'] for result in results),
+        'elapsed_seconds': elapsed,
+        'throughput': completed / elapsed if elapsed else 0.0,
+        'p50_ms': float(np.percentile(latencies, 50)) if completed else None,
+        'p99_ms': float(np.percentile(latencies, 99)) if completed else None
+    }
+
+
+def default_targets(directory: str, urls: Optional[List[str]] = None) -> List[tuple]:
+    """
+    (url, tuned) pairs to compare
+
+    Without URLs: a scratch SQLite file with driver defaults, another with
+    the tuned pragmas (WAL persists in the file, so they cannot share one),
+    and DATABASE_URL if it points at a server database.
+    """
+    if urls:
+        return [(url, True) for url in urls]
+    targets = [
+        (f"sqlite:///{os.path.join(directory, 'bench_default.db')}", False),
+        (f"sqlite:///{os.path.join(directory, 'bench_tuned.db')}", True)
+    ]
+    if Config.DATABASE_URL and not Config.DATABASE_URL.startswith('sqlite'):
+        targets.append((Config.DATABASE_URL, True))
+    return targets
@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+
+from config.config import Config
+from .db import session_factory
+from .models import Crop
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogCrop:
+    """Read-only copy of a crop row; stands in for Crop wherever only its columns are read"""
+
+    __slots__ = ('id', 'name', 'current_price', 'last_updated', 'price_sources', 'price_version')
+
+    def __init__(
+        self,
+        id: int,
+        name: str,
+        current_price: float,
+        last_updated: Optional[datetime],
+        price_sources: Optional[str],
+        price_version: int
+    ):
+        self.id = id
+        self.name = name
+        self.current_price = current_price
+        self.last_updated = last_updated
+        self.price_sources = price_sources
+        self.price_version = price_version
+
+
+class CropCatalog:
+    """
+    Process-wide copy of the crops table for hot-path lookups
+
+    Every price write bumps the crop's price_version. At most every
+    CROP_CATALOG_CHECK_INTERVAL seconds a lookup compares one aggregate of
+    the versions with the database and reloads the table only when another
+    worker changed it; a process that wrote a price itself calls
+    invalidate() to see it on the next lookup. Between checks a lookup is a
+    dictionary access.
+    """
+
+    def __init__(self, session_factory: Callable = session_factory, check_interval: Optional[float] = None):
+        self.session_factory = session_factory
+        self.check_interval = check_interval if check_interval is not None else Config.CROP_CATALOG_CHECK_INTERVAL
+        self._lock = threading.Lock()
+        self._by_name: Dict[str, CatalogCrop] = {}
+        self._by_id: Dict[int, CatalogCrop] = {}
+        self._signature: Optional[Tuple] = None
+        self._checked_at: Optional[float] = None
+
+    def get(self, name: str) -> Optional[CatalogCrop]:
+        """Crop by name, or None if there is no such crop"""
+        self._check()
+        return self._by_name.get(name.lower())
+
+    def get_by_id(self, crop_id: int) -> Optional[CatalogCrop]:
+        """Crop by id, or None if there is no such crop"""
+        self._check()
+        return self._by_id.get(crop_id)
+
+    def crops(self) -> List[CatalogCrop]:
+        """All crops in id order"""
+        self._check()
+        return sorted(self._by_id.values(), key=lambda crop: crop.id)
+
+    def invalidate(self):
+        """Check the database on the next lookup, e.g. after writing a price"""
+        with self._lock:
+            self._checked_at = None
+
+    def reload(self):
+        """Load every crop from the database"""
+        session = self.session_factory()
+        try:
+            crops = [
+                CatalogCrop(*row) for row in session.query(
+                    Crop.id, Crop.name, Crop.current_price, Crop.last_updated, Crop.price_sources, Crop.price_version
+                )
+            ]
+        finally:
+            session.close()
+        signature = self._signature_of(crops)
+        with self._lock:
+            self._by_name = {crop.name.lower(): crop for crop in crops}
+            self._by_id = {crop.id: crop for crop in crops}
+            self._signature = signature
+            self._checked_at = time.monotonic()
+        logger.info(f"Loaded {len(crops)} crops into the catalog")
+
+    def _check(self):
+        """Reload when the interval has passed and the crops table changed"""
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return
+            # Other threads keep using the current copy while this one checks
+            self._checked_at = now
+            known = self._signature
+
+        session = self.session_factory()
+        try:
+            signature = tuple(session.query(
+                func.count(Crop.id), func.coalesce(func.sum(Crop.price_version), 0), func.coalesce(func.max(Crop.id), 0)
+            ).one())
+        except Exception as e:
+            logger.error(f"Could not check crop catalog version: {str(e)}")
+            return
+        finally:
+            session.close()
+        if signature != known:
+            self.reload()
+
+    @staticmethod
+    def _signature_of(crops: List[CatalogCrop]) -> Tuple:
+        return (len(crops), sum(crop.price_version for crop in crops), max((crop.id for crop in crops), default=0))
+
+
+_catalog: Optional[CropCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_crop_catalog() -> CropCatalog:
+    """Process-wide crop catalog"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = CropCatalog()
+        return _catalog
@@ -1,14 +1,86 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, Engine, make_url
 from sqlalchemy.orm import sessionmaker, scoped_session
-from sqlalchemy.ext.declarative import declarative_base
-import os
+from sqlalchemy.pool import StaticPool
+from typing import Dict, Optional, Tuple
+import logging
 from contextlib import contextmanager
 
-# Change the database URL to use SQLite
-DATABASE_URL = "sqlite:///./agri_futures.db"
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Used when DATABASE_URL is not set
+DEFAULT_DATABASE_URL = "sqlite:///./agri_futures.db"
+
+def create_db_engine(url: Optional[str] = None, pragmas: Optional[Dict[str, object]] = None, **options) -> Engine:
+    """
+    Create an engine for DATABASE_URL (or the given URL)
+
+    SQLite files get SQLITE_PRAGMAS on every new connection: WAL lets readers
+    run alongside the single writer, and busy_timeout makes a writer wait
+    for the lock instead of failing with "database is locked". In-memory
+    SQLite shares one connection. Server databases such as PostgreSQL use a
+    connection pool sized by the DATABASE_POOL_* settings, with connections
+    recycled and pinged so restarts and idle timeouts do not surface as errors.
+
+    Args:
+        url: Database URL (default: Config.DATABASE_URL)
+        pragmas: SQLite pragmas to apply instead of Config.SQLITE_PRAGMAS
+        options: Extra create_engine keyword arguments
+    """
+    url = make_url(url or Config.DATABASE_URL or DEFAULT_DATABASE_URL)
+    kwargs, pragmas = engine_options(url, pragmas, options)
+    engine = create_engine(url, **kwargs)
+    set_sqlite_pragmas(engine, pragmas)
+    return engine
+
+def engine_options(url: URL, pragmas: Optional[Dict[str, object]], options: dict) -> Tuple[dict, Dict[str, object]]:
+    """create_engine keyword arguments and SQLite pragmas for a URL (shared by the async engine)"""
+    if url.get_backend_name() != 'sqlite':
+        kwargs = {
+            'pool_size': Config.DATABASE_POOL_SIZE,
+            'max_overflow': Config.DATABASE_MAX_OVERFLOW,
+            'pool_timeout': Config.DATABASE_POOL_TIMEOUT,
+            'pool_recycle': Config.DATABASE_POOL_RECYCLE,
+            'pool_pre_ping': True
+        }
+        kwargs.update(options)
+        return kwargs, {}
+
+    pragmas = dict(Config.SQLITE_PRAGMAS if pragmas is None else pragmas)
+    kwargs = {'connect_args': {'check_same_thread': False}}
+    if url.database in (None, '', ':memory:'):
+        kwargs['poolclass'] = StaticPool
+        # WAL and memory mapping only apply to files
+        pragmas.pop('journal_mode', None)
+        pragmas.pop('mmap_size', None)
+    else:
+        kwargs['pool_size'] = Config.DATABASE_POOL_SIZE
+        kwargs['max_overflow'] = Config.DATABASE_MAX_OVERFLOW
+        kwargs['pool_timeout'] = Config.DATABASE_POOL_TIMEOUT
+    if 'busy_timeout' in pragmas:
+        # The driver's own lock wait, in seconds, matches the pragma
+        kwargs['connect_args']['timeout'] = float(pragmas['busy_timeout']) / 1000.0
+    kwargs.update(options)
+    return kwargs, pragmas
+
+def set_sqlite_pragmas(engine: Engine, pragmas: Dict[str, object]):
+    """Apply pragmas to every new connection the engine opens"""
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
 
 # Create database engine
-engine = create_engine(DATABASE_URL)
+engine = create_db_engine()
 
 # Create session factory
 session_factory = sessionmaker(bind=engine)
@@ -28,10 +100,10 @@ def get_db_session():
         session.close()
 
 def init_db():
-    """Initialize database tables"""
-    from .models import Base
-    Base.metadata.create_all(bind=engine)
+    """Initialize database tables by applying every migration"""
+    from .migrations import migrate
+    migrate()
 
 def get_session():
     """Get a new database session"""
-    return Session() 
\ No newline at end of file
+    return Session()
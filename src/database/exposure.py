@@ -0,0 +1,188 @@
+import math
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config.config import Config
+from src.payments.money import from_minor
+from .models import Crop, ExposureBucket, Future
+
+# (crop_id, strike_bucket, expiry_week) -> [contracts, quantity, premium (minor units), strike_exposure]
+BucketDeltas = Dict[Tuple[int, int, date], List[float]]
+
+_UPSERTS = {
+    'sqlite': sqlite_insert,
+    'postgresql': postgresql_insert
+}
+
+
+def strike_bucket(strike_price: float) -> int:
+    """Bucket index for a strike price"""
+    # Small epsilon so strikes that sit exactly on a boundary are not floored down
+    return int(math.floor(strike_price / Config.EXPOSURE_STRIKE_TICK + 1e-9))
+
+
+def expiry_week(expiration_date: datetime) -> date:
+    """Monday of the week a contract expires in"""
+    day = expiration_date.date() if isinstance(expiration_date, datetime) else expiration_date
+    return day - timedelta(days=day.weekday())
+
+
+def bucket_deltas(futures: Iterable, sign: int) -> BucketDeltas:
+    """Aggregate futures into per-bucket deltas (sign=+1 on open, -1 on close)"""
+    deltas: BucketDeltas = defaultdict(lambda: [0, 0.0, 0, 0.0])
+    for future in futures:
+        key = (future.crop_id, strike_bucket(future.strike_price), expiry_week(future.expiration_date))
+        delta = deltas[key]
+        delta[0] += sign
+        delta[1] += sign * future.quantity
+        delta[2] += sign * future.premium
+        delta[3] += sign * future.strike_price * future.quantity
+    return deltas
+
+
+def record_open(session, future: Future):
+    """Add a newly bought future to the aggregates (in the caller's transaction)"""
+    apply_deltas(session, bucket_deltas([future], +1))
+
+
+def record_close(session, future: Future):
+    """Remove an exercised or expired future from the aggregates"""
+    apply_deltas(session, bucket_deltas([future], -1))
+
+
+def record_closed_many(session, futures: Iterable):
+    """Remove a batch of closed futures with one statement per touched bucket"""
+    apply_deltas(session, bucket_deltas(futures, -1))
+
+
+def apply_deltas(session, deltas: BucketDeltas):
+    """Upsert bucket deltas without a read-modify-write round trip"""
+    upsert = _UPSERTS.get(session.get_bind().dialect.name)
+
+    for (crop_id, bucket, week), (contracts, quantity, premium, exposure) in deltas.items():
+        if upsert is not None:
+            stmt = upsert(ExposureBucket).values(
+                crop_id=crop_id,
+                strike_bucket=bucket,
+                expiry_week=week,
+                open_contracts=contracts,
+                open_quantity=quantity,
+                premium_collected=premium,
+                strike_exposure=exposure
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['crop_id', 'strike_bucket', 'expiry_week'],
+                set_={
+                    'open_contracts': ExposureBucket.open_contracts + stmt.excluded.open_contracts,
+                    'open_quantity': ExposureBucket.open_quantity + stmt.excluded.open_quantity,
+                    'premium_collected': ExposureBucket.premium_collected + stmt.excluded.premium_collected,
+                    'strike_exposure': ExposureBucket.strike_exposure + stmt.excluded.strike_exposure
+                }
+            )
+            session.execute(stmt)
+            continue
+
+        row = session.query(ExposureBucket).filter_by(
+            crop_id=crop_id, strike_bucket=bucket, expiry_week=week
+        ).with_for_update().first()
+        if row is None:
+            row = ExposureBucket(
+                crop_id=crop_id, strike_bucket=bucket, expiry_week=week,
+                open_contracts=0, open_quantity=0.0, premium_collected=0, strike_exposure=0.0
+            )
+            session.add(row)
+        row.open_contracts += contracts
+        row.open_quantity += quantity
+        row.premium_collected += premium
+        row.strike_exposure += exposure
+
+
+def query_exposure(
+    session,
+    crop: Optional[str] = None,
+    strike_below: Optional[float] = None,
+    expiry_from: Optional[date] = None,
+    expiry_to: Optional[date] = None
+) -> List[dict]:
+    """
+    Read open exposure from the aggregates, one row per crop and expiry week
+
+    Args:
+        crop: Only this crop
+        strike_below: Only buckets whose strikes are all below this price
+        expiry_from: First expiry date to include
+        expiry_to: Last expiry date to include
+
+    Returns:
+        Rows with open contracts, quantity, premium and strike-weighted exposure
+    """
+    query = (
+        session.query(
+            Crop.name,
+            ExposureBucket.expiry_week,
+            func.sum(ExposureBucket.open_contracts),
+            func.sum(ExposureBucket.open_quantity),
+            func.sum(ExposureBucket.premium_collected),
+            func.sum(ExposureBucket.strike_exposure)
+        )
+        .join(Crop, ExposureBucket.crop_id == Crop.id)
+        .filter(ExposureBucket.open_contracts > 0)
+    )
+    if crop:
+        query = query.filter(Crop.name == crop.lower())
+    if strike_below is not None:
+        # Bucket b holds strikes in [b * tick, (b + 1) * tick)
+        query = query.filter(ExposureBucket.strike_bucket < strike_bucket(strike_below))
+    if expiry_from is not None:
+        query = query.filter(ExposureBucket.expiry_week >= expiry_week(expiry_from))
+    if expiry_to is not None:
+        query = query.filter(ExposureBucket.expiry_week <= expiry_week(expiry_to))
+
+    rows = query.group_by(Crop.name, ExposureBucket.expiry_week).order_by(Crop.name, ExposureBucket.expiry_week)
+    return [
+        {
+            "crop": name,
+            "expiry_week": week,
+            "open_contracts": int(contracts),
+            "open_quantity": quantity,
+            "premium_collected": from_minor(premium or 0),
+            "strike_exposure": exposure,
+            "average_strike": exposure / quantity if quantity else None
+        }
+        for name, week, contracts, quantity, premium, exposure in rows
+    ]
+
+
+def rebuild_exposure(session) -> int:
+    """
+    Recompute all aggregates from the active futures
+
+    Returns:
+        Number of buckets written
+    """
+    active = (
+        session.query(Future.crop_id, Future.strike_price, Future.quantity, Future.premium, Future.expiration_date)
+        .filter(Future.status == 'active')
+        .yield_per(10000)
+    )
+    deltas = bucket_deltas(active, +1)
+
+    session.query(ExposureBucket).delete(synchronize_session=False)
+    session.bulk_insert_mappings(ExposureBucket, [
+        {
+            'crop_id': crop_id,
+            'strike_bucket': bucket,
+            'expiry_week': week,
+            'open_contracts': int(contracts),
+            'open_quantity': quantity,
+            'premium_collected': premium,
+            'strike_exposure': exposure
+        }
+        for (crop_id, bucket, week), (contracts, quantity, premium, exposure) in deltas.items()
+    ])
+    return len(deltas)
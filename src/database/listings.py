@@ -0,0 +1,72 @@
+from typing import Iterator, Optional
+
+from sqlalchemy import Select, select
+from sqlalchemy.orm import joinedload
+
+from config.config import Config
+from .archive import future_history
+from .models import Future, User
+
+
+def futures_page(
+    user_id: Optional[int] = None,
+    phone: Optional[str] = None,
+    status: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    include_archived: bool = False
+) -> Select:
+    """
+    One keyset page of futures with their farmer and crop loaded in the same query
+
+    Pages are ordered by id and continue after the last id of the previous
+    page, so every page costs the same however deep the listing goes.
+    With include_archived, archived contracts are listed among the others.
+    Works with both the sync and the async session.
+    """
+    future = future_history() if include_archived else Future
+    stmt = select(future).options(joinedload(future.user), joinedload(future.crop))
+    if user_id is not None:
+        stmt = stmt.where(future.user_id == user_id)
+    if phone:
+        stmt = stmt.join(future.user).where(User.phone_number == phone)
+    if status:
+        stmt = stmt.where(future.status == status)
+    if after_id is not None:
+        stmt = stmt.where(future.id > after_id)
+    return stmt.order_by(future.id).limit(limit or Config.LISTING_PAGE_SIZE)
+
+
+def iter_futures(
+    session,
+    phone: Optional[str] = None,
+    status: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    page_size: Optional[int] = None,
+    include_archived: bool = False
+) -> Iterator[Future]:
+    """
+    Stream futures page by page, holding one page in memory at a time
+
+    Args:
+        after_id: Start after this future id
+        limit: Stop after this many futures (default: all)
+        page_size: Futures fetched per query
+        include_archived: Also list contracts moved to the archive
+    """
+    page_size = page_size or Config.LISTING_PAGE_SIZE
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        page = session.execute(futures_page(
+            phone=phone, status=status, after_id=after_id, limit=size, include_archived=include_archived
+        )).scalars().all()
+        yield from page
+        if len(page) < size:
+            return
+        after_id = page[-1].id
+        if remaining is not None:
+            remaining -= len(page)
+        # Rows already yielded are not needed by the session any more
+        session.expunge_all()
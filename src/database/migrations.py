@@ -0,0 +1,73 @@
+import logging
+import os
+from typing import Optional, Tuple
+
+from alembic import command
+from alembic.config import Config as AlembicConfig
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import inspect
+
+from .db import create_db_engine
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'alembic.ini')
+
+# The original five tables; databases created with create_all before migrations start here
+BASELINE_REVISION = '0001'
+
+
+def alembic_config(url: Optional[str] = None) -> AlembicConfig:
+    """Alembic configuration for the project, optionally for another database"""
+    config = AlembicConfig(ALEMBIC_INI)
+    # Keep the application's logging configuration
+    config.attributes['configure_logger'] = False
+    if url:
+        config.set_main_option('sqlalchemy.url', url.replace('%', '%%'))
+    return config
+
+
+def current_revision(url: Optional[str] = None) -> Optional[str]:
+    """Revision the database is at, or None if it has never been migrated"""
+    engine = create_db_engine(url)
+    try:
+        with engine.connect() as connection:
+            return MigrationContext.configure(connection).get_current_revision()
+    finally:
+        engine.dispose()
+
+
+def migrate(revision: str = 'head', url: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Upgrade the database to a revision
+
+    A database that already has the application's tables but no migration
+    history was created by create_all; it is stamped at the baseline first
+    so only later migrations run against it. Revision 0002 adds whichever
+    tables and columns from before migrations such a database is missing.
+
+    Returns:
+        (revision before, revision after)
+    """
+    config = alembic_config(url)
+    engine = create_db_engine(url)
+    try:
+        with engine.connect() as connection:
+            before = MigrationContext.configure(connection).get_current_revision()
+            tables = set(inspect(connection).get_table_names())
+    finally:
+        engine.dispose()
+
+    if before is None and 'futures' in tables:
+        logger.warning(f"Database has tables but no migration history; stamping baseline {BASELINE_REVISION}")
+        command.stamp(config, BASELINE_REVISION)
+        before = BASELINE_REVISION
+
+    command.upgrade(config, revision)
+    return before, current_revision(url)
+
+
+def migration_sql(revision: str = 'head', start: Optional[str] = None, url: Optional[str] = None):
+    """Print the SQL for an upgrade instead of running it, for review or manual application"""
+    target = f"{start}:{revision}" if start else revision
+    command.upgrade(alembic_config(url), target, sql=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Text, ForeignKey, Enum, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 import enum
@@ -22,45 +22,107 @@ class User(Base):
     name = Column(String, nullable=False)
     gender = Column(String, nullable=False)
     location = Column(String, nullable=False)
+    latitude = Column(Float)  # geocoded from location, if known
+    longitude = Column(Float)
+    market_id = Column(Integer, ForeignKey('markets.id'))  # nearest market, whose prices the farmer sees
     farm_size = Column(Float)  # in acres
     primary_crop = Column(Integer, ForeignKey('crops.id'))
     
     # Relationships
     futures = relationship("Future", back_populates="user")
     wallet = relationship("Wallet", back_populates="user", uselist=False)
+    market = relationship("Market")
 
 class Crop(Base):
     __tablename__ = 'crops'
+    __table_args__ = (
+        # Price checks and buys look crops up by name
+        Index('ix_crops_name', 'name'),
+    )
     
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
     current_price = Column(Float, nullable=False)
     last_updated = Column(DateTime, nullable=False)
+    price_sources = Column(String)  # comma-separated sources behind current_price
+    price_version = Column(Integer, nullable=False, default=0, server_default='0')  # bumped on every price write
+
+class Market(Base):
+    """A physical market whose local prices contracts can reference"""
+    __tablename__ = 'markets'
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)  # also the stem of its price feed file
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+
+class MarketPrice(Base):
+    """Latest price of a crop at one market"""
+    __tablename__ = 'market_prices'
+    __table_args__ = (
+        UniqueConstraint('market_id', 'crop_id'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    market_id = Column(Integer, ForeignKey('markets.id'), nullable=False)
+    crop_id = Column(Integer, ForeignKey('crops.id'), nullable=False)
+    price = Column(Float, nullable=False)  # base currency per kg, like Crop.current_price
+    last_updated = Column(DateTime, nullable=False)
+    source = Column(String)
 
 class Future(Base):
     __tablename__ = 'futures'
+    __table_args__ = (
+        # Expiry sweeps scan active contracts in expiration order
+        Index('ix_futures_status_expiration_date', 'status', 'expiration_date'),
+        # A farmer's active contracts (API listing, SMS exercise)
+        Index('ix_futures_user_id_status', 'user_id', 'status'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
     crop_id = Column(Integer, ForeignKey('crops.id'))
     quantity = Column(Float, nullable=False)  # in kg
     strike_price = Column(Float, nullable=False)  # price per kg
-    premium = Column(Float, nullable=False)
+    premium = Column(Integer, nullable=False)  # minor units of the base currency
     expiration_date = Column(DateTime, nullable=False)
     contract_address = Column(String, nullable=False)  # Stellar contract identifier
     status = Column(String, nullable=False)  # active, expired, exercised
     created_at = Column(DateTime, nullable=False)
+    market_id = Column(Integer, ForeignKey('markets.id'))  # market whose price settles it; global price if null
     
     # Relationships
     user = relationship("User", back_populates="futures")
     crop = relationship("Crop")
 
+class FutureArchive(Base):
+    """Closed futures moved out of the futures table; same columns and ids"""
+    __tablename__ = 'futures_archive'
+    __table_args__ = (
+        # A farmer's contract history
+        Index('ix_futures_archive_user_id', 'user_id'),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)  # id it had in futures
+    user_id = Column(Integer, ForeignKey('users.id'))
+    crop_id = Column(Integer, ForeignKey('crops.id'))
+    quantity = Column(Float, nullable=False)
+    strike_price = Column(Float, nullable=False)
+    premium = Column(Integer, nullable=False)
+    expiration_date = Column(DateTime, nullable=False)
+    contract_address = Column(String, nullable=False)
+    status = Column(String, nullable=False)  # expired, exercised
+    created_at = Column(DateTime, nullable=False)
+    market_id = Column(Integer, ForeignKey('markets.id'))
+    archived_at = Column(DateTime, nullable=False)
+
 class Wallet(Base):
     __tablename__ = 'wallets'
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), unique=True)
-    balance = Column(Float, default=0.0)
+    balance = Column(Integer, nullable=False, default=0)  # minor units of the wallet's currency
+    currency = Column(String(3), nullable=False, default='KES')
     rapyd_wallet_id = Column(String, unique=True, nullable=False)
     
     # Relationships
@@ -68,11 +130,121 @@ class Wallet(Base):
 
 class Transaction(Base):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        Index('ix_transactions_wallet_id', 'wallet_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     wallet_id = Column(Integer, ForeignKey('wallets.id'))
-    amount = Column(Float, nullable=False)
+    amount = Column(Integer, nullable=False)  # minor units of the wallet's currency
     transaction_type = Column(String, nullable=False)  # deposit, withdrawal, premium_payment
     status = Column(String, nullable=False)  # pending, completed, failed
     rapyd_transaction_id = Column(String, unique=True)
-    created_at = Column(DateTime, nullable=False) 
\ No newline at end of file
+    created_at = Column(DateTime, nullable=False)
+
+class TransactionArchive(Base):
+    """Old settled transactions moved out of the transactions table; same columns and ids"""
+    __tablename__ = 'transactions_archive'
+    __table_args__ = (
+        Index('ix_transactions_archive_wallet_id', 'wallet_id'),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)  # id it had in transactions
+    wallet_id = Column(Integer, ForeignKey('wallets.id'))
+    amount = Column(Integer, nullable=False)
+    transaction_type = Column(String, nullable=False)
+    status = Column(String, nullable=False)  # completed, failed
+    rapyd_transaction_id = Column(String)
+    created_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, nullable=False)
+
+class LedgerEntry(Base):
+    """One leg of a double-entry journal; rows are only inserted, save linking a premium to its future"""
+    __tablename__ = 'ledger_entries'
+    __table_args__ = (
+        # A wallet's entries since its last snapshot
+        Index('ix_ledger_entries_wallet_id_id', 'wallet_id', 'id'),
+        # Both legs of a journal, to link a premium to the future it bought
+        Index('ix_ledger_entries_journal_id', 'journal_id'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    journal_id = Column(String(32), nullable=False)  # legs of one movement share it and sum to zero
+    account = Column(String, nullable=False)  # 'wallet' or a platform account, e.g. premium_income
+    wallet_id = Column(Integer, ForeignKey('wallets.id'))  # set on wallet legs
+    amount = Column(Integer, nullable=False)  # signed minor units; positive increases the account
+    currency = Column(String(3), nullable=False)
+    entry_type = Column(String, nullable=False)  # deposit, withdrawal, premium, premium_refund, payout, ...
+    future_id = Column(Integer)  # id in futures, or in futures_archive once the contract is archived
+    created_at = Column(DateTime, nullable=False)
+
+class BalanceSnapshot(Base):
+    """A wallet's balance as of a ledger entry; later entries are added to it on read"""
+    __tablename__ = 'balance_snapshots'
+    
+    wallet_id = Column(Integer, ForeignKey('wallets.id'), primary_key=True)
+    balance = Column(Integer, nullable=False)  # minor units
+    last_entry_id = Column(Integer, nullable=False)  # entries up to and including this id are in balance
+    taken_at = Column(DateTime, nullable=False)
+
+class Notification(Base):
+    """Outbox of events waiting to be sent to farmers by SMS"""
+    __tablename__ = 'notifications'
+    __table_args__ = (
+        Index('ix_notifications_status_id', 'status', 'id'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    event_type = Column(String, nullable=False)  # future_expired, future_settled
+    payload = Column(Text, nullable=False)  # JSON-encoded message arguments
+    status = Column(String, nullable=False, default='pending')  # pending, sent, failed
+    created_at = Column(DateTime, nullable=False)
+    sent_at = Column(DateTime)
+    
+    # Relationships
+    user = relationship("User")
+
+class JobLock(Base):
+    """Cluster-wide lock and schedule state for periodic jobs"""
+    __tablename__ = 'job_locks'
+    
+    name = Column(String, primary_key=True)
+    owner = Column(String)  # host:pid:token of the worker holding the lock
+    locked_until = Column(DateTime)  # lock expires at this time if the owner dies
+    next_run_at = Column(DateTime)  # earliest time any worker may run the job again
+    last_started_at = Column(DateTime)
+    last_finished_at = Column(DateTime)
+    last_duration = Column(Float)  # seconds
+    last_status = Column(String)  # success, failed
+    last_error = Column(Text)
+    run_count = Column(Integer, nullable=False, default=0)
+
+class CropVolatility(Base):
+    """Online volatility estimator state per crop, updated as prices are fetched"""
+    __tablename__ = 'crop_volatility'
+    
+    crop = Column(String, primary_key=True)  # crop name
+    observations = Column(Integer, nullable=False, default=0)  # returns seen
+    ewma_volatility = Column(Float)  # annualized
+    state = Column(Text)  # JSON estimator state (EWMA and realized windows)
+    updated_at = Column(DateTime)
+
+class ExposureBucket(Base):
+    """Running totals of open protection per crop, strike bucket and expiry week"""
+    __tablename__ = 'exposure_buckets'
+    __table_args__ = (
+        UniqueConstraint('crop_id', 'strike_bucket', 'expiry_week'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    crop_id = Column(Integer, ForeignKey('crops.id'), nullable=False)
+    strike_bucket = Column(Integer, nullable=False)  # floor(strike / EXPOSURE_STRIKE_TICK)
+    expiry_week = Column(Date, nullable=False)  # Monday of the expiration week
+    open_contracts = Column(Integer, nullable=False, default=0)
+    open_quantity = Column(Float, nullable=False, default=0.0)  # in kg
+    premium_collected = Column(Integer, nullable=False, default=0)  # on open contracts, in minor units
+    strike_exposure = Column(Float, nullable=False, default=0.0)  # sum of strike * quantity
+    
+    # Relationships
+    crop = relationship("Crop")
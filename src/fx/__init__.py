@@ -0,0 +1,3 @@
+from .rates import FxRates, RateTable, currency_for_phone, get_fx_rates, load_rate_file
+
+__all__ = ['FxRates', 'RateTable', 'currency_for_phone', 'get_fx_rates', 'load_rate_file']
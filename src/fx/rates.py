@@ -0,0 +1,191 @@
+import csv
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from config.config import Config
+from src.oracle.http import fetch_timeout, get_http_session
+
+logger = logging.getLogger(__name__)
+
+# Background refreshes triggered by reads of an expired table
+_refresh_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fx-refresh')
+
+
+class RateTable:
+    """
+    An immutable snapshot of exchange rates against the base currency
+
+    Each rate is units of the currency per one unit of the base currency.
+    Callers hold on to a table for a whole request or batch, so conversions
+    never look anything up outside memory.
+    """
+
+    def __init__(self, rates: Dict[str, float], fetched_at: float, source: str, base: Optional[str] = None):
+        self.base = base or Config.BASE_CURRENCY
+        rates = {code.upper(): float(rate) for code, rate in rates.items() if rate and float(rate) > 0}
+        rates[self.base] = 1.0
+        self.codes = sorted(rates)
+        self.values = np.array([rates[code] for code in self.codes])
+        self.fetched_at = fetched_at
+        self.source = source
+        self._index = {code: i for i, code in enumerate(self.codes)}
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    def rate(self, currency: str) -> float:
+        """Units of currency per unit of the base currency"""
+        try:
+            return float(self.values[self._index[currency.upper()]])
+        except KeyError:
+            raise ValueError(f"No exchange rate for {currency}")
+
+    def convert(self, amount: float, to_currency: str, from_currency: Optional[str] = None) -> float:
+        """Convert one amount, rounded to 2 decimals"""
+        from_rate = self.rate(from_currency) if from_currency else 1.0
+        return round(amount * self.rate(to_currency) / from_rate, 2)
+
+    def to_base(self, amount: float, from_currency: str) -> float:
+        """Convert a local amount into the base currency (unrounded, e.g. for strikes)"""
+        return amount / self.rate(from_currency)
+
+    def convert_many(self, amounts, currencies: Iterable[str], from_currency: Optional[str] = None) -> np.ndarray:
+        """
+        Convert base-currency amounts into a currency per element in one pass
+
+        Currencies are resolved once per distinct code and gathered by index.
+        """
+        amounts = np.asarray(amounts, dtype=float)
+        codes, inverse = np.unique(np.array([c.upper() for c in currencies], dtype=object), return_inverse=True)
+        rates = np.array([self.rate(code) for code in codes])[inverse] if len(codes) else np.ones(0)
+        from_rate = self.rate(from_currency) if from_currency else 1.0
+        return np.round(amounts * rates / from_rate, 2)
+
+    def to_dict(self) -> dict:
+        return {
+            'base': self.base,
+            'timestamp': self.fetched_at,
+            'rates': dict(zip(self.codes, self.values.tolist()))
+        }
+
+
+def parse_rates(data: dict, source: str, default_timestamp: float) -> RateTable:
+    """Rate table from {"base": ..., "timestamp": ..., "rates": {code: rate}}"""
+    base = data.get('base', Config.BASE_CURRENCY).upper()
+    rates = data['rates']
+    if base != Config.BASE_CURRENCY:
+        # Re-express rates against our base currency
+        pivot = float(rates[Config.BASE_CURRENCY])
+        rates = {code: float(rate) / pivot for code, rate in rates.items()}
+        rates[base] = 1.0 / pivot
+    return RateTable(rates, float(data.get('timestamp') or default_timestamp), source)
+
+
+def load_rate_file(path: str) -> Optional[RateTable]:
+    """Rates from a JSON file as written by FxRates, or a CSV with currency and rate columns"""
+    if not path or not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    with open(path, newline='') as f:
+        if path.endswith('.csv'):
+            rates = {row['currency']: float(row['rate']) for row in csv.DictReader(f)}
+            return RateTable(rates, mtime, 'file')
+        return parse_rates(json.load(f), 'file', mtime)
+
+
+class FxRates:
+    """
+    Process-wide cache of the current rate table
+
+    Rates come from FX_RATES_URL when configured, with the last successful
+    download saved to FX_RATES_PATH so restarts and offline nodes fall back
+    to it, and FX_DEFAULT_RATES before anything has loaded. The scheduler
+    refreshes the table in the background; a read of a table older than
+    FX_RATES_TTL also starts a refresh but returns the current table at once.
+    """
+
+    def __init__(self, url: Optional[str] = None, path: Optional[str] = None, ttl: Optional[float] = None):
+        self.url = url if url is not None else Config.FX_RATES_URL
+        self.path = path if path is not None else Config.FX_RATES_PATH
+        self.ttl = ttl if ttl is not None else Config.FX_RATES_TTL
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._table = load_rate_file(self.path) or RateTable(Config.FX_DEFAULT_RATES, 0.0, 'default')
+
+    @property
+    def table(self) -> RateTable:
+        """Current rate table, refreshing it in the background once it expires"""
+        table = self._table
+        if table.age >= self.ttl:
+            with self._lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                _refresh_pool.submit(self._background_refresh)
+        return table
+
+    def refresh(self) -> RateTable:
+        """Load rates from the URL (saving them for offline use) or the local file"""
+        table = None
+        if self.url:
+            try:
+                response = get_http_session('fx').get(self.url, timeout=fetch_timeout())
+                response.raise_for_status()
+                table = parse_rates(response.json(), 'url', time.time())
+                self._save(table)
+            except Exception as e:
+                logger.error(f"Could not fetch exchange rates: {str(e)}")
+        if table is None:
+            table = load_rate_file(self.path)
+        if table is not None:
+            self._table = table
+            logger.info(f"Loaded {len(table.codes)} exchange rates from {table.source}")
+        return self._table
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Exchange rate refresh failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _save(self, table: RateTable):
+        """Write rates atomically so readers never see a partial file"""
+        if not self.path:
+            return
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(table.to_dict(), f)
+        os.replace(temporary, self.path)
+
+
+_fx: Optional[FxRates] = None
+_fx_lock = threading.Lock()
+
+
+def get_fx_rates() -> FxRates:
+    """Process-wide exchange rate cache"""
+    global _fx
+    with _fx_lock:
+        if _fx is None:
+            _fx = FxRates()
+        return _fx
+
+
+def currency_for_phone(phone_number: str) -> str:
+    """Wallet currency for a farmer's phone number, by international dialing code"""
+    digits = phone_number.lstrip('+')
+    for code, currency in Config.CURRENCY_BY_DIALING_CODE.items():
+        if digits.startswith(code):
+            return currency
+    return Config.DEFAULT_CURRENCY
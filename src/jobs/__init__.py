@@ -0,0 +1,6 @@
+from .archival import HistoryArchiver
+from .expiry import ExpirySweeper
+from .settlement import SettlementEngine
+from .scheduler import Job, JobScheduler
+
+__all__ = ['HistoryArchiver', 'ExpirySweeper', 'SettlementEngine', 'Job', 'JobScheduler']
@@ -0,0 +1,69 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from config.config import Config
+from src.database.archive import archive_futures, archive_transactions
+from src.database.db import Session
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryArchiver:
+    """
+    Moves closed futures and old transactions into their archive tables
+
+    Futures are archived ARCHIVE_FUTURES_AFTER_DAYS after they expired, once
+    they are expired or exercised; transactions ARCHIVE_TRANSACTIONS_AFTER_DAYS
+    after they were created, once Rapyd has completed or failed them. Every
+    batch is its own short transaction, so the hot tables stay proportional
+    to open contracts without long locks.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = Session,
+        batch_size: Optional[int] = None,
+        futures_after_days: Optional[int] = None,
+        transactions_after_days: Optional[int] = None
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size or Config.ARCHIVE_BATCH_SIZE
+        self.futures_after = timedelta(days=Config.ARCHIVE_FUTURES_AFTER_DAYS if futures_after_days is None else futures_after_days)
+        self.transactions_after = timedelta(
+            days=Config.ARCHIVE_TRANSACTIONS_AFTER_DAYS if transactions_after_days is None else transactions_after_days
+        )
+
+    def run(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Archive everything due in bounded batches
+
+        Returns:
+            Number of futures and transactions moved
+        """
+        now = now or datetime.now()
+        moved = {
+            'futures': self._run_batches(archive_futures, now - self.futures_after, now),
+            'transactions': self._run_batches(archive_transactions, now - self.transactions_after, now)
+        }
+        if any(moved.values()):
+            logger.info(f"Archived {moved['futures']} futures and {moved['transactions']} transactions")
+        return moved
+
+    def _run_batches(self, archive: Callable, cutoff: datetime, now: datetime) -> int:
+        total = 0
+        while True:
+            session = self.session_factory()
+            try:
+                moved = archive(session, cutoff, self.batch_size, now)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.close()
+
+            total += moved
+            if moved < self.batch_size:
+                break
+        return total
@@ -0,0 +1,166 @@
+import logging
+from datetime import datetime
+from typing import Callable, Optional
+
+from sqlalchemy import update
+
+from config.config import Config
+from src.database.db import Session
+from src.database.exposure import record_closed_many
+from src.database.models import Crop, Future, Wallet
+from src.fx import RateTable, get_fx_rates
+from src.sms.notifications import queue_notifications
+
+logger = logging.getLogger(__name__)
+
+
+class ExpirySweeper:
+    """
+    Transitions lapsed futures from 'active' to 'expired'
+
+    Lapsed contracts are found through the (status, expiration_date) index, so
+    each run costs time proportional to the number of contracts expiring, not
+    to the size of the futures table. Every batch is its own transaction that
+    flips the status, updates the exposure aggregates and queues one
+    'future_expired' notification per contract. Amounts in notifications
+    are converted to each farmer's wallet currency with one rate table per run.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = Session,
+        batch_size: Optional[int] = None,
+        rates: Optional[RateTable] = None
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size or Config.EXPIRY_BATCH_SIZE
+        self.rates = rates
+        # Crops whose contracts are left active this run (e.g. no trustworthy price)
+        self.excluded_crop_ids = set()
+
+    def run(self, now: Optional[datetime] = None) -> int:
+        """
+        Expire every lapsed contract in bounded batches
+
+        Returns:
+            Number of futures expired
+        """
+        now = now or datetime.now()
+        rates_taken = self.rates is None
+        if rates_taken:
+            self.rates = get_fx_rates().table
+        try:
+            total = self._run_batches(now)
+        finally:
+            if rates_taken:
+                self.rates = None
+
+        if total:
+            logger.info(f"Expired {total} futures")
+        return total
+
+    def _run_batches(self, now: datetime) -> int:
+        total = 0
+        while True:
+            session = self.session_factory()
+            try:
+                expired = self.sweep_batch(session, now)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.close()
+
+            total += expired
+            if expired < self.batch_size:
+                break
+        return total
+
+    def sweep_batch(self, session, now: datetime) -> int:
+        """Close up to batch_size lapsed contracts in the caller's transaction"""
+        lapsed = self._select_lapsed(session, now)
+        if lapsed:
+            self.process_batch(session, lapsed)
+        return len(lapsed)
+
+    def process_batch(self, session, lapsed: list):
+        """Close a batch of lapsed contracts (overridden to settle payouts)"""
+        self._expire(session, lapsed)
+
+    def _select_lapsed(self, session, now: datetime) -> list:
+        """Next batch of lapsed active contracts, oldest expiry first"""
+        query = (
+            session.query(
+                Future.id,
+                Future.user_id,
+                Future.crop_id,
+                Future.quantity,
+                Future.strike_price,
+                Future.premium,
+                Future.expiration_date,
+                Future.market_id,
+                Crop.name.label('crop_name'),
+                Wallet.currency.label('currency')
+            )
+            .join(Crop, Future.crop_id == Crop.id)
+            .outerjoin(Wallet, Wallet.user_id == Future.user_id)
+            .filter(Future.status == 'active', Future.expiration_date <= now)
+        )
+        if self.excluded_crop_ids:
+            query = query.filter(Future.crop_id.notin_(self.excluded_crop_ids))
+        return (
+            query
+            .order_by(Future.expiration_date)
+            .limit(self.batch_size)
+            .with_for_update(of=Future, skip_locked=True)
+            .all()
+        )
+
+    def _close(self, session, rows: list, status: str) -> list:
+        """
+        Flip rows from active to status and take them out of the exposure aggregates
+
+        Only rows still active are flipped; rows another worker closed since
+        they were selected (e.g. exercised by SMS) are dropped from the result.
+
+        Returns:
+            The rows this call closed
+        """
+        if not rows:
+            return []
+        closed = {
+            future_id for future_id, in session.execute(
+                update(Future)
+                .where(Future.id.in_([row.id for row in rows]), Future.status == 'active')
+                .values(status=status)
+                .returning(Future.id)
+                .execution_options(synchronize_session=False)
+            )
+        }
+        rows = [row for row in rows if row.id in closed]
+        record_closed_many(session, rows)
+        return rows
+
+    def _expire(self, session, rows: list):
+        """Expire rows without payout and notify each contract holder"""
+        rows = self._close(session, rows, 'expired')
+        if not rows:
+            return
+        currencies = [self._currency(row) for row in rows]
+        strikes = self.rates.convert_many([row.strike_price for row in rows], currencies)
+        queue_notifications(session, (
+            {
+                'user_id': row.user_id,
+                'event_type': 'future_expired',
+                'future_id': row.id,
+                'crop': row.crop_name,
+                'quantity': row.quantity,
+                'strike_price': strike,
+                'currency': currency
+            }
+            for row, strike, currency in zip(rows, strikes.tolist(), currencies)
+        ))
+
+    def _currency(self, row) -> str:
+        return row.currency or Config.DEFAULT_CURRENCY
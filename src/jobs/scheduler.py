@@ -0,0 +1,263 @@
+import asyncio
+import inspect
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+
+from config.config import Config
+from src.database.db import Session
+from src.database.models import JobLock
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """A periodic job registered with the scheduler"""
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable,
+        interval: float,
+        jitter: float,
+        max_concurrency: int = 1,
+        singleton: bool = True,
+        lock_ttl: Optional[float] = None
+    ):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.max_concurrency = max_concurrency
+        self.singleton = singleton
+        self.lock_ttl = lock_ttl or max(interval, 60)
+
+        self.running = 0
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+        self.last_duration: Optional[float] = None
+        self.last_started_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    def next_delay(self) -> float:
+        """Seconds until the next attempt, with jitter to spread workers apart"""
+        spread = self.interval * self.jitter
+        return max(self.interval + random.uniform(-spread, spread), 0.0)
+
+    def metrics(self) -> Dict[str, object]:
+        return {
+            'interval': self.interval,
+            'running': self.running,
+            'runs': self.runs,
+            'failures': self.failures,
+            'skipped': self.skipped,
+            'last_started_at': self.last_started_at,
+            'last_duration': self.last_duration,
+            'average_duration': self.total_duration / self.runs if self.runs else None,
+            'max_duration': self.max_duration,
+            'last_error': self.last_error
+        }
+
+
+class JobScheduler:
+    """
+    Asyncio scheduler for periodic platform work
+
+    Each job runs on its own loop with jittered intervals. Blocking jobs are
+    run in a thread so the event loop (and the API sharing it) stays
+    responsive. Singleton jobs take a lease in the job_locks table before
+    running, so when several API or worker processes run a scheduler each job
+    runs on only one of them per interval.
+    """
+
+    def __init__(self, session_factory: Callable = Session):
+        self.session_factory = session_factory
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.jobs: Dict[str, Job] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._runs: set = set()
+        self._stopping: Optional[asyncio.Event] = None
+
+    def register(
+        self,
+        name: str,
+        func: Callable,
+        interval: float,
+        jitter: Optional[float] = None,
+        max_concurrency: int = 1,
+        singleton: bool = True,
+        lock_ttl: Optional[float] = None
+    ) -> Job:
+        """Register a function (sync or async) to run every interval seconds"""
+        if name in self.jobs:
+            raise ValueError(f"Job already registered: {name}")
+        job = Job(
+            name,
+            func,
+            interval,
+            Config.SCHEDULER_JITTER if jitter is None else jitter,
+            max_concurrency=max_concurrency,
+            singleton=singleton,
+            lock_ttl=lock_ttl
+        )
+        self.jobs[name] = job
+        return job
+
+    def job(self, name: str, interval: float, **kwargs) -> Callable:
+        """Decorator form of register"""
+        def decorator(func: Callable) -> Callable:
+            self.register(name, func, interval, **kwargs)
+            return func
+        return decorator
+
+    async def start(self):
+        """Start one loop per registered job on the running event loop"""
+        self._stopping = asyncio.Event()
+        for job in self.jobs.values():
+            self._tasks[job.name] = asyncio.create_task(self._loop(job), name=f"job:{job.name}")
+        logger.info(f"Scheduler {self.owner} started {len(self.jobs)} jobs")
+
+    async def stop(self, timeout: float = 30.0):
+        """Stop scheduling and wait for in-flight runs to finish"""
+        if self._stopping is None:
+            return
+        self._stopping.set()
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+        if self._runs:
+            await asyncio.wait(self._runs, timeout=timeout)
+        logger.info(f"Scheduler {self.owner} stopped")
+
+    async def run_forever(self):
+        """Run until cancelled (used by the standalone worker)"""
+        await self.start()
+        try:
+            await self._stopping.wait()
+        finally:
+            await self.stop()
+
+    async def run_once(self, name: str) -> bool:
+        """Run a job immediately, honouring its lock; returns True if it ran"""
+        return await self._execute(self.jobs[name])
+
+    def metrics(self) -> Dict[str, Dict[str, object]]:
+        """Run counts and durations per job for this process"""
+        return {name: job.metrics() for name, job in self.jobs.items()}
+
+    async def _loop(self, job: Job):
+        # Start each job at a random point in its first interval
+        await asyncio.sleep(random.uniform(0, job.interval * job.jitter))
+        while not self._stopping.is_set():
+            if job.running < job.max_concurrency:
+                run = asyncio.create_task(self._execute(job))
+                self._runs.add(run)
+                run.add_done_callback(self._runs.discard)
+            else:
+                job.skipped += 1
+            await asyncio.sleep(job.next_delay())
+
+    async def _execute(self, job: Job) -> bool:
+        if job.singleton and not await asyncio.to_thread(self._acquire, job):
+            job.skipped += 1
+            return False
+
+        job.running += 1
+        job.last_started_at = datetime.now()
+        started = time.perf_counter()
+        error = None
+        try:
+            if inspect.iscoroutinefunction(job.func):
+                await job.func()
+            else:
+                await asyncio.to_thread(job.func)
+        except Exception as e:
+            error = str(e)
+            job.failures += 1
+            logger.error(f"Job {job.name} failed: {error}")
+        finally:
+            duration = time.perf_counter() - started
+            job.running -= 1
+            job.runs += 1
+            job.total_duration += duration
+            job.max_duration = max(job.max_duration, duration)
+            job.last_duration = duration
+            job.last_error = error
+            if job.singleton:
+                await asyncio.to_thread(self._release, job, duration, error)
+        logger.info(f"Job {job.name} finished in {duration:.2f}s")
+        return True
+
+    def _acquire(self, job: Job) -> bool:
+        """Take the job's lease if it is free and the job is due"""
+        session = self.session_factory()
+        try:
+            if session.get(JobLock, job.name) is None:
+                try:
+                    session.add(JobLock(name=job.name, run_count=0))
+                    session.commit()
+                except IntegrityError:
+                    session.rollback()
+
+            now = datetime.now()
+            result = session.execute(
+                update(JobLock)
+                .where(
+                    JobLock.name == job.name,
+                    or_(JobLock.locked_until.is_(None), JobLock.locked_until < now),
+                    or_(JobLock.next_run_at.is_(None), JobLock.next_run_at <= now)
+                )
+                .values(
+                    owner=self.owner,
+                    locked_until=now + timedelta(seconds=job.lock_ttl),
+                    last_started_at=now
+                )
+                .execution_options(synchronize_session=False)
+            )
+            session.commit()
+            return result.rowcount == 1
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Could not acquire lock for job {job.name}: {str(e)}")
+            return False
+        finally:
+            session.close()
+
+    def _release(self, job: Job, duration: float, error: Optional[str]):
+        """Release the lease and record when the job may run next"""
+        session = self.session_factory()
+        try:
+            now = datetime.now()
+            session.execute(
+                update(JobLock)
+                .where(JobLock.name == job.name, JobLock.owner == self.owner)
+                .values(
+                    locked_until=None,
+                    # Leave a little slack so a worker waking slightly early still runs it
+                    next_run_at=now + timedelta(seconds=job.interval * (1 - job.jitter)),
+                    last_finished_at=now,
+                    last_duration=duration,
+                    last_status='failed' if error else 'success',
+                    last_error=error,
+                    run_count=JobLock.run_count + 1
+                )
+                .execution_options(synchronize_session=False)
+            )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Could not release lock for job {job.name}: {str(e)}")
+        finally:
+            session.close()
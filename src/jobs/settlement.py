@@ -0,0 +1,187 @@
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Dict, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, update
+
+from config.config import Config
+from src.database.db import Session
+from src.database.models import Crop, Transaction, Wallet
+from src.fx import RateTable
+from src.markets import market_price_snapshot
+from src.oracle.refresher import is_price_stale, is_price_untrusted
+from src.payments.ledger import post_many
+from src.payments.money import from_minor, to_minor_many
+from src.sms.notifications import queue_notifications
+from .expiry import ExpirySweeper
+
+logger = logging.getLogger(__name__)
+
+
+class SettlementEngine(ExpirySweeper):
+    """
+    Settles lapsed futures at expiry instead of letting them lapse
+
+    All contracts in a batch are priced against one snapshot of crop prices
+    taken when the run starts (crops whose price is older than
+    MAX_EXERCISE_PRICE_AGE, or simulated, wait for the next run), and
+    payouts are computed in a single vectorized pass. Contracts referencing
+    a market settle at that market's price when the snapshot has a fresh
+    one, and at the global crop price otherwise. In-the-money contracts are
+    marked 'exercised', their wallets credited and payout transactions
+    written with bulk statements in the batch's transaction;
+    out-of-the-money contracts expire as with ExpirySweeper.
+    Payouts are computed in the base currency and converted to each wallet's
+    currency, in minor units, in the same pass before crediting, and each
+    credit is journaled in the ledger. Each farmer receives one
+    notification per batch summarising the payout.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = Session,
+        batch_size: Optional[int] = None,
+        prices: Optional[Dict[int, float]] = None,
+        rates: Optional[RateTable] = None,
+        market_prices: Optional[Dict[Tuple[int, int], float]] = None
+    ):
+        super().__init__(session_factory, batch_size or Config.SETTLEMENT_BATCH_SIZE, rates)
+        self.prices = prices
+        self.market_prices = market_prices or {}
+        self.settled = 0
+        self.paid_out = 0.0
+
+    def run(self, now: Optional[datetime] = None) -> int:
+        """
+        Settle or expire every contract that expired by now
+
+        Returns:
+            Number of futures closed
+        """
+        self.settled = 0
+        self.paid_out = 0.0
+        snapshot_taken = self.prices is None
+        if snapshot_taken:
+            self.prices, self.excluded_crop_ids, self.market_prices = self._price_snapshot()
+        try:
+            closed = super().run(now)
+        finally:
+            if snapshot_taken:
+                self.prices = None
+                self.excluded_crop_ids = set()
+                self.market_prices = {}
+
+        if self.settled:
+            logger.info(f"Settled {self.settled} futures, paid out {self.paid_out:.2f} {Config.BASE_CURRENCY}")
+        return closed
+
+    def _price_snapshot(self) -> Tuple[Dict[int, float], Set[int], Dict[Tuple[int, int], float]]:
+        """Crop prices by id, the crops too stale or untrusted to settle, and fresh market prices"""
+        session = self.session_factory()
+        try:
+            prices, excluded = {}, set()
+            for crop_id, name, price, last_updated, sources in session.query(
+                Crop.id, Crop.name, Crop.current_price, Crop.last_updated, Crop.price_sources
+            ):
+                prices[crop_id] = price
+                if is_price_stale(last_updated):
+                    logger.warning(f"Not settling {name}: price last updated {last_updated}")
+                    excluded.add(crop_id)
+                elif is_price_untrusted(sources):
+                    logger.warning(f"Not settling {name}: price is {sources}, not from an upstream source")
+                    excluded.add(crop_id)
+            return prices, excluded, market_price_snapshot(session)
+        finally:
+            session.close()
+
+    def process_batch(self, session, lapsed: list):
+        """Pay in-the-money contracts and expire the rest"""
+        strikes = np.array([row.strike_price for row in lapsed], dtype=float)
+        quantities = np.array([row.quantity for row in lapsed], dtype=float)
+        spots = np.array([
+            self.market_prices.get((row.market_id, row.crop_id), self.prices.get(row.crop_id, np.nan))
+            for row in lapsed
+        ], dtype=float)
+
+        payouts = np.round(np.maximum(strikes - spots, 0.0) * quantities, 2)
+        in_the_money = np.nan_to_num(payouts) > 0
+
+        wallet_ids = dict(
+            session.query(Wallet.user_id, Wallet.id)
+            .filter(Wallet.user_id.in_({row.user_id for row in lapsed}))
+            .all()
+        )
+
+        settle, expire = [], []
+        for row, itm in zip(lapsed, in_the_money.tolist()):
+            if itm and row.user_id not in wallet_ids:
+                logger.error(f"Future {row.id} is in the money but user {row.user_id} has no wallet")
+                itm = False
+            (settle if itm else expire).append(row)
+
+        self._expire(session, expire)
+        if settle:
+            payout_by_id = dict(zip((row.id for row in lapsed), payouts.tolist()))
+            self._settle(session, settle, payout_by_id, wallet_ids)
+
+    def _settle(self, session, rows: list, payouts: Dict[int, float], wallet_ids: Dict[int, int]):
+        """Exercise rows, credit wallets in their own currency and record payouts in bulk"""
+        rows = self._close(session, rows, 'exercised')
+        if not rows:
+            return
+        now = datetime.now()
+        currencies = [self._currency(row) for row in rows]
+        local_payouts = to_minor_many(self.rates.convert_many([payouts[row.id] for row in rows], currencies))
+
+        per_wallet = defaultdict(int)
+        per_user = defaultdict(lambda: {'payout': 0, 'contracts': 0, 'crops': set()})
+        transactions, postings = [], []
+        for row, local_payout, currency in zip(rows, local_payouts.tolist(), currencies):
+            wallet_id = wallet_ids[row.user_id]
+            per_wallet[wallet_id] += local_payout
+            summary = per_user[row.user_id]
+            summary['payout'] += local_payout
+            summary['contracts'] += 1
+            summary['crops'].add(row.crop_name)
+            summary['currency'] = currency
+            transactions.append({
+                'wallet_id': wallet_id,
+                'amount': local_payout,
+                'transaction_type': 'payout',
+                'status': 'completed',
+                'created_at': now
+            })
+            postings.append({
+                'wallet_id': wallet_id,
+                'amount': local_payout,
+                'currency': currency,
+                'entry_type': 'payout',
+                'future_id': row.id,
+                'created_at': now
+            })
+
+        wallets = Wallet.__table__
+        session.execute(
+            update(wallets)
+            .where(wallets.c.id == bindparam('wallet_id'))
+            .values(balance=wallets.c.balance + bindparam('credit')),
+            [{'wallet_id': wallet_id, 'credit': credit} for wallet_id, credit in per_wallet.items()]
+        )
+        session.bulk_insert_mappings(Transaction, transactions)
+        post_many(session, postings)
+        queue_notifications(session, (
+            {
+                'user_id': user_id,
+                'event_type': 'future_settled',
+                'crop': ', '.join(sorted(summary['crops'])),
+                'payout': from_minor(summary['payout']),
+                'currency': summary['currency'],
+                'contracts': summary['contracts']
+            }
+            for user_id, summary in per_user.items()
+        ))
+
+        self.settled += len(rows)
+        self.paid_out += sum(payouts[row.id] for row in rows)
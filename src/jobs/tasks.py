@@ -0,0 +1,88 @@
+import logging
+
+from config.config import Config
+from src.database.db import Session, get_db_session
+from src.oracle.refresher import PriceRefresher
+from src.sms.notifications import deliver_pending
+from .archival import HistoryArchiver
+from .expiry import ExpirySweeper
+from .scheduler import JobScheduler
+from .settlement import SettlementEngine
+
+logger = logging.getLogger(__name__)
+
+
+def refresh_prices():
+    """Refresh crop prices ahead of their TTL and store them"""
+    PriceRefresher().refresh_all()
+
+
+def refresh_fx_rates():
+    """Reload exchange rates so conversions never wait on a download"""
+    from src.fx import get_fx_rates
+
+    get_fx_rates().refresh()
+
+
+def settle_expired():
+    """Settle (or just expire) contracts past their expiration date"""
+    if Config.AUTO_SETTLE_AT_EXPIRY:
+        SettlementEngine().run()
+    else:
+        ExpirySweeper().run()
+
+
+def deliver_notifications():
+    """Send queued farmer notifications"""
+    from src.sms.messaging import SMSMessenger
+
+    with get_db_session() as session:
+        deliver_pending(session, SMSMessenger())
+
+
+def snapshot_balances():
+    """Fold recent ledger entries into the per-wallet balance snapshots"""
+    from src.payments.ledger import snapshot_balances as take_snapshots
+
+    with get_db_session() as session:
+        changed = take_snapshots(session)
+    logger.info(f"Snapshotted balances of {changed} wallets")
+
+
+def archive_history():
+    """Move closed futures and old transactions out of the hot tables"""
+    HistoryArchiver().run()
+
+
+def issuer_risk():
+    """Nightly Monte Carlo run over the active book"""
+    from src.oracle.volatility import get_volatility_tracker
+    from src.risk import load_book, run_risk
+
+    session = Session()
+    try:
+        book = load_book(session)
+    finally:
+        session.close()
+    report = run_risk(book, volatilities=get_volatility_tracker().volatilities(book.crops))
+    total = report['total']
+    logger.info(
+        f"Issuer risk: expected payout {total['expected_payout']:.2f}, "
+        f"VaR {total['var']:.2f}, ES {total['expected_shortfall']:.2f} "
+        f"over {total['contracts']} contracts"
+    )
+
+
+def build_scheduler() -> JobScheduler:
+    """Scheduler with the platform's periodic jobs registered"""
+    scheduler = JobScheduler()
+    intervals = Config.JOB_INTERVALS
+    scheduler.register('refresh_prices', refresh_prices, intervals['refresh_prices'])
+    scheduler.register('settle_expired', settle_expired, intervals['settle_expired'])
+    scheduler.register('refresh_fx_rates', refresh_fx_rates, intervals['refresh_fx_rates'], singleton=False)
+    scheduler.register('snapshot_balances', snapshot_balances, intervals['snapshot_balances'])
+    scheduler.register('archive_history', archive_history, intervals['archive_history'])
+    if Config.TWILIO_ACCOUNT_SID:
+        scheduler.register('deliver_notifications', deliver_notifications, intervals['deliver_notifications'])
+    scheduler.register('issuer_risk', issuer_risk, intervals['issuer_risk'], lock_ttl=3 * 3600)
+    return scheduler
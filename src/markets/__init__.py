@@ -0,0 +1,21 @@
+from .geo import Gazetteer, KDTree, haversine_km
+from .registry import (
+    MarketLocation,
+    MarketRegistry,
+    ReferencePrice,
+    get_market_registry,
+    market_price_snapshot,
+    reference_price
+)
+
+__all__ = [
+    'Gazetteer',
+    'KDTree',
+    'MarketLocation',
+    'MarketRegistry',
+    'ReferencePrice',
+    'get_market_registry',
+    'haversine_km',
+    'market_price_snapshot',
+    'reference_price'
+]
@@ -0,0 +1,134 @@
+import csv
+import logging
+import math
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in kilometres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def unit_vector(lat: float, lon: float) -> Tuple[float, float, float]:
+    """Point on the unit sphere; straight-line distance between these orders points like great-circle distance"""
+    phi, lam = math.radians(lat), math.radians(lon)
+    return (math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi))
+
+
+class KDTree:
+    """
+    Nearest-neighbour index over points on the Earth's surface
+
+    Coordinates are mapped to 3-D unit vectors so the tree splits on plain
+    Euclidean axes with no special cases at the antimeridian or the poles,
+    and the chord distance it minimises is monotonic in great-circle
+    distance. Built once from the market list; a query visits O(log n)
+    nodes, a few microseconds for a few hundred markets.
+    """
+
+    def __init__(self, points: Sequence[Tuple[float, float]]):
+        self.vectors = [unit_vector(lat, lon) for lat, lon in points]
+        # Nodes are (index, axis, left, right) tuples
+        self.root = self._build(list(range(len(self.vectors))), 0)
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def _build(self, indices: List[int], depth: int):
+        if not indices:
+            return None
+        axis = depth % 3
+        indices.sort(key=lambda i: self.vectors[i][axis])
+        middle = len(indices) // 2
+        return (
+            indices[middle],
+            axis,
+            self._build(indices[:middle], depth + 1),
+            self._build(indices[middle + 1:], depth + 1)
+        )
+
+    def nearest(self, lat: float, lon: float) -> Optional[Tuple[int, float]]:
+        """
+        Closest point to a location
+
+        Returns:
+            (index of the point, great-circle distance in km), or None if the tree is empty
+        """
+        if self.root is None:
+            return None
+        target = unit_vector(lat, lon)
+        best = [-1, math.inf]
+
+        def search(node):
+            if node is None:
+                return
+            index, axis, left, right = node
+            point = self.vectors[index]
+            squared = (point[0] - target[0]) ** 2 + (point[1] - target[1]) ** 2 + (point[2] - target[2]) ** 2
+            if squared < best[1]:
+                best[0], best[1] = index, squared
+            offset = target[axis] - point[axis]
+            near, far = (left, right) if offset < 0 else (right, left)
+            search(near)
+            # The other side can only hold a closer point if the splitting plane is closer
+            if offset * offset < best[1]:
+                search(far)
+
+        search(self.root)
+        chord = math.sqrt(best[1])
+        return best[0], 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+class Gazetteer:
+    """
+    Offline geocoder for the free-text locations farmers register with
+
+    Places come from Config.GAZETTEER plus an optional CSV at GAZETTEER_PATH
+    (name, latitude, longitude). Lookups ignore case and surrounding
+    punctuation, and a multi-word location matches on its first known word
+    ("nakuru town" resolves to Nakuru).
+    """
+
+    def __init__(self, places: Optional[Dict[str, Tuple[float, float]]] = None, path: Optional[str] = None):
+        self.places = {_normalise(name): tuple(coords) for name, coords in (places if places is not None else Config.GAZETTEER).items()}
+        path = path if path is not None else Config.GAZETTEER_PATH
+        if path:
+            self._load(path)
+
+    def _load(self, path: str):
+        if not os.path.exists(path):
+            logger.error(f"Gazetteer file not found: {path}")
+            return
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                try:
+                    self.places[_normalise(row['name'])] = (float(row['latitude']), float(row['longitude']))
+                except (KeyError, TypeError, ValueError) as e:
+                    logger.error(f"Skipping gazetteer row {row}: {str(e)}")
+
+    def geocode(self, location: Optional[str]) -> Optional[Tuple[float, float]]:
+        """Coordinates of a place name, or None if it is not known"""
+        if not location:
+            return None
+        name = _normalise(location)
+        if name in self.places:
+            return self.places[name]
+        for word in name.split():
+            if word in self.places:
+                return self.places[word]
+        return None
+
+
+def _normalise(name: str) -> str:
+    return ' '.join(name.strip().lower().replace(',', ' ').replace('_', ' ').split())
@@ -0,0 +1,169 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config.config import Config
+from src.database.db import session_factory
+from src.database.models import Market, MarketPrice, User
+from src.oracle.refresher import is_price_stale
+from .geo import Gazetteer, KDTree
+
+logger = logging.getLogger(__name__)
+
+
+class MarketLocation:
+    """A market and its distance from the point it was looked up for"""
+
+    __slots__ = ('id', 'name', 'latitude', 'longitude', 'distance_km')
+
+    def __init__(self, id: int, name: str, latitude: float, longitude: float, distance_km: float = 0.0):
+        self.id = id
+        self.name = name
+        self.latitude = latitude
+        self.longitude = longitude
+        self.distance_km = distance_km
+
+
+class ReferencePrice:
+    """The price a farmer's contracts are quoted and settled against, and where it came from"""
+
+    __slots__ = ('price', 'last_updated', 'market_id', 'price_version', 'sources')
+
+    def __init__(
+        self,
+        price: float,
+        last_updated: Optional[datetime],
+        market_id: Optional[int] = None,
+        price_version: Optional[int] = None,
+        sources: Optional[str] = None
+    ):
+        self.price = price
+        self.last_updated = last_updated
+        self.market_id = market_id
+        self.price_version = price_version
+        self.sources = sources  # comma-separated sources behind price
+
+    @property
+    def version(self) -> tuple:
+        """
+        Identifies this price for premium caching
+
+        Prices at different markets never share quotes. Global prices are
+        identified by the crop's price_version, market prices by when they
+        were last updated.
+        """
+        return (self.market_id, self.last_updated if self.price_version is None else self.price_version)
+
+
+class MarketRegistry:
+    """
+    Resolves farmers to their nearest market
+
+    Markets are read from the database into a KD-tree, rebuilt after
+    MARKET_REGISTRY_TTL so markets added by another process are picked up
+    without a lookup ever touching the database.
+    """
+
+    def __init__(self, session_factory: Callable = session_factory, gazetteer: Optional[Gazetteer] = None, ttl: Optional[float] = None):
+        self.session_factory = session_factory
+        self.gazetteer = gazetteer or Gazetteer()
+        self.ttl = ttl if ttl is not None else Config.MARKET_REGISTRY_TTL
+        self._lock = threading.Lock()
+        self._markets: List[MarketLocation] = []
+        self._tree = KDTree([])
+        self._loaded_at: Optional[float] = None
+
+    def reload(self):
+        """Rebuild the index from the markets table"""
+        session = self.session_factory()
+        try:
+            markets = [
+                MarketLocation(market_id, name, latitude, longitude)
+                for market_id, name, latitude, longitude in session.query(
+                    Market.id, Market.name, Market.latitude, Market.longitude
+                ).order_by(Market.id)
+            ]
+        finally:
+            session.close()
+        tree = KDTree([(m.latitude, m.longitude) for m in markets])
+        with self._lock:
+            self._markets, self._tree = markets, tree
+            self._loaded_at = time.monotonic()
+        logger.info(f"Indexed {len(markets)} markets")
+
+    def nearest(self, latitude: float, longitude: float) -> Optional[MarketLocation]:
+        """Closest market to a point, or None if there are no markets"""
+        with self._lock:
+            expired = self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl
+        if expired:
+            self.reload()
+        with self._lock:
+            markets, tree = self._markets, self._tree
+        found = tree.nearest(latitude, longitude)
+        if found is None:
+            return None
+        market = markets[found[0]]
+        return MarketLocation(market.id, market.name, market.latitude, market.longitude, found[1])
+
+    def locate(self, location: str) -> Tuple[Optional[Tuple[float, float]], Optional[MarketLocation]]:
+        """Coordinates of a place name and its nearest market"""
+        coords = self.gazetteer.geocode(location)
+        if coords is None:
+            return None, None
+        return coords, self.nearest(*coords)
+
+    def assign(self, user: User) -> Optional[MarketLocation]:
+        """
+        Geocode a farmer's location and attach their nearest market (not committed)
+
+        Farmers whose location is not in the gazetteer keep no market and are
+        priced against the global crop price.
+        """
+        coords, market = self.locate(user.location)
+        if coords is None:
+            logger.info(f"Location '{user.location}' not in gazetteer; using global prices")
+            return None
+        user.latitude, user.longitude = coords
+        user.market_id = market.id if market else None
+        return market
+
+
+def reference_price(session, crop, market_id: Optional[int], max_age: Optional[float] = None) -> ReferencePrice:
+    """
+    Price of a crop for contracts referencing a market
+
+    The market's own price while it is no older than max_age (default
+    MAX_EXERCISE_PRICE_AGE); otherwise, or without a market, the global
+    crop price. The crop may be a Crop row or a catalog entry.
+    """
+    if market_id is not None:
+        row = session.query(MarketPrice).filter_by(market_id=market_id, crop_id=crop.id).first()
+        if row is not None and not is_price_stale(row.last_updated, max_age):
+            return ReferencePrice(row.price, row.last_updated, market_id, sources=row.source)
+    return ReferencePrice(crop.current_price, crop.last_updated, price_version=crop.price_version, sources=crop.price_sources)
+
+
+def market_price_snapshot(session, max_age: Optional[float] = None) -> Dict[Tuple[int, int], float]:
+    """Fresh market prices keyed by (market id, crop id)"""
+    snapshot = {}
+    for market_id, crop_id, price, last_updated in session.query(
+        MarketPrice.market_id, MarketPrice.crop_id, MarketPrice.price, MarketPrice.last_updated
+    ):
+        if not is_price_stale(last_updated, max_age):
+            snapshot[(market_id, crop_id)] = price
+    return snapshot
+
+
+_registry: Optional[MarketRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_market_registry() -> MarketRegistry:
+    """Process-wide market registry"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MarketRegistry()
+        return _registry
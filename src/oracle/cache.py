@@ -0,0 +1,208 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS prices (
+    crop TEXT PRIMARY KEY,
+    price REAL,
+    source TEXT,
+    fetched_at REAL,
+    refresh_owner TEXT,
+    refresh_until REAL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class CachedPrice:
+    """A price read from the shared cache"""
+
+    __slots__ = ('crop', 'price', 'source', 'fetched_at')
+
+    def __init__(self, crop: str, price: float, source: Optional[str], fetched_at: float):
+        self.crop = crop
+        self.price = price
+        self.source = source
+        self.fetched_at = fetched_at
+
+    @property
+    def age(self) -> float:
+        """Seconds since the price was fetched"""
+        return time.time() - self.fetched_at
+
+
+class SharedPriceCache:
+    """
+    Price cache shared by every worker process on the node
+
+    Backed by a small SQLite file in WAL mode, so reads never block and every
+    update is a single atomic statement. A refresh lease per crop lets exactly
+    one process fetch from upstream when a price goes stale while the others
+    wait for (or fall back to) its result. Hit/miss counters are kept in memory
+    and folded into the shared file periodically.
+    """
+
+    COUNTER_FLUSH_INTERVAL = 10.0
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ttls: Optional[Dict[str, float]] = None,
+        default_ttl: Optional[float] = None
+    ):
+        self.path = path or Config.PRICE_CACHE_PATH
+        self.ttls = dict(ttls if ttls is not None else Config.PRICE_CACHE_TTLS)
+        self.default_ttl = default_ttl if default_ttl is not None else Config.PRICE_CACHE_TTL
+        self._local = threading.local()
+        self._counter_lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._last_flush = time.monotonic()
+        self._connect().executescript(_SCHEMA)
+
+    def ttl(self, crop: str) -> float:
+        """Seconds a crop's price stays fresh"""
+        return self.ttls.get(crop, self.default_ttl)
+
+    def get(self, crop: str) -> Optional[CachedPrice]:
+        """Latest cached price regardless of age"""
+        row = self._connect().execute(
+            "SELECT price, source, fetched_at FROM prices WHERE crop = ? AND price IS NOT NULL",
+            (crop,)
+        ).fetchone()
+        return CachedPrice(crop, row[0], row[1], row[2]) if row else None
+
+    def get_fresh(self, crop: str) -> Optional[CachedPrice]:
+        """Cached price if it is within the crop's TTL, counting hits and misses"""
+        cached = self.get(crop)
+        if cached is not None and cached.age < self.ttl(crop):
+            self._count('hits')
+            return cached
+        self._count('misses')
+        return None
+
+    def set(self, crop: str, price: float, source: str, fetched_at: Optional[float] = None) -> CachedPrice:
+        """Store a price and release any refresh lease on the crop"""
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+        self._connect().execute(
+            """
+            INSERT INTO prices (crop, price, source, fetched_at, refresh_owner, refresh_until)
+            VALUES (?, ?, ?, ?, NULL, NULL)
+            ON CONFLICT (crop) DO UPDATE SET
+                price = excluded.price,
+                source = excluded.source,
+                fetched_at = excluded.fetched_at,
+                refresh_owner = NULL,
+                refresh_until = NULL
+            """,
+            (crop, price, source, fetched_at)
+        )
+        return CachedPrice(crop, price, source, fetched_at)
+
+    def claim_refresh(self, crop: str, lease_seconds: Optional[float] = None, ignore_ttl: bool = False) -> bool:
+        """
+        Try to become the one process refreshing a crop
+
+        Succeeds only if no other live lease exists and, unless ignore_ttl is
+        set, the price is stale.
+        """
+        lease_seconds = lease_seconds or Config.PRICE_REFRESH_LEASE
+        now = time.time()
+        stale_before = now if ignore_ttl else now - self.ttl(crop)
+        connection = self._connect()
+        connection.execute("INSERT OR IGNORE INTO prices (crop) VALUES (?)", (crop,))
+        cursor = connection.execute(
+            """
+            UPDATE prices SET refresh_owner = ?, refresh_until = ?
+            WHERE crop = ?
+              AND (refresh_until IS NULL OR refresh_until < ?)
+              AND (fetched_at IS NULL OR fetched_at < ?)
+            """,
+            (self._owner(), now + lease_seconds, crop, now, stale_before)
+        )
+        claimed = cursor.rowcount == 1
+        self._count('refresh_claims' if claimed else 'refresh_waits')
+        return claimed
+
+    def release_refresh(self, crop: str):
+        """Give up a lease without storing a price (e.g. upstream failed)"""
+        self._connect().execute(
+            "UPDATE prices SET refresh_owner = NULL, refresh_until = NULL WHERE crop = ? AND refresh_owner = ?",
+            (crop, self._owner())
+        )
+
+    def wait_for_fresh(self, crop: str, timeout: float, poll_interval: float = 0.05) -> Optional[CachedPrice]:
+        """Poll for another process's refresh to land"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            cached = self.get(crop)
+            if cached is not None and cached.age < self.ttl(crop):
+                return cached
+            time.sleep(poll_interval)
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters summed over every process using the cache"""
+        self.flush_counters()
+        return dict(self._connect().execute("SELECT name, value FROM counters").fetchall())
+
+    def flush_counters(self):
+        """Add this process's pending counts to the shared counters"""
+        with self._counter_lock:
+            pending, self._counters = self._counters, {}
+            self._last_flush = time.monotonic()
+        if pending:
+            self._connect().executemany(
+                """
+                INSERT INTO counters (name, value) VALUES (?, ?)
+                ON CONFLICT (name) DO UPDATE SET value = value + excluded.value
+                """,
+                list(pending.items())
+            )
+
+    def _count(self, name: str):
+        with self._counter_lock:
+            self._counters[name] = self._counters.get(name, 0) + 1
+            due = time.monotonic() - self._last_flush > self.COUNTER_FLUSH_INTERVAL
+        if due:
+            try:
+                self.flush_counters()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not flush price cache counters: {str(e)}")
+
+    def _owner(self) -> str:
+        # Per process, so a lease claimed on a request thread can be released by a background thread
+        return f"{os.getpid()}:{id(self)}"
+
+    def _connect(self) -> sqlite3.Connection:
+        """One autocommit connection per thread"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+
+_caches: Dict[str, SharedPriceCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_shared_cache(path: Optional[str] = None) -> SharedPriceCache:
+    """Process-wide cache instance for a cache file"""
+    path = path or Config.PRICE_CACHE_PATH
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = SharedPriceCache(path)
+        return _caches[path]
@@ -1,14 +1,25 @@
-import requests
 import logging
-from datetime import datetime
-from typing import Optional, Dict
+from typing import Optional, Dict, Iterable
 import os
-import random
-from time import time
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor, wait
+from config.config import Config
+from src.oracle.cache import CachedPrice, get_shared_cache
+from src.oracle.http import fetch_timeout, get_circuit_breaker, get_http_session
+from src.oracle.simulator import get_live_simulator
+from src.oracle.sources import SimulatedSource, aggregate, default_sources, fetch_quotes
+from src.oracle.throttle import SingleFlight, get_alpha_vantage_quota
+from src.oracle.ticks import get_tick_store
+from src.oracle.volatility import get_volatility_tracker
 
 logger = logging.getLogger(__name__)
 
+# Upstream fetches, both background revalidation and concurrent refreshes of many crops
+_fetch_pool = ThreadPoolExecutor(max_workers=Config.PRICE_FETCH_WORKERS, thread_name_prefix='price-fetch')
+
+# Concurrent misses for the same crop within this process share one fetch
+_misses = SingleFlight()
+
 class PriceOracle:
     def __init__(self):
         load_dotenv()
@@ -33,12 +44,40 @@ class PriceOracle:
             'rice': 4.0
         }
         
-        # Cache prices to avoid hitting API limits
-        self.price_cache = {}
-        self.cache_duration = 300  # 5 minutes cache
+        # Cache prices across all workers on the node to avoid hitting API limits
+        self.price_cache = get_shared_cache()
+        
+        # Pooled keep-alive connections and a breaker shared by every oracle in the process
+        self.http = get_http_session('alpha_vantage')
+        self.breaker = get_circuit_breaker('alpha_vantage')
+        
+        # Minute/day call quota shared by every worker on the node
+        self.quota = get_alpha_vantage_quota()
+        
+        # Prices are the outlier-filtered median of every configured source
+        self.sources = default_sources(self)
+        self.fallback = SimulatedSource(self)
+        
+        # Every fetched price is kept as a tick for history, volatility and backtests
+        self.ticks = get_tick_store()
+        
+        # ...and updates the crop's online volatility estimates
+        self.volatility = get_volatility_tracker()
         
     def get_crop_price(self, crop_name: str) -> Optional[float]:
-        """Get current price for a crop from Alpha Vantage with fallback to simulation"""
+        """Get current price for a crop from its price sources with fallback to simulation"""
+        quote = self.get_crop_quote(crop_name)
+        return quote.price if quote else None
+        
+    def get_crop_quote(self, crop_name: str) -> Optional[CachedPrice]:
+        """
+        Get the current price for a crop along with when and where it was fetched
+        
+        Fresh prices come straight from the shared cache. Prices past their TTL
+        but within PRICE_STALE_GRACE are returned immediately while a background
+        refresh runs (stale-while-revalidate); only older or missing prices are
+        fetched synchronously.
+        """
         try:
             crop_name = crop_name.lower()
             if crop_name not in self.crop_symbols:
@@ -46,29 +85,152 @@ class PriceOracle:
                 return None
                 
             # Check cache first
-            if self._is_cache_valid(crop_name):
+            cached = self.price_cache.get_fresh(crop_name)
+            if cached:
                 logger.info(f"Using cached price for {crop_name}")
-                return self.price_cache[crop_name]['price']
+                return cached
                 
-            # Try to get real price from Alpha Vantage
-            real_price = self._get_alpha_vantage_price(crop_name)
-            if real_price:
-                logger.info(f"Got real price from Alpha Vantage for {crop_name}: {real_price}")
-                self._update_cache(crop_name, real_price)
-                return real_price
+            # Serve a slightly stale price now and refresh it in the background,
+            # but no more often than the upstream quota allows
+            cached = self.price_cache.get(crop_name)
+            if cached and cached.age < Config.PRICE_STALE_GRACE:
+                if cached.age >= self.refresh_interval(crop_name):
+                    logger.info(f"Serving stale price for {crop_name} ({cached.age:.0f}s old) while refreshing")
+                    self.revalidate(crop_name)
+                return cached
                 
-            # Fallback to simulated price
-            logger.info(f"Using simulated price for {crop_name}")
-            simulated_price = self._get_simulated_price(crop_name)
-            self._update_cache(crop_name, simulated_price)
-            return simulated_price
+            # Threads missing together wait on a single fetch
+            return _misses.do(crop_name, lambda: self._fetch_missing(crop_name))
             
         except Exception as e:
             logger.error(f"Error getting price for {crop_name}: {str(e)}")
-            return self.base_prices.get(crop_name)
+            base_price = self.base_prices.get(crop_name)
+            # A base price is never fresh, so callers that check staleness reject it
+            return CachedPrice(crop_name, base_price, 'base', 0.0) if base_price else None
+            
+    def _fetch_missing(self, crop_name: str) -> CachedPrice:
+        """Fetch a missing or expired price, or wait for the worker already fetching it"""
+        # Only one worker on the node refreshes a stale crop; the rest wait for it
+        if not self.price_cache.claim_refresh(crop_name):
+            cached = self.price_cache.wait_for_fresh(crop_name, Config.PRICE_CACHE_WAIT)
+            if cached is None:
+                cached = self.price_cache.get(crop_name)
+            if cached:
+                logger.info(f"Using price refreshed by another worker for {crop_name}")
+                return cached
+                
+        try:
+            return self._refresh_price(crop_name)
+        finally:
+            self.price_cache.release_refresh(crop_name)
+            
+    def refresh_interval(self, crop_name: str) -> float:
+        """
+        Seconds between upstream refreshes of a crop
+        
+        The crop's cache TTL, stretched when refreshing every supported crop
+        that often would run through the Alpha Vantage quota before the day ends.
+        """
+        return max(self.price_cache.ttl(crop_name), self.quota.spacing(len(self.crop_symbols)))
+        
+    def get_price_age(self, crop_name: str) -> Optional[float]:
+        """Seconds since the cached price for a crop was fetched, or None if never"""
+        cached = self.price_cache.get(crop_name.lower())
+        return cached.age if cached else None
+        
+    def revalidate(self, crop_name: str) -> bool:
+        """
+        Refresh a crop's price in the background unless another worker already is
+        
+        Returns:
+            True if a refresh was started by this call
+        """
+        if not self.price_cache.claim_refresh(crop_name):
+            return False
+        _fetch_pool.submit(self._refresh_claimed, crop_name)
+        return True
+        
+    def refresh(self, crop_name: str) -> Optional[CachedPrice]:
+        """Fetch a crop's price now if no other worker is, returning the newest cached price"""
+        return self.refresh_many([crop_name]).get(crop_name)
+        
+    def refresh_many(self, crop_names: Iterable[str]) -> Dict[str, CachedPrice]:
+        """
+        Fetch several crops concurrently over the pooled session
+        
+        Crops another worker is already refreshing are skipped. Waits at most
+        the connect + read timeout for the fetches to land.
+        
+        Returns:
+            Newest cached price per crop
+        """
+        crop_names = list(crop_names)
+        claimed = [crop for crop in crop_names if self.price_cache.claim_refresh(crop, ignore_ttl=True)]
+        pending = [_fetch_pool.submit(self._refresh_claimed, crop) for crop in claimed]
+        if pending:
+            wait(pending, timeout=sum(fetch_timeout()) + 1)
             
+        quotes = {}
+        for crop in crop_names:
+            cached = self.price_cache.get(crop)
+            if cached:
+                quotes[crop] = cached
+        return quotes
+        
+    def fetch_all_prices(self) -> Dict[str, CachedPrice]:
+        """Refresh every supported crop concurrently"""
+        return self.refresh_many(self.crop_symbols)
+        
+    def _refresh_claimed(self, crop_name: str):
+        """Refresh a crop whose lease this process holds, always releasing it"""
+        try:
+            self._refresh_price(crop_name)
+        except Exception as e:
+            logger.error(f"Background refresh failed for {crop_name}: {str(e)}")
+        finally:
+            self.price_cache.release_refresh(crop_name)
+            
+    def _refresh_price(self, crop_name: str) -> CachedPrice:
+        """Fetch a price from every source (or simulate it) and store it in the shared cache"""
+        combined = aggregate(fetch_quotes(self.sources, crop_name, timeout=sum(fetch_timeout()) + 1))
+        if combined:
+            logger.info(f"Got price for {crop_name} from {combined.source}: {combined.price}")
+            quote = self.price_cache.set(crop_name, combined.price, combined.source, fetched_at=combined.fetched_at)
+        else:
+            # No real source answered (circuit open, out of quota, feeds empty):
+            # keep the last real price rather than replacing it with a simulation
+            cached = self.price_cache.get(crop_name)
+            if cached and cached.source not in (None, SimulatedSource.name):
+                logger.info(f"No price source available, keeping cached price for {crop_name}")
+                return cached
+                
+            # Fallback to simulated price; it is cached so SMS replies have a price,
+            # but kept out of the tick history and volatility estimates, and
+            # settlement refuses it by its source
+            logger.info(f"Using simulated price for {crop_name}")
+            simulated = self.fallback.fetch(crop_name)[0]
+            return self.price_cache.set(crop_name, simulated.price, simulated.source)
+            
+        self._record_tick(quote)
+        return quote
+        
+    def _record_tick(self, quote: CachedPrice):
+        """Append a fetched price to the tick store and volatility estimates without failing the fetch"""
+        try:
+            self.ticks.append(quote.crop, quote.price, quote.fetched_at)
+        except OSError as e:
+            logger.error(f"Could not record tick for {quote.crop}: {str(e)}")
+        try:
+            self.volatility.record(quote.crop, quote.price, quote.fetched_at)
+        except Exception as e:
+            logger.error(f"Could not update volatility for {quote.crop}: {str(e)}")
+        
     def _get_alpha_vantage_price(self, crop_name: str) -> Optional[float]:
-        """Get real-time price from Alpha Vantage API"""
+        """Get real-time price from Alpha Vantage API (None if it fails or the circuit is open)"""
+        if not self.breaker.allow():
+            logger.info(f"Alpha Vantage circuit open, skipping {crop_name}")
+            return None
+            
         try:
             params = {
                 'function': 'GLOBAL_QUOTE',
@@ -76,51 +238,25 @@ class PriceOracle:
                 'apikey': self.api_key
             }
             
-            response = requests.get(self.base_url, params=params)
+            response = self.http.get(self.base_url, params=params, timeout=fetch_timeout())
             response.raise_for_status()
             data = response.json()
             
             if 'Global Quote' in data and '05. price' in data['Global Quote']:
                 price = float(data['Global Quote']['05. price'])
+                self.breaker.record_success()
                 return round(price, 2)
                 
+            # Rate-limit notices and unknown symbols come back as 200 without a quote
+            logger.error(f"Alpha Vantage returned no quote for {crop_name}: {data}")
+            self.breaker.record_failure()
             return None
             
         except Exception as e:
             logger.error(f"Alpha Vantage API error: {str(e)}")
+            self.breaker.record_failure()
             return None
             
     def _get_simulated_price(self, crop_name: str) -> float:
-        """Generate simulated price with random variation"""
-        base_price = self.base_prices[crop_name]
-        volatility = 0.05  # 5% volatility
-        trend = 0.001  # 0.1% upward trend per minute
-        
-        # Calculate time-based trend
-        current_time = time()
-        minutes_elapsed = (current_time - self.last_update) / 60 if hasattr(self, 'last_update') else 0
-        trend_factor = 1 + (trend * minutes_elapsed)
-        
-        # Add random walk component
-        random_factor = 1 + random.uniform(-volatility, volatility)
-        
-        # Calculate new price
-        new_price = base_price * trend_factor * random_factor
-        self.last_update = current_time
-        
-        return round(new_price, 2)
-            
-    def _update_cache(self, crop_name: str, price: float):
-        """Update price cache"""
-        self.price_cache[crop_name] = {
-            'price': price,
-            'timestamp': datetime.now()
-        }
-            
-    def _is_cache_valid(self, crop_name: str) -> bool:
-        """Check if cached price is still valid"""
-        if crop_name not in self.price_cache:
-            return False
-            
-        cache_age = (datetime.now() - self.price_cache[crop_name]['timestamp']).total_seconds()
-        return cache_age < self.cache_duration
\ No newline at end of file
+        """Price of a crop on the process's live simulated path"""
+        return round(get_live_simulator(self.base_prices).advance()[crop_name], 2)
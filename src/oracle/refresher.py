@@ -0,0 +1,168 @@
+import logging
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import bindparam, or_, update
+
+from config.config import Config
+from src.database.catalog import get_crop_catalog
+from src.database.db import session_factory
+from src.database.models import Crop, Market, MarketPrice
+from src.oracle.cache import CachedPrice
+from src.oracle.price_oracle import PriceOracle
+from src.oracle.sources import FileFeedSource, SimulatedSource
+
+logger = logging.getLogger(__name__)
+
+# Stand-ins for a missing upstream price; nothing is ever paid out against them
+UNTRUSTED_PRICE_SOURCES = frozenset({SimulatedSource.name, 'base'})
+
+
+class PriceRefresher:
+    """
+    Keeps every crop's price fresh ahead of demand
+
+    Run periodically by the scheduler. Crops whose cached price has used up
+    PRICE_REFRESH_AHEAD of its refresh interval (the TTL, or longer when the
+    upstream quota cannot sustain it) are refreshed before they go stale,
+    and the newest prices are written to Crop.current_price / last_updated
+    in one batched UPDATE that bumps each crop's price_version, so
+    settlement and exercise read recent prices without waiting on upstream.
+    Feed files named after a market also update that market's own prices.
+    """
+
+    def __init__(
+        self,
+        oracle: Optional[PriceOracle] = None,
+        session_factory: Callable = session_factory,
+        refresh_ahead: Optional[float] = None
+    ):
+        self.oracle = oracle or PriceOracle()
+        self.session_factory = session_factory
+        self.refresh_ahead = refresh_ahead if refresh_ahead is not None else Config.PRICE_REFRESH_AHEAD
+
+    def refresh_all(self) -> Dict[str, CachedPrice]:
+        """
+        Refresh crops that are near or past their refresh interval and store all prices
+
+        Returns:
+            Newest cached price per crop
+        """
+        cache = self.oracle.price_cache
+        quotes, due = {}, []
+        for crop_name in self.oracle.crop_symbols:
+            cached = cache.get(crop_name)
+            if cached is None or cached.age >= self.oracle.refresh_interval(crop_name) * self.refresh_ahead:
+                due.append(crop_name)
+            else:
+                quotes[crop_name] = cached
+
+        # Due crops are fetched concurrently over one pooled session
+        quotes.update(self.oracle.refresh_many(due))
+
+        self.store(quotes)
+        self.store_market_prices()
+        return quotes
+
+    def store(self, quotes: Dict[str, CachedPrice]) -> int:
+        """Write prices to the crops table in one batch, never overwriting newer ones"""
+        if not quotes:
+            return 0
+        crops = Crop.__table__
+        session = self.session_factory()
+        try:
+            result = session.execute(
+                update(crops)
+                .where(
+                    crops.c.name == bindparam('crop_name'),
+                    or_(crops.c.last_updated.is_(None), crops.c.last_updated < bindparam('fetched'))
+                )
+                .values(
+                    current_price=bindparam('price'),
+                    last_updated=bindparam('fetched'),
+                    price_sources=bindparam('sources'),
+                    price_version=crops.c.price_version + 1
+                ),
+                [
+                    {
+                        'crop_name': quote.crop,
+                        'price': quote.price,
+                        'sources': quote.source,
+                        'fetched': datetime.fromtimestamp(quote.fetched_at)
+                    }
+                    for quote in quotes.values()
+                ]
+            )
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        if result.rowcount:
+            get_crop_catalog().invalidate()
+        return result.rowcount
+
+    def store_market_prices(self) -> int:
+        """
+        Copy each market's newest feed price per crop into market_prices
+
+        A feed file whose name matches a market (e.g. nairobi.csv) is that
+        market's price list. Stored prices are only replaced by newer ones.
+        """
+        feeds = [source for source in self.oracle.sources if isinstance(source, FileFeedSource)]
+        if not feeds:
+            return 0
+        session = self.session_factory()
+        try:
+            markets = {name.lower(): market_id for market_id, name in session.query(Market.id, Market.name)}
+            if not markets:
+                return 0
+            crops = dict(session.query(Crop.name, Crop.id))
+            existing = {(row.market_id, row.crop_id): row for row in session.query(MarketPrice)}
+
+            updated = 0
+            for feed in feeds:
+                for crop_name, crop_id in crops.items():
+                    for quote in feed.fetch(crop_name):
+                        market_id = markets.get(quote.source.split(':', 1)[-1].lower())
+                        if market_id is None:
+                            continue
+                        fetched = datetime.fromtimestamp(quote.fetched_at)
+                        row = existing.get((market_id, crop_id))
+                        if row is None:
+                            row = MarketPrice(market_id=market_id, crop_id=crop_id)
+                            session.add(row)
+                            existing[(market_id, crop_id)] = row
+                        elif row.last_updated >= fetched:
+                            continue
+                        row.price = quote.price
+                        row.last_updated = fetched
+                        row.source = quote.source
+                        updated += 1
+            session.commit()
+            return updated
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+
+def price_age_seconds(last_updated: Optional[datetime]) -> Optional[float]:
+    """Age of a stored crop price in seconds"""
+    if last_updated is None:
+        return None
+    return (datetime.now() - last_updated).total_seconds()
+
+
+def is_price_stale(last_updated: Optional[datetime], max_age: Optional[float] = None) -> bool:
+    """True if a stored price is too old to settle or exercise against"""
+    age = price_age_seconds(last_updated)
+    max_age = max_age if max_age is not None else Config.MAX_EXERCISE_PRICE_AGE
+    return age is None or age > max_age
+
+
+def is_price_untrusted(price_sources: Optional[str]) -> bool:
+    """True if a stored price came from the simulator or the base-price fallback"""
+    return bool(price_sources) and not UNTRUSTED_PRICE_SOURCES.isdisjoint(price_sources.split(','))
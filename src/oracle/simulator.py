@@ -0,0 +1,196 @@
+import logging
+import math
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+DAYS_PER_YEAR = 365.0
+SECONDS_PER_YEAR = DAYS_PER_YEAR * 86400
+
+
+def correlation_matrix(crops: Sequence[str]) -> np.ndarray:
+    """Build the crop correlation matrix from Config, repaired to be positive definite"""
+    n = len(crops)
+    matrix = np.full((n, n), Config.DEFAULT_CROP_CORRELATION)
+    for i, a in enumerate(crops):
+        for j, b in enumerate(crops):
+            rho = Config.CROP_CORRELATIONS.get((a, b), Config.CROP_CORRELATIONS.get((b, a)))
+            if rho is not None:
+                matrix[i, j] = rho
+    np.fill_diagonal(matrix, 1.0)
+
+    eigenvalues, eigenvectors = np.linalg.eigh(matrix)
+    if eigenvalues.min() <= 1e-10:
+        eigenvalues = np.clip(eigenvalues, 1e-6, None)
+        matrix = eigenvectors @ np.diag(eigenvalues) @ eigenvectors.T
+        scale = np.sqrt(np.diag(matrix))
+        matrix = matrix / np.outer(scale, scale)
+    return matrix
+
+
+class PriceSimulator:
+    """
+    Correlated stochastic price paths for several crops at once
+
+    Log prices follow geometric Brownian motion with drift, or, for crops
+    with a mean-reversion speed, an Ornstein-Uhlenbeck process pulled towards
+    the log of their long-run level. Crops with a seasonality entry
+    (amplitude, peak day of year) get a deterministic sinusoidal factor on
+    top, normalised so every path starts at the spot price. Shocks are
+    correlated through the Cholesky factor of the crop correlation matrix.
+
+    Paths are generated as NumPy arrays for any number of scenarios. The
+    simulator also keeps one live path that advance() moves forward in
+    real time, which the oracle uses as its fallback feed.
+    """
+
+    def __init__(
+        self,
+        crops: Sequence[str],
+        spots: Sequence[float],
+        volatilities: Optional[Dict[str, float]] = None,
+        drifts: Optional[Dict[str, float]] = None,
+        mean_reversion: Optional[Dict[str, float]] = None,
+        long_run: Optional[Dict[str, float]] = None,
+        seasonality: Optional[Dict[str, tuple]] = None,
+        correlation: Optional[np.ndarray] = None,
+        seed=None,
+        start: Optional[datetime] = None
+    ):
+        volatilities = volatilities if volatilities is not None else Config.CROP_VOLATILITIES
+        drifts = drifts if drifts is not None else Config.CROP_DRIFTS
+        mean_reversion = mean_reversion if mean_reversion is not None else Config.CROP_MEAN_REVERSION
+        long_run = long_run or {}
+        seasonality = seasonality if seasonality is not None else Config.CROP_SEASONALITY
+
+        self.crops = list(crops)
+        self.spots = np.asarray(spots, dtype=float)
+        self.volatilities = np.array([volatilities.get(c, Config.DEFAULT_VOLATILITY) for c in self.crops])
+        self.drifts = np.array([drifts.get(c, 0.0) for c in self.crops])
+        self.kappas = np.array([mean_reversion.get(c, 0.0) for c in self.crops])
+        self.long_run = np.log([long_run.get(c, spot) for c, spot in zip(self.crops, self.spots)]) if self.crops else np.zeros(0)
+        self.amplitudes = np.array([seasonality.get(c, (0.0, 0))[0] for c in self.crops])
+        self.peaks = np.array([seasonality.get(c, (0.0, 0))[1] for c in self.crops], dtype=float)
+        if correlation is None:
+            correlation = correlation_matrix(self.crops)
+        self.cholesky = np.linalg.cholesky(correlation) if self.crops else np.zeros((0, 0))
+        self.start = start or datetime.now()
+        self.seed = seed
+
+        self._live_rng = np.random.default_rng(seed)
+        self._live_log = np.zeros(len(self.crops))
+        self._live_elapsed = 0.0
+        self._live_clock: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Sent to risk worker processes; the lock cannot be pickled
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def log_returns(self, scenarios: int, steps: int, dt: float = 1.0 / DAYS_PER_YEAR, rng=None) -> np.ndarray:
+        """
+        Log price relative to spot after each step
+
+        Args:
+            scenarios: Number of independent paths
+            steps: Steps per path
+            dt: Step length in years
+            rng: Generator or seed (defaults to the simulator's seed)
+
+        Returns:
+            Array of shape (scenarios, steps, crops)
+        """
+        rng = rng if isinstance(rng, np.random.Generator) else np.random.default_rng(rng if rng is not None else self.seed)
+        n_crops = len(self.crops)
+        if steps <= 0 or n_crops == 0:
+            return np.zeros((scenarios, max(steps, 0), n_crops))
+
+        shocks = rng.standard_normal((scenarios, steps, n_crops)) @ self.cholesky.T
+        log_paths = self._integrate(shocks, dt)
+        log_paths += self._seasonal(np.arange(1, steps + 1) * dt)
+        return log_paths
+
+    def paths(self, scenarios: int, steps: int, dt: float = 1.0 / DAYS_PER_YEAR, rng=None) -> np.ndarray:
+        """Prices after each step, shape (scenarios, steps, crops)"""
+        return self.spots * np.exp(self.log_returns(scenarios, steps, dt, rng))
+
+    def advance(self, seconds: Optional[float] = None) -> Dict[str, float]:
+        """
+        Move the live path forward and return its prices
+
+        Without an argument the path advances by the wall-clock time since the
+        previous call, so repeated calls trace one continuous path.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if seconds is None:
+                seconds = now - self._live_clock if self._live_clock is not None else 0.0
+            self._live_clock = now
+            if seconds > 0 and self.crops:
+                dt = seconds / SECONDS_PER_YEAR
+                shock = self._live_rng.standard_normal((1, 1, len(self.crops))) @ self.cholesky.T
+                self._live_log = self._integrate(shock, dt, self._live_log)[0, -1]
+                self._live_elapsed += dt
+            log_prices = self._live_log + self._seasonal(np.array([self._live_elapsed]))[0]
+            return dict(zip(self.crops, (self.spots * np.exp(log_prices)).tolist()))
+
+    def _integrate(self, shocks: np.ndarray, dt: float, initial: Optional[np.ndarray] = None) -> np.ndarray:
+        """Turn correlated standard normal shocks into log paths relative to spot"""
+        sigma = self.volatilities
+        if not self.kappas.any():
+            increments = (self.drifts - 0.5 * sigma ** 2) * dt + sigma * math.sqrt(dt) * shocks
+            log_paths = np.cumsum(increments, axis=1)
+            if initial is not None:
+                log_paths += initial
+            return log_paths
+
+        # Exact Ornstein-Uhlenbeck step for mean-reverting crops, GBM for the rest
+        reverting = self.kappas > 0
+        kappas = np.where(reverting, self.kappas, 1.0)
+        decay = np.where(reverting, np.exp(-kappas * dt), 1.0)
+        scale = np.where(reverting, sigma * np.sqrt((1 - np.exp(-2 * kappas * dt)) / (2 * kappas)), sigma * math.sqrt(dt))
+        target = np.where(reverting, self.long_run - np.log(self.spots), 0.0)
+        drift = np.where(reverting, 0.0, (self.drifts - 0.5 * sigma ** 2) * dt)
+
+        log_paths = np.empty_like(shocks)
+        current = np.zeros(shocks.shape[0::2]) if initial is None else np.broadcast_to(initial, shocks.shape[0::2]).copy()
+        for step in range(shocks.shape[1]):
+            current = target + (current - target) * decay + drift + scale * shocks[:, step]
+            log_paths[:, step] = current
+        return log_paths
+
+    def _seasonal(self, years: np.ndarray) -> np.ndarray:
+        """Seasonal log factor after each elapsed time, relative to the start date"""
+        if not self.amplitudes.any():
+            return np.zeros((len(years), len(self.crops)))
+        day0 = self.start.timetuple().tm_yday
+        days = day0 + np.asarray(years)[:, None] * DAYS_PER_YEAR
+        angle = 2 * np.pi * (days - self.peaks) / DAYS_PER_YEAR
+        angle0 = 2 * np.pi * (day0 - self.peaks) / DAYS_PER_YEAR
+        return self.amplitudes * (np.cos(angle) - np.cos(angle0))
+
+
+_live: Optional[PriceSimulator] = None
+_live_lock = threading.Lock()
+
+
+def get_live_simulator(base_prices: Dict[str, float]) -> PriceSimulator:
+    """Process-wide simulator whose live path backs the oracle's simulated prices"""
+    global _live
+    with _live_lock:
+        if _live is None or _live.crops != list(base_prices):
+            _live = PriceSimulator(list(base_prices), list(base_prices.values()), seed=Config.SIMULATOR_SEED)
+        return _live
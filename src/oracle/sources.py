@@ -0,0 +1,263 @@
+import csv
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Sources are fetched from inside the oracle's fetch pool, so they get their own threads
+_source_pool = ThreadPoolExecutor(max_workers=2 * Config.PRICE_FETCH_WORKERS, thread_name_prefix='price-source')
+
+
+class SourceQuote:
+    """One source's price for a crop"""
+
+    __slots__ = ('source', 'price', 'fetched_at')
+
+    def __init__(self, source: str, price: float, fetched_at: float):
+        self.source = source
+        self.price = price
+        self.fetched_at = fetched_at
+
+
+class AggregatePrice:
+    """A combined price and the sources it was built from"""
+
+    __slots__ = ('price', 'fetched_at', 'sources', 'rejected')
+
+    def __init__(self, price: float, fetched_at: float, sources: List[str], rejected: List[str]):
+        self.price = price
+        self.fetched_at = fetched_at
+        self.sources = sources
+        self.rejected = rejected
+
+    @property
+    def source(self) -> str:
+        """Comma-separated source names, as stored with the price"""
+        return ','.join(self.sources)
+
+
+class PriceSource:
+    """
+    A provider of crop prices
+
+    Subclasses implement fetch, returning zero or more quotes for a crop (a
+    feed directory may hold several markets). Returning an empty list means
+    the source has nothing usable right now; exceptions are treated the same.
+    """
+
+    name = 'source'
+
+    def __init__(self, weight: Optional[float] = None):
+        self.weight = weight if weight is not None else Config.PRICE_SOURCE_WEIGHTS.get(self.name, 1.0)
+
+    def fetch(self, crop_name: str) -> List[SourceQuote]:
+        raise NotImplementedError
+
+
+class AlphaVantageSource(PriceSource):
+    """Alpha Vantage quotes, subject to the oracle's circuit breaker and call quota"""
+
+    name = 'alpha_vantage'
+
+    def __init__(self, oracle, weight: Optional[float] = None):
+        super().__init__(weight)
+        self.oracle = oracle
+
+    def fetch(self, crop_name: str) -> List[SourceQuote]:
+        if self.oracle.breaker.state == self.oracle.breaker.OPEN:
+            logger.info(f"Alpha Vantage circuit open, skipping {crop_name}")
+            return []
+        if not self.oracle.quota.acquire():
+            return []
+        price = self.oracle._get_alpha_vantage_price(crop_name)
+        return [SourceQuote(self.name, price, time.time())] if price else []
+
+
+class FileFeedSource(PriceSource):
+    """
+    Local market prices from CSV or JSON files dropped into a directory
+
+    Each file is its own source, named feed:<file name>. CSV files need
+    crop and price columns and may have a timestamp column (epoch seconds or
+    ISO 8601); JSON files hold a list of objects with the same keys. Rows
+    without a timestamp take the file's modification time. The newest row
+    per crop is used, and files are only re-parsed when they change.
+    """
+
+    name = 'feed'
+
+    def __init__(self, directory: str, weight: Optional[float] = None):
+        super().__init__(weight)
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._parsed: Dict[str, Tuple[float, Dict[str, SourceQuote]]] = {}
+
+    def fetch(self, crop_name: str) -> List[SourceQuote]:
+        quotes = []
+        for path in self._files():
+            quote = self._read(path).get(crop_name)
+            if quote is not None:
+                quotes.append(quote)
+        return quotes
+
+    def _files(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(('.csv', '.json'))
+        )
+
+    def _read(self, path: str) -> Dict[str, SourceQuote]:
+        """Newest quote per crop in a file, parsed once per modification"""
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            parsed = self._parsed.get(path)
+            if parsed is not None and parsed[0] == mtime:
+                return parsed[1]
+
+        source = f"{self.name}:{os.path.splitext(os.path.basename(path))[0]}"
+        latest: Dict[str, SourceQuote] = {}
+        try:
+            for row in self._rows(path):
+                crop = str(row['crop']).strip().lower()
+                quote = SourceQuote(source, float(row['price']), _timestamp(row.get('timestamp'), mtime))
+                if crop not in latest or quote.fetched_at >= latest[crop].fetched_at:
+                    latest[crop] = quote
+        except (OSError, KeyError, TypeError, ValueError) as e:
+            logger.error(f"Could not read price feed {path}: {str(e)}")
+            latest = {}
+
+        with self._lock:
+            self._parsed[path] = (mtime, latest)
+        return latest
+
+    def _rows(self, path: str) -> Iterable[dict]:
+        with open(path, newline='') as f:
+            if path.endswith('.json'):
+                data = json.load(f)
+                return data.get('prices', []) if isinstance(data, dict) else data
+            return list(csv.DictReader(f))
+
+
+class SimulatedSource(PriceSource):
+    """Simulated prices, used only when no real source has a price"""
+
+    name = 'simulated'
+
+    def __init__(self, oracle, weight: Optional[float] = None):
+        super().__init__(weight)
+        self.oracle = oracle
+
+    def fetch(self, crop_name: str) -> List[SourceQuote]:
+        return [SourceQuote(self.name, self.oracle._get_simulated_price(crop_name), time.time())]
+
+
+def _timestamp(value, default: float) -> float:
+    """Epoch seconds from an epoch number or ISO 8601 string"""
+    if value in (None, ''):
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(str(value)).timestamp()
+
+
+def default_sources(oracle) -> List[PriceSource]:
+    """Real sources configured for this deployment"""
+    sources: List[PriceSource] = [AlphaVantageSource(oracle)]
+    if Config.PRICE_FEED_DIR:
+        sources.append(FileFeedSource(Config.PRICE_FEED_DIR))
+    return sources
+
+
+def fetch_quotes(sources: List[PriceSource], crop_name: str, timeout: Optional[float] = None) -> List[Tuple[SourceQuote, float]]:
+    """
+    Fetch a crop from every source concurrently
+
+    Sources that fail or do not answer within the timeout are skipped.
+
+    Returns:
+        (quote, source weight) pairs
+    """
+    futures = {_source_pool.submit(source.fetch, crop_name): source for source in sources}
+    done, _ = wait(futures, timeout=timeout)
+    quotes = []
+    for future in done:
+        source = futures[future]
+        try:
+            quotes.extend((quote, source.weight) for quote in future.result())
+        except Exception as e:
+            logger.error(f"Price source {source.name} failed for {crop_name}: {str(e)}")
+    return quotes
+
+
+def weighted_median(values: np.ndarray, weights: np.ndarray) -> float:
+    """Smallest value at which the cumulative weight reaches half the total"""
+    order = np.argsort(values, kind='stable')
+    cumulative = np.cumsum(weights[order])
+    return float(values[order][np.searchsorted(cumulative, cumulative[-1] / 2.0)])
+
+
+def aggregate(
+    quotes: List[Tuple[SourceQuote, float]],
+    now: Optional[float] = None,
+    half_life: Optional[float] = None,
+    max_age: Optional[float] = None,
+    mad_threshold: Optional[float] = None,
+    floor: Optional[float] = None
+) -> Optional[AggregatePrice]:
+    """
+    Combine source quotes into one price
+
+    Quotes older than max_age are dropped and the rest weighted by source
+    weight halved every half_life seconds of age. Quotes further than
+    mad_threshold scaled median absolute deviations from the weighted median
+    (and more than floor, relative, away from it) are rejected as outliers,
+    and the weighted median of the survivors is the price.
+
+    Returns:
+        The combined price, or None if no quote is usable
+    """
+    now = now if now is not None else time.time()
+    half_life = half_life or Config.PRICE_SOURCE_HALF_LIFE
+    max_age = max_age or Config.PRICE_SOURCE_MAX_AGE
+    mad_threshold = mad_threshold or Config.PRICE_OUTLIER_MADS
+    floor = floor if floor is not None else Config.PRICE_OUTLIER_FLOOR
+
+    usable = [(quote, weight) for quote, weight in quotes if quote.price and quote.price > 0 and now - quote.fetched_at <= max_age]
+    if not usable:
+        return None
+
+    prices = np.array([quote.price for quote, _ in usable], dtype=float)
+    ages = np.maximum(now - np.array([quote.fetched_at for quote, _ in usable], dtype=float), 0.0)
+    weights = np.array([weight for _, weight in usable], dtype=float) * 0.5 ** (ages / half_life)
+
+    median = weighted_median(prices, weights)
+    deviation = np.abs(prices - median)
+    # 1.4826 scales the MAD to a standard deviation for normally distributed prices
+    band = max(mad_threshold * 1.4826 * float(np.median(deviation)), floor * median)
+    keep = deviation <= band
+
+    price = weighted_median(prices[keep], weights[keep])
+    kept = [usable[i][0] for i in np.flatnonzero(keep)]
+    rejected = [usable[i][0].source for i in np.flatnonzero(~keep)]
+    if rejected:
+        logger.warning(f"Rejected outlier prices from {', '.join(rejected)} (median {median:.2f})")
+    return AggregatePrice(
+        round(price, 2),
+        max(quote.fetched_at for quote in kept),
+        sorted(quote.source for quote in kept),
+        rejected
+    )
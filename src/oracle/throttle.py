@@ -0,0 +1,160 @@
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple
+
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quota_buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight block on its result (or exception) instead of repeating the
+    work. Nothing is cached once the call returns.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self.coalesced = 0
+
+    def do(self, key: str, func: Callable, timeout: Optional[float] = None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return call.result(timeout)
+
+        try:
+            result = func()
+            call.set_result(result)
+            return result
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class QuotaLimiter:
+    """
+    Token buckets for an upstream's call quotas, shared by every process
+
+    Each limit is (capacity, period): the bucket holds at most capacity
+    tokens and refills continuously at capacity / period per second. A call
+    takes one token from every bucket or none at all. Buckets live in the
+    shared price cache file, and each acquire is one IMMEDIATE transaction,
+    so workers on the node draw from the same quota.
+    """
+
+    def __init__(self, name: str, limits: Dict[str, Tuple[int, float]], path: Optional[str] = None):
+        self.name = name
+        self.limits = limits
+        self.path = path or Config.PRICE_CACHE_PATH
+        self._local = threading.local()
+        self._connect().executescript(_SCHEMA)
+
+    def acquire(self, cost: float = 1.0) -> bool:
+        """Take cost tokens from every bucket if all of them have enough"""
+        connection = self._connect()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            tokens = self._refilled(connection, now)
+            granted = all(level >= cost for level in tokens.values())
+            if granted:
+                tokens = {bucket: level - cost for bucket, level in tokens.items()}
+            connection.executemany(
+                """
+                INSERT INTO quota_buckets (name, tokens, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+                """,
+                [(self._key(bucket), level, now) for bucket, level in tokens.items()]
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        if not granted:
+            logger.warning(f"{self.name} quota exhausted")
+        return granted
+
+    def remaining(self) -> Dict[str, float]:
+        """Tokens currently available in each bucket"""
+        return self._refilled(self._connect(), time.time())
+
+    def spacing(self, keys: int) -> float:
+        """
+        Seconds between refreshes of each of `keys` items that the quota sustains
+
+        Spending the quota evenly means every item is refreshed once per
+        keys * period / capacity seconds of the tightest bucket.
+        """
+        return max(keys * period / capacity for capacity, period in self.limits.values())
+
+    def _refilled(self, connection: sqlite3.Connection, now: float) -> Dict[str, float]:
+        rows = dict(
+            (name, (tokens, updated_at))
+            for name, tokens, updated_at in connection.execute(
+                "SELECT name, tokens, updated_at FROM quota_buckets WHERE name LIKE ?",
+                (f"{self.name}:%",)
+            )
+        )
+        tokens = {}
+        for bucket, (capacity, period) in self.limits.items():
+            level, updated_at = rows.get(self._key(bucket), (capacity, now))
+            tokens[bucket] = min(capacity, level + max(now - updated_at, 0.0) * capacity / period)
+        return tokens
+
+    def _key(self, bucket: str) -> str:
+        return f"{self.name}:{bucket}"
+
+    def _connect(self) -> sqlite3.Connection:
+        """One autocommit connection per thread"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+
+_limiters: Dict[Tuple[str, str], QuotaLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_alpha_vantage_quota(path: Optional[str] = None) -> QuotaLimiter:
+    """Process-wide Alpha Vantage quota limiter for a cache file"""
+    path = path or Config.PRICE_CACHE_PATH
+    with _limiters_lock:
+        key = ('alpha_vantage', path)
+        if key not in _limiters:
+            _limiters[key] = QuotaLimiter(
+                'alpha_vantage',
+                {
+                    'minute': (Config.ALPHA_VANTAGE_CALLS_PER_MINUTE, 60.0),
+                    'day': (Config.ALPHA_VANTAGE_CALLS_PER_DAY, 86400.0)
+                },
+                path
+            )
+        return _limiters[key]
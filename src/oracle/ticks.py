@@ -0,0 +1,168 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+TICK_DTYPE = np.dtype([('ts', '<f8'), ('price', '<f8')])
+OHLC_DTYPE = np.dtype([
+    ('ts', '<f8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('count', '<i8')
+])
+INTERVALS = {
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400
+}
+SEGMENT_SECONDS = 86400
+SEGMENT_SUFFIX = '.ticks'
+
+
+class TickStore:
+    """
+    Append-only per-crop price tick store
+
+    Ticks are fixed-size (timestamp, price) float64 records appended to one
+    segment file per crop per UTC day, named by the day's start time, so the
+    directory listing is the time index. Segments are read through read-only
+    memory maps and searched with binary search, and OHLC bars are built per
+    segment so results can be streamed without loading a whole range.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or Config.TICK_STORE_PATH
+        self._lock = threading.Lock()
+
+    def append(self, crop: str, price: float, ts: Optional[float] = None):
+        """Record one tick"""
+        self.append_many(crop, [ts if ts is not None else time.time()], [price])
+
+    def append_many(self, crop: str, timestamps, prices):
+        """Record many ticks, routing each to its day's segment"""
+        records = np.empty(len(timestamps), dtype=TICK_DTYPE)
+        records['ts'] = timestamps
+        records['price'] = prices
+        if not len(records):
+            return
+
+        directory = self._crop_dir(crop)
+        os.makedirs(directory, exist_ok=True)
+        segments = (records['ts'] // SEGMENT_SECONDS).astype(np.int64)
+        with self._lock:
+            for segment in np.unique(segments):
+                # O_APPEND keeps whole-record writes from several processes from interleaving
+                fd = os.open(
+                    self._segment_path(crop, int(segment) * SEGMENT_SECONDS),
+                    os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+                    0o644
+                )
+                try:
+                    os.write(fd, records[segments == segment].tobytes())
+                finally:
+                    os.close(fd)
+
+    def iter_range(self, crop: str, start: float, end: float) -> Iterator[np.ndarray]:
+        """Yield ticks in [start, end) one segment at a time, in time order"""
+        for segment_start in self._segments(crop, start, end):
+            ticks = self._load(self._segment_path(crop, segment_start))
+            if ticks is None:
+                continue
+            lo = np.searchsorted(ticks['ts'], start, side='left')
+            hi = np.searchsorted(ticks['ts'], end, side='left')
+            if hi > lo:
+                yield ticks[lo:hi]
+
+    def range(self, crop: str, start: float, end: float) -> np.ndarray:
+        """All ticks in [start, end) as one array"""
+        chunks = list(self.iter_range(crop, start, end))
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=TICK_DTYPE)
+
+    def iter_ohlc(self, crop: str, start: float, end: float, interval: str) -> Iterator[np.ndarray]:
+        """Yield OHLC bars for [start, end) one segment at a time"""
+        seconds = INTERVALS[interval]
+        for ticks in self.iter_range(crop, start, end):
+            yield downsample(ticks, seconds)
+
+    def ohlc(self, crop: str, start: float, end: float, interval: str) -> np.ndarray:
+        """OHLC bars for [start, end)"""
+        chunks = list(self.iter_ohlc(crop, start, end, interval))
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=OHLC_DTYPE)
+
+    def crops(self) -> List[str]:
+        """Crops that have any ticks"""
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(os.listdir(self.path))
+
+    def _crop_dir(self, crop: str) -> str:
+        return os.path.join(self.path, crop)
+
+    def _segment_path(self, crop: str, segment_start: int) -> str:
+        return os.path.join(self._crop_dir(crop), f"{segment_start}{SEGMENT_SUFFIX}")
+
+    def _segments(self, crop: str, start: float, end: float) -> List[int]:
+        """Start times of segments overlapping [start, end)"""
+        directory = self._crop_dir(crop)
+        if not os.path.isdir(directory):
+            return []
+        starts = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+        return [s for s in starts if s + SEGMENT_SECONDS > start and s < end]
+
+    def _load(self, path: str) -> Optional[np.ndarray]:
+        """Memory-map a segment, sorting it if concurrent writers appended out of order"""
+        size = os.path.getsize(path)
+        count = size // TICK_DTYPE.itemsize
+        if count == 0:
+            return None
+        if size % TICK_DTYPE.itemsize:
+            logger.warning(f"Ignoring partial record at the end of {path}")
+        ticks = np.memmap(path, dtype=TICK_DTYPE, mode='r', shape=(count,))
+        if count > 1 and np.any(np.diff(ticks['ts']) < 0):
+            ticks = np.sort(ticks, order='ts', kind='stable')
+        return ticks
+
+
+def downsample(ticks: np.ndarray, seconds: int) -> np.ndarray:
+    """Aggregate time-ordered ticks into OHLC bars of the given width"""
+    if not len(ticks):
+        return np.empty(0, dtype=OHLC_DTYPE)
+    prices = np.asarray(ticks['price'])
+    buckets = np.floor(np.asarray(ticks['ts']) / seconds).astype(np.int64)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+    ends = np.append(starts[1:], len(prices))
+
+    bars = np.empty(len(starts), dtype=OHLC_DTYPE)
+    bars['ts'] = buckets[starts] * seconds
+    bars['open'] = prices[starts]
+    bars['high'] = np.maximum.reduceat(prices, starts)
+    bars['low'] = np.minimum.reduceat(prices, starts)
+    bars['close'] = prices[ends - 1]
+    bars['count'] = ends - starts
+    return bars
+
+
+_stores: Dict[str, TickStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_tick_store(path: Optional[str] = None) -> TickStore:
+    """Process-wide tick store for a directory"""
+    path = path or Config.TICK_STORE_PATH
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = TickStore(path)
+        return _stores[path]
@@ -0,0 +1,274 @@
+import json
+import logging
+import math
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from config.config import Config
+from src.database.db import session_factory
+from src.database.models import CropVolatility
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_YEAR = 365.0 * 86400
+
+
+class RealizedWindow:
+    """
+    Realized variance over a sliding time window in fixed-size buckets
+
+    The window is split into `buckets` slots of equal width, used as a ring.
+    A tick adds its squared log return and elapsed time to the current slot,
+    clearing the slot first if it still holds an older period, so updates are
+    O(1) and memory does not grow with the tick rate.
+    """
+
+    def __init__(self, seconds: float, buckets: int):
+        self.seconds = seconds
+        self.buckets = buckets
+        self.width = seconds / buckets
+        self.ids = [-1] * buckets
+        self.squares = [0.0] * buckets
+        self.elapsed = [0.0] * buckets
+
+    def add(self, ts: float, squared_return: float, dt: float):
+        bucket = int(ts // self.width)
+        slot = bucket % self.buckets
+        if self.ids[slot] != bucket:
+            self.ids[slot] = bucket
+            self.squares[slot] = 0.0
+            self.elapsed[slot] = 0.0
+        self.squares[slot] += squared_return
+        self.elapsed[slot] += dt
+
+    def volatility(self, now: float) -> Optional[float]:
+        """Annualized volatility of returns in the window ending now"""
+        oldest = int(now // self.width) - self.buckets
+        squares = elapsed = 0.0
+        for bucket, square, dt in zip(self.ids, self.squares, self.elapsed):
+            if bucket > oldest:
+                squares += square
+                elapsed += dt
+        if elapsed <= 0:
+            return None
+        return math.sqrt(squares / (elapsed / SECONDS_PER_YEAR))
+
+    def to_dict(self) -> dict:
+        return {'ids': self.ids, 'squares': self.squares, 'elapsed': self.elapsed}
+
+    def load(self, state: dict):
+        if len(state.get('ids', [])) == self.buckets:
+            self.ids = list(state['ids'])
+            self.squares = list(state['squares'])
+            self.elapsed = list(state['elapsed'])
+
+
+class VolatilityEstimator:
+    """
+    Online volatility estimates for one crop
+
+    Log returns are measured between ticks at least VOLATILITY_MIN_INTERVAL
+    apart (closer ticks are folded into the next return) and normalised by
+    the time between them, so irregular fetches give comparable annualized
+    figures. An EWMA of the variance rate decays with a half-life in
+    seconds, and each realized window keeps its own bucketed ring.
+    """
+
+    def __init__(
+        self,
+        half_life: Optional[float] = None,
+        windows: Optional[Dict[str, float]] = None,
+        buckets: Optional[int] = None,
+        min_interval: Optional[float] = None
+    ):
+        self.half_life = half_life or Config.VOLATILITY_EWMA_HALF_LIFE
+        self.min_interval = min_interval if min_interval is not None else Config.VOLATILITY_MIN_INTERVAL
+        buckets = buckets or Config.VOLATILITY_BUCKETS
+        self.windows = {
+            name: RealizedWindow(seconds, buckets)
+            for name, seconds in (windows or Config.VOLATILITY_WINDOWS).items()
+        }
+        self.anchor_price: Optional[float] = None
+        self.anchor_ts: Optional[float] = None
+        self.ewma_variance: Optional[float] = None
+        self.observations = 0
+
+    def update(self, price: float, ts: float) -> bool:
+        """
+        Add a tick
+
+        Returns:
+            True if the tick completed a return and moved the estimates
+        """
+        if price is None or price <= 0:
+            return False
+        price, ts = float(price), float(ts)
+        if self.anchor_price is None:
+            self.anchor_price, self.anchor_ts = price, ts
+            return False
+        dt = ts - self.anchor_ts
+        if dt < self.min_interval:
+            return False
+
+        squared_return = math.log(price / self.anchor_price) ** 2
+        rate = squared_return / (dt / SECONDS_PER_YEAR)
+        if self.ewma_variance is None:
+            self.ewma_variance = rate
+        else:
+            weight = 0.5 ** (dt / self.half_life)
+            self.ewma_variance = weight * self.ewma_variance + (1 - weight) * rate
+        for window in self.windows.values():
+            window.add(ts, squared_return, dt)
+
+        self.anchor_price, self.anchor_ts = price, ts
+        self.observations += 1
+        return True
+
+    @property
+    def ewma_volatility(self) -> Optional[float]:
+        return math.sqrt(self.ewma_variance) if self.ewma_variance is not None else None
+
+    def realized(self, now: Optional[float] = None) -> Dict[str, Optional[float]]:
+        """Annualized realized volatility per window"""
+        now = now if now is not None else time.time()
+        return {name: window.volatility(now) for name, window in self.windows.items()}
+
+    def to_dict(self) -> dict:
+        return {
+            'anchor_price': self.anchor_price,
+            'anchor_ts': self.anchor_ts,
+            'ewma_variance': self.ewma_variance,
+            'observations': self.observations,
+            'windows': {name: window.to_dict() for name, window in self.windows.items()}
+        }
+
+    def load(self, state: dict):
+        self.anchor_price = state.get('anchor_price')
+        self.anchor_ts = state.get('anchor_ts')
+        self.ewma_variance = state.get('ewma_variance')
+        self.observations = state.get('observations', 0)
+        for name, window_state in state.get('windows', {}).items():
+            if name in self.windows:
+                self.windows[name].load(window_state)
+
+
+class VolatilityTracker:
+    """
+    Per-crop volatility estimates shared through the database
+
+    record() loads a crop's estimator state, applies the tick and writes it
+    back in one short transaction. Only the worker holding a crop's refresh
+    lease records its ticks, so updates do not race. Reads are served from
+    memory and reloaded after VOLATILITY_CACHE_TTL so every process sees
+    recent estimates without touching the database per quote.
+    """
+
+    def __init__(self, session_factory: Callable = session_factory, cache_ttl: Optional[float] = None):
+        self.session_factory = session_factory
+        self.cache_ttl = cache_ttl if cache_ttl is not None else Config.VOLATILITY_CACHE_TTL
+        self._lock = threading.Lock()
+        self._estimates: Dict[str, dict] = {}
+        self._loaded_at: Optional[float] = None
+
+    def record(self, crop_name: str, price: float, ts: float) -> VolatilityEstimator:
+        """Apply one tick to a crop's persisted estimator"""
+        session = self.session_factory()
+        try:
+            row = session.get(CropVolatility, crop_name)
+            estimator = VolatilityEstimator()
+            if row is None:
+                row = CropVolatility(crop=crop_name)
+                session.add(row)
+            elif row.state:
+                estimator.load(json.loads(row.state))
+
+            estimator.update(price, ts)
+            row.state = json.dumps(estimator.to_dict())
+            row.observations = estimator.observations
+            row.ewma_volatility = estimator.ewma_volatility
+            row.updated_at = datetime.fromtimestamp(ts)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+        with self._lock:
+            self._estimates[crop_name] = self._summarise(estimator)
+        return estimator
+
+    def estimate(self, crop_name: str) -> Optional[dict]:
+        """Latest estimates for a crop: observations, EWMA and realized volatilities"""
+        self._refresh()
+        with self._lock:
+            return self._estimates.get(crop_name)
+
+    def volatility(self, crop_name: str) -> Optional[float]:
+        """
+        Annualized volatility to price with, or None without enough data
+
+        The EWMA estimate once VOLATILITY_MIN_OBSERVATIONS returns have been
+        seen, clamped to [VOLATILITY_FLOOR, VOLATILITY_CAP].
+        """
+        estimate = self.estimate(crop_name)
+        if not estimate or estimate['ewma'] is None or estimate['observations'] < Config.VOLATILITY_MIN_OBSERVATIONS:
+            return None
+        return min(max(estimate['ewma'], Config.VOLATILITY_FLOOR), Config.VOLATILITY_CAP)
+
+    def volatilities(self, crops) -> Dict[str, float]:
+        """Volatility per crop: the estimate where usable, else the configured default"""
+        result = {}
+        for crop in crops:
+            estimated = self.volatility(crop)
+            result[crop] = estimated if estimated is not None else Config.CROP_VOLATILITIES.get(crop, Config.DEFAULT_VOLATILITY)
+        return result
+
+    def _refresh(self):
+        """Reload every crop's estimates once the in-memory copy is older than the TTL"""
+        now = time.monotonic()
+        with self._lock:
+            if self._loaded_at is not None and now - self._loaded_at < self.cache_ttl:
+                return
+            self._loaded_at = now
+
+        session = self.session_factory()
+        try:
+            rows = session.query(CropVolatility).all()
+            estimates = {}
+            for row in rows:
+                estimator = VolatilityEstimator()
+                if row.state:
+                    estimator.load(json.loads(row.state))
+                estimates[row.crop] = self._summarise(estimator)
+        except Exception as e:
+            logger.error(f"Could not load volatility estimates: {str(e)}")
+            return
+        finally:
+            session.close()
+
+        with self._lock:
+            self._estimates = estimates
+
+    def _summarise(self, estimator: VolatilityEstimator) -> dict:
+        return {
+            'observations': estimator.observations,
+            'ewma': estimator.ewma_volatility,
+            'realized': estimator.realized(),
+            'as_of': datetime.fromtimestamp(estimator.anchor_ts) if estimator.anchor_ts else None
+        }
+
+
+_tracker: Optional[VolatilityTracker] = None
+_tracker_lock = threading.Lock()
+
+
+def get_volatility_tracker() -> VolatilityTracker:
+    """Process-wide volatility tracker"""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = VolatilityTracker()
+        return _tracker
@@ -1,3 +1,7 @@
 from .rapyd import RapydClient
+from .money import MINOR_UNITS, credit_wallet, debit_wallet, format_amount, from_minor, to_minor, to_minor_many
 
-__all__ = ['RapydClient'] 
\ No newline at end of file
+__all__ = [
+    'RapydClient', 'MINOR_UNITS', 'credit_wallet', 'debit_wallet', 'format_amount',
+    'from_minor', 'to_minor', 'to_minor_many'
+]
@@ -0,0 +1,243 @@
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func, insert, update
+
+from config.config import Config
+from src.database.models import BalanceSnapshot, LedgerEntry, Wallet
+from .money import credit_wallet, debit_wallet
+
+logger = logging.getLogger(__name__)
+
+# Account name of the wallet leg of every journal
+WALLET_ACCOUNT = 'wallet'
+
+# Platform account on the other side of each kind of movement
+COUNTER_ACCOUNTS = {
+    'deposit': 'rapyd_clearing',
+    'withdrawal': 'rapyd_clearing',
+    'premium': 'premium_income',
+    'premium_refund': 'premium_income',
+    'payout': 'payout_expense',
+    'test_funding': 'test_funding',
+    'opening': 'opening_balance'
+}
+
+
+def journal_entries(
+    wallet_id: int,
+    amount: int,
+    currency: str,
+    entry_type: str,
+    future_id: Optional[int] = None,
+    created_at: Optional[datetime] = None
+) -> List[dict]:
+    """
+    The two legs of one movement
+
+    Args:
+        amount: Minor units added to the wallet (negative to take them out)
+    """
+    journal_id = uuid.uuid4().hex
+    created_at = created_at or datetime.now()
+    common = {
+        'journal_id': journal_id,
+        'currency': currency,
+        'entry_type': entry_type,
+        'future_id': future_id,
+        'created_at': created_at
+    }
+    return [
+        dict(common, account=WALLET_ACCOUNT, wallet_id=wallet_id, amount=amount),
+        dict(common, account=COUNTER_ACCOUNTS[entry_type], wallet_id=None, amount=-amount)
+    ]
+
+
+def post_many(session, postings: Iterable[dict]) -> int:
+    """
+    Journal movements already applied to wallet balances, in one INSERT
+
+    Each posting has the journal_entries arguments as keys.
+
+    Returns:
+        Number of journals written
+    """
+    rows = [entry for posting in postings for entry in journal_entries(**posting)]
+    if rows:
+        session.execute(insert(LedgerEntry), rows)
+    return len(rows) // 2
+
+
+def post(session, wallet_id: int, amount: int, currency: str, entry_type: str, future_id: Optional[int] = None) -> str:
+    """Journal one movement already applied to a wallet balance, returning its journal id"""
+    rows = journal_entries(wallet_id, amount, currency, entry_type, future_id)
+    session.execute(insert(LedgerEntry), rows)
+    return rows[0]['journal_id']
+
+
+def debit(session, wallet_id: int, amount: int, currency: str, entry_type: str, future_id: Optional[int] = None) -> Optional[str]:
+    """
+    Take amount from a wallet if its balance covers it, and journal it
+
+    Both happen in the caller's transaction.
+
+    Returns:
+        The journal id, or None if the balance was insufficient (nothing written)
+    """
+    if not debit_wallet(session, wallet_id, amount):
+        return None
+    return post(session, wallet_id, -amount, currency, entry_type, future_id)
+
+
+def credit(session, wallet_id: int, amount: int, currency: str, entry_type: str, future_id: Optional[int] = None):
+    """Add amount to a wallet and journal it in the caller's transaction"""
+    credit_wallet(session, wallet_id, amount)
+    post(session, wallet_id, amount, currency, entry_type, future_id)
+
+
+def link_future(session, journal_id: str, future_id: int):
+    """Attach both legs of a journal written before its future existed to that future"""
+    session.execute(
+        update(LedgerEntry)
+        .where(LedgerEntry.journal_id == journal_id)
+        .values(future_id=future_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def wallet_balance(session, wallet_id: int) -> int:
+    """A wallet's balance from the ledger: its last snapshot plus the entries since"""
+    snapshot = session.get(BalanceSnapshot, wallet_id)
+    since = snapshot.last_entry_id if snapshot else 0
+    tail = session.query(func.coalesce(func.sum(LedgerEntry.amount), 0)).filter(
+        LedgerEntry.wallet_id == wallet_id,
+        LedgerEntry.id > since
+    ).scalar()
+    return (snapshot.balance if snapshot else 0) + int(tail)
+
+
+def snapshot_balances(session, lag: Optional[float] = None, now: Optional[datetime] = None) -> int:
+    """
+    Fold ledger entries into per-wallet balance snapshots
+
+    Only entries older than LEDGER_SNAPSHOT_LAG are folded in: ids are
+    allocated before commit, so a just-written id can become visible after
+    a larger one. Each run reads only the entries since the previous
+    snapshot, and moves every snapshot forward so reads stay short.
+
+    Returns:
+        Number of wallets whose balance changed
+    """
+    now = now or datetime.now()
+    lag = Config.LEDGER_SNAPSHOT_LAG if lag is None else lag
+    upto = session.query(func.max(LedgerEntry.id)).filter(
+        LedgerEntry.created_at <= now - timedelta(seconds=lag)
+    ).scalar()
+    if upto is None:
+        return 0
+
+    changes = (
+        session.query(LedgerEntry.wallet_id, func.sum(LedgerEntry.amount), BalanceSnapshot.balance)
+        .outerjoin(BalanceSnapshot, BalanceSnapshot.wallet_id == LedgerEntry.wallet_id)
+        .filter(
+            LedgerEntry.account == WALLET_ACCOUNT,
+            LedgerEntry.id <= upto,
+            LedgerEntry.id > func.coalesce(BalanceSnapshot.last_entry_id, 0)
+        )
+        .group_by(LedgerEntry.wallet_id, BalanceSnapshot.balance)
+        .all()
+    )
+
+    updates, inserts = [], []
+    for wallet_id, delta, balance in changes:
+        row = {'wallet_id': wallet_id, 'balance': (balance or 0) + int(delta), 'last_entry_id': upto, 'taken_at': now}
+        (updates if balance is not None else inserts).append(row)
+    if updates:
+        session.bulk_update_mappings(BalanceSnapshot, updates)
+    if inserts:
+        session.bulk_insert_mappings(BalanceSnapshot, inserts)
+    session.execute(
+        update(BalanceSnapshot)
+        .where(BalanceSnapshot.last_entry_id < upto)
+        .values(last_entry_id=upto, taken_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    return len(changes)
+
+
+def verify_ledger(session, batch_size: Optional[int] = None, limit: int = 100) -> dict:
+    """
+    Re-derive every balance from the journal in one streaming pass
+
+    Checks that every journal sums to zero, that each wallet's stored
+    balance equals the sum of its entries, and that its snapshot plus the
+    entries after it agree too. Memory grows with the number of wallets,
+    not entries.
+
+    Args:
+        batch_size: Entries fetched per round trip
+        limit: Most problems of each kind to list
+
+    Returns:
+        Counts, platform account totals and the first problems found
+    """
+    batch_size = batch_size or Config.LEDGER_VERIFY_BATCH_SIZE
+    snapshots = {
+        wallet_id: (balance, last_entry_id)
+        for wallet_id, balance, last_entry_id in session.query(
+            BalanceSnapshot.wallet_id, BalanceSnapshot.balance, BalanceSnapshot.last_entry_id
+        )
+    }
+
+    derived: Dict[int, int] = defaultdict(int)
+    tails: Dict[int, int] = defaultdict(int)
+    accounts: Dict[tuple, int] = defaultdict(int)
+    # Journals with a leg seen but not yet balanced: id -> [sum, legs]
+    open_journals: Dict[str, list] = {}
+    entries = 0
+
+    rows = (
+        session.query(LedgerEntry.id, LedgerEntry.journal_id, LedgerEntry.account, LedgerEntry.wallet_id, LedgerEntry.amount, LedgerEntry.currency)
+        .order_by(LedgerEntry.id)
+        .yield_per(batch_size)
+    )
+    for entry_id, journal_id, account, wallet_id, amount, currency in rows:
+        entries += 1
+        if account == WALLET_ACCOUNT:
+            derived[wallet_id] += amount
+            snapshot = snapshots.get(wallet_id)
+            if snapshot is None or entry_id > snapshot[1]:
+                tails[wallet_id] += amount
+        else:
+            accounts[(account, currency)] += amount
+
+        journal = open_journals.setdefault(journal_id, [0, 0])
+        journal[0] += amount
+        journal[1] += 1
+        if journal[0] == 0 and journal[1] >= 2:
+            del open_journals[journal_id]
+
+    mismatched = []
+    wallets = 0
+    for wallet_id, balance in session.query(Wallet.id, Wallet.balance).order_by(Wallet.id).yield_per(batch_size):
+        wallets += 1
+        ledger = derived.pop(wallet_id, 0)
+        snapshot_balance, _ = snapshots.get(wallet_id, (0, 0))
+        from_snapshot = snapshot_balance + tails.get(wallet_id, 0)
+        if balance != ledger or from_snapshot != ledger:
+            mismatched.append({'wallet_id': wallet_id, 'balance': balance, 'ledger': ledger, 'snapshot': from_snapshot})
+
+    return {
+        'entries': entries,
+        'wallets': wallets,
+        'mismatched_count': len(mismatched),
+        'mismatched': mismatched[:limit],
+        'unbalanced_count': len(open_journals),
+        'unbalanced_journals': list(open_journals)[:limit],
+        'orphan_wallet_ids': sorted(derived)[:limit],
+        'accounts': {f"{account}:{currency}": total for (account, currency), total in sorted(accounts.items())},
+        'ok': not mismatched and not open_journals and not derived
+    }
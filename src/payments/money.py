@@ -0,0 +1,63 @@
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Iterable, Union
+
+import numpy as np
+from sqlalchemy import update
+
+from src.database.models import Wallet
+
+# Amounts are stored as integers in hundredths of the currency (cents)
+MINOR_UNITS = 100
+
+Number = Union[int, float, Decimal, str]
+
+
+def to_minor(amount: Number) -> int:
+    """Major-unit amount (e.g. 12.345 KES) in minor units, rounded half up (1235)"""
+    return int((Decimal(str(amount)) * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def to_minor_many(amounts: Iterable[float]) -> np.ndarray:
+    """Major-unit amounts in minor units, in one vectorized pass"""
+    return np.rint(np.asarray(amounts, dtype=float) * MINOR_UNITS).astype(np.int64)
+
+
+def from_minor(units: int) -> float:
+    """Minor units as a major-unit amount, for display and for APIs that take decimals"""
+    return units / MINOR_UNITS
+
+
+def format_amount(units: int) -> str:
+    """Minor units formatted with two decimals, e.g. 1235 -> '12.35'"""
+    sign = '-' if units < 0 else ''
+    whole, cents = divmod(abs(int(units)), MINOR_UNITS)
+    return f"{sign}{whole}.{cents:02d}"
+
+
+def debit_wallet(session, wallet_id: int, units: int) -> bool:
+    """
+    Take units from a wallet only if its balance covers them
+
+    The check and the decrement are one UPDATE, so concurrent workers
+    charging the same wallet can never take it below zero.
+
+    Returns:
+        False if the balance was insufficient (nothing changed)
+    """
+    result = session.execute(
+        update(Wallet)
+        .where(Wallet.id == wallet_id, Wallet.balance >= units)
+        .values(balance=Wallet.balance - units)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def credit_wallet(session, wallet_id: int, units: int):
+    """Add units to a wallet without reading its balance first"""
+    session.execute(
+        update(Wallet)
+        .where(Wallet.id == wallet_id)
+        .values(balance=Wallet.balance + units)
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,3 @@
+from .options import PremiumPricer, black76_put, get_pricer
+
+__all__ = ['PremiumPricer', 'black76_put', 'get_pricer']
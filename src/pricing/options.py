@@ -0,0 +1,217 @@
+import math
+import threading
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Abramowitz & Stegun 7.1.26 coefficients (max absolute error 1.5e-7)
+_ERF_P = 0.3275911
+_ERF_A = (0.254829592, -0.284496736, 1.421413741, -1.453152027, 1.061405429)
+
+
+def norm_cdf(x) -> np.ndarray:
+    """Standard normal CDF evaluated element-wise on an array"""
+    z = np.asarray(x, dtype=float) / math.sqrt(2.0)
+    sign = np.sign(z)
+    z = np.abs(z)
+    t = 1.0 / (1.0 + _ERF_P * z)
+    a1, a2, a3, a4, a5 = _ERF_A
+    poly = t * (a1 + t * (a2 + t * (a3 + t * (a4 + t * a5))))
+    erf = sign * (1.0 - poly * np.exp(-z * z))
+    return 0.5 * (1.0 + erf)
+
+
+def black76_put(forward, strike, volatility, years, rate) -> np.ndarray:
+    """
+    Price European puts with the Black-76 model
+
+    All arguments broadcast against each other, so a whole strike ladder or a
+    book of contracts is priced in one call.
+
+    Args:
+        forward: Forward (or current) price per kg
+        strike: Strike price per kg
+        volatility: Annualized volatility of the price
+        years: Time to expiry in years
+        rate: Continuously compounded risk-free rate
+
+    Returns:
+        Put premium per kg
+    """
+    forward, strike, volatility, years = np.broadcast_arrays(
+        np.asarray(forward, dtype=float),
+        np.asarray(strike, dtype=float),
+        np.asarray(volatility, dtype=float),
+        np.asarray(years, dtype=float)
+    )
+    discount = np.exp(-rate * np.maximum(years, 0.0))
+    intrinsic = discount * np.maximum(strike - forward, 0.0)
+
+    std_dev = volatility * np.sqrt(np.maximum(years, 0.0))
+    priced = (std_dev > 0) & (forward > 0) & (strike > 0)
+    safe_std = np.where(priced, std_dev, 1.0)
+    ratio = np.where(priced, forward / np.where(strike > 0, strike, 1.0), 1.0)
+
+    d1 = (np.log(ratio) + 0.5 * safe_std ** 2) / safe_std
+    d2 = d1 - safe_std
+    value = discount * (strike * norm_cdf(-d2) - forward * norm_cdf(-d1))
+
+    return np.where(priced, np.maximum(value, 0.0), intrinsic)
+
+
+class PremiumPricer:
+    """
+    Prices farmer protection premiums and caches per-kg quotes
+
+    Quotes are cached per (crop, strike bucket, expiry days, price version),
+    so once a crop's ladder is warmed for the current price the buy path only
+    does a dictionary lookup.
+    """
+
+    def __init__(
+        self,
+        volatilities: Optional[Dict[str, float]] = None,
+        rate: Optional[float] = None,
+        expiry_days: Optional[int] = None,
+        strike_tick: Optional[float] = None,
+        min_premium: Optional[float] = None,
+        cache_size: Optional[int] = None,
+        estimates: Optional[Callable[[str], Optional[float]]] = None
+    ):
+        self.volatilities = dict(volatilities if volatilities is not None else Config.CROP_VOLATILITIES)
+        self.rate = rate if rate is not None else Config.RISK_FREE_RATE
+        self.expiry_days = expiry_days if expiry_days is not None else Config.FUTURES_EXPIRY_DAYS
+        self.strike_tick = strike_tick if strike_tick is not None else Config.PREMIUM_STRIKE_TICK
+        self.min_premium = min_premium if min_premium is not None else Config.MIN_PREMIUM
+        self.cache_size = cache_size if cache_size is not None else Config.PREMIUM_CACHE_SIZE
+        self.estimates = estimates
+
+        self._cache: "OrderedDict[Tuple, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def volatility(self, crop_name: str) -> float:
+        """Annualized volatility used for a crop: the live estimate if there is one, else configured"""
+        if self.estimates is not None:
+            estimated = self.estimates(crop_name)
+            if estimated is not None:
+                return estimated
+        return self.volatilities.get(crop_name, Config.DEFAULT_VOLATILITY)
+
+    def strike_bucket(self, strike_price: float) -> int:
+        """Bucket index a strike price is quoted under"""
+        return int(round(strike_price / self.strike_tick))
+
+    def unit_premiums(self, crop_name: str, spot: float, strikes, expiry_days: Optional[int] = None) -> np.ndarray:
+        """Price per-kg premiums for an array of strikes (uncached)"""
+        days = self.expiry_days if expiry_days is None else expiry_days
+        return black76_put(spot, strikes, self.volatility(crop_name), days / 365.0, self.rate)
+
+    def warm(self, crop_name: str, spot: float, price_version: Hashable, expiry_days: Optional[int] = None) -> int:
+        """
+        Price the whole strike ladder around spot in one pass and cache it
+
+        Returns:
+            Number of quotes cached
+        """
+        days = self.expiry_days if expiry_days is None else expiry_days
+        width = Config.PREMIUM_LADDER_WIDTH
+        low = self.strike_bucket(spot * (1 - width))
+        high = self.strike_bucket(spot * (1 + width))
+        buckets = np.arange(max(low, 1), high + 1)
+        premiums = self.unit_premiums(crop_name, spot, buckets * self.strike_tick, days)
+
+        with self._lock:
+            for bucket, premium in zip(buckets.tolist(), premiums.tolist()):
+                self._store((crop_name, bucket, days, price_version), premium)
+        return len(buckets)
+
+    def quote_batch(
+        self,
+        crop_name: str,
+        spot: float,
+        strikes,
+        quantities,
+        price_version: Hashable,
+        expiry_days: Optional[int] = None
+    ) -> np.ndarray:
+        """
+        Quote premiums for many contracts on one crop
+
+        Cached buckets are reused; all missing buckets are priced in a single
+        vectorized call and added to the cache.
+        """
+        days = self.expiry_days if expiry_days is None else expiry_days
+        strikes = np.atleast_1d(np.asarray(strikes, dtype=float))
+        quantities = np.broadcast_to(np.asarray(quantities, dtype=float), strikes.shape)
+        buckets = np.rint(strikes / self.strike_tick).astype(np.int64)
+
+        unit = np.empty(len(buckets))
+        missing = []
+        with self._lock:
+            for i, bucket in enumerate(buckets.tolist()):
+                key = (crop_name, bucket, days, price_version)
+                cached = self._cache.get(key)
+                if cached is None:
+                    missing.append(i)
+                    self.misses += 1
+                else:
+                    self._cache.move_to_end(key)
+                    unit[i] = cached
+                    self.hits += 1
+
+        if missing:
+            missing_buckets = buckets[missing]
+            priced = self.unit_premiums(crop_name, spot, missing_buckets * self.strike_tick, days)
+            unit[missing] = priced
+            with self._lock:
+                for bucket, premium in zip(missing_buckets.tolist(), priced.tolist()):
+                    self._store((crop_name, bucket, days, price_version), premium)
+
+        return np.maximum(np.round(unit * quantities, 2), self.min_premium)
+
+    def quote(
+        self,
+        crop_name: str,
+        spot: float,
+        strike_price: float,
+        quantity: float,
+        price_version: Hashable,
+        expiry_days: Optional[int] = None
+    ) -> float:
+        """Quote the premium for a single contract"""
+        return float(self.quote_batch(crop_name, spot, [strike_price], [quantity], price_version, expiry_days)[0])
+
+    def clear(self):
+        """Drop all cached quotes"""
+        with self._lock:
+            self._cache.clear()
+
+    def _store(self, key: Tuple, premium: float):
+        """Insert a quote, evicting the least recently used entries (lock held)"""
+        self._cache[key] = premium
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+_pricer: Optional[PremiumPricer] = None
+_pricer_lock = threading.Lock()
+
+
+def get_pricer() -> PremiumPricer:
+    """Process-wide pricer so cached quotes outlive individual requests, priced with live volatility estimates"""
+    global _pricer
+    if _pricer is None:
+        with _pricer_lock:
+            if _pricer is None:
+                from src.oracle.volatility import get_volatility_tracker
+                _pricer = PremiumPricer(estimates=get_volatility_tracker().volatility)
+    return _pricer
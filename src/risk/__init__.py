@@ -0,0 +1,13 @@
+from .backtest import BacktestBook, PriceHistory, book_from_futures, run_backtest, synthetic_book
+from .montecarlo import RiskBook, load_book, run_risk
+
+__all__ = [
+    'BacktestBook',
+    'PriceHistory',
+    'RiskBook',
+    'book_from_futures',
+    'load_book',
+    'run_backtest',
+    'run_risk',
+    'synthetic_book'
+]
@@ -0,0 +1,296 @@
+import csv
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config.config import Config
+from src.database.models import Crop, Future
+from src.pricing.options import PremiumPricer
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ('expiry', 'first_itm')
+
+
+class PriceHistory:
+    """
+    Daily prices for several crops on a common calendar
+
+    prices has one row per day and one column per crop. Days without a
+    price for a crop carry the previous day's price forward; days before a
+    crop's first price are NaN.
+    """
+
+    def __init__(self, start: date, crops: Sequence[str], prices: np.ndarray):
+        self.start = start
+        self.crops = list(crops)
+        self.prices = np.asarray(prices, dtype=float)
+
+    def __len__(self) -> int:
+        return self.prices.shape[0]
+
+    def day_index(self, when) -> int:
+        """Row of a date (or datetime) in the calendar"""
+        if isinstance(when, datetime):
+            when = when.date()
+        return (when - self.start).days
+
+    @classmethod
+    def from_rows(cls, rows) -> 'PriceHistory':
+        """Build from (date, crop, price) rows in any order; the last row per day wins"""
+        by_day: Dict[date, Dict[str, float]] = {}
+        crops: List[str] = []
+        for day, crop, price in rows:
+            if crop not in crops:
+                crops.append(crop)
+            by_day.setdefault(day, {})[crop] = price
+        if not by_day:
+            return cls(date.today(), [], np.zeros((0, 0)))
+
+        start, end = min(by_day), max(by_day)
+        prices = np.full(((end - start).days + 1, len(crops)), np.nan)
+        column = {crop: i for i, crop in enumerate(crops)}
+        for day, day_prices in by_day.items():
+            for crop, price in day_prices.items():
+                prices[(day - start).days, column[crop]] = price
+        return cls(start, crops, _forward_fill(prices))
+
+    @classmethod
+    def from_csv(cls, path: str) -> 'PriceHistory':
+        """
+        Load a long-format CSV with crop and price columns and either a date
+        column (YYYY-MM-DD) or a day column counted from today. Files with a
+        path column (as written by simulate-prices) use path 0 only.
+        """
+        def rows():
+            with open(path, newline='') as f:
+                for row in csv.DictReader(f):
+                    if row.get('path') not in (None, '', '0'):
+                        continue
+                    if row.get('date'):
+                        day = date.fromisoformat(row['date'][:10])
+                    else:
+                        day = date.today() + timedelta(days=int(row['day']))
+                    yield day, row['crop'].strip().lower(), float(row['price'])
+
+        return cls.from_rows(rows())
+
+    @classmethod
+    def from_ticks(cls, store, crops: Sequence[str], start: datetime, end: datetime) -> 'PriceHistory':
+        """Daily closing prices from the tick store"""
+        def rows():
+            for crop in crops:
+                bars = store.ohlc(crop, start.timestamp(), end.timestamp(), 'day')
+                for ts, close in zip(bars['ts'].tolist(), bars['close'].tolist()):
+                    yield datetime.fromtimestamp(ts, timezone.utc).date(), crop, close
+
+        return cls.from_rows(rows())
+
+
+class BacktestBook:
+    """Contract purchases as arrays: crop column, buy day row, quantity, strike and tenor in days"""
+
+    def __init__(self, crop_index, buy_day, quantities, strikes, expiry_days):
+        self.crop_index = np.asarray(crop_index, dtype=np.int64)
+        self.buy_day = np.asarray(buy_day, dtype=np.int64)
+        self.quantities = np.asarray(quantities, dtype=float)
+        self.strikes = np.asarray(strikes, dtype=float)
+        self.expiry_days = np.asarray(expiry_days, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.quantities)
+
+
+def synthetic_book(
+    history: PriceHistory,
+    contracts: int,
+    seed: Optional[int] = None,
+    expiry_days: Optional[int] = None,
+    strike_range: Optional[tuple] = None
+) -> BacktestBook:
+    """
+    Random purchases spread over the history
+
+    Every contract is bought on a day with a price and expires inside the
+    history. Quantities are uniform between the contract size limits and
+    strikes are a uniform fraction of the spot price on the buy day.
+    """
+    expiry_days = expiry_days or Config.FUTURES_EXPIRY_DAYS
+    low, high = strike_range or Config.BACKTEST_STRIKE_RANGE
+    last_buy = len(history) - expiry_days - 1
+    if last_buy < 0 or not history.crops:
+        raise ValueError(f"Price history of {len(history)} days is shorter than the {expiry_days}-day contract term")
+
+    rng = np.random.default_rng(seed)
+    crop_index = rng.integers(0, len(history.crops), contracts)
+    buy_day = rng.integers(0, last_buy + 1, contracts)
+    spots = history.prices[buy_day, crop_index]
+    priced = ~np.isnan(spots)
+    crop_index, buy_day, spots = crop_index[priced], buy_day[priced], spots[priced]
+
+    return BacktestBook(
+        crop_index,
+        buy_day,
+        np.round(rng.uniform(Config.MIN_CONTRACT_SIZE, Config.MAX_CONTRACT_SIZE, len(spots)), 0),
+        np.round(spots * rng.uniform(low, high, len(spots)), 2),
+        np.full(len(spots), expiry_days)
+    )
+
+
+def book_from_futures(session, history: PriceHistory) -> BacktestBook:
+    """Every stored contract whose purchase falls inside the history"""
+    column = {crop: i for i, crop in enumerate(history.crops)}
+    rows = (
+        session.query(Crop.name, Future.quantity, Future.strike_price, Future.created_at, Future.expiration_date)
+        .join(Crop, Crop.id == Future.crop_id)
+        .yield_per(10000)
+    )
+    crop_index, buy_day, quantities, strikes, expiry_days = [], [], [], [], []
+    for name, quantity, strike_price, created_at, expiration_date in rows:
+        day = history.day_index(created_at)
+        if name not in column or not 0 <= day < len(history):
+            continue
+        crop_index.append(column[name])
+        buy_day.append(day)
+        quantities.append(quantity)
+        strikes.append(strike_price)
+        expiry_days.append((expiration_date.date() - created_at.date()).days)
+    return BacktestBook(crop_index, buy_day, quantities, strikes, expiry_days)
+
+
+def run_backtest(
+    history: PriceHistory,
+    book: BacktestBook,
+    policy: str = 'expiry',
+    pricer: Optional[PremiumPricer] = None,
+    chunk_size: Optional[int] = None
+) -> Dict[str, object]:
+    """
+    Replay purchases, exercises and expiries against a price history
+
+    Each contract pays the premium the pricer would have quoted on its buy
+    day. Under the 'expiry' policy it pays out at expiry if in the money;
+    under 'first_itm' the farmer exercises on the first day after purchase
+    that the price is below the strike, as the SMS exercise flow allows.
+    Contracts expiring after the history ends, or bought before their
+    crop has a price, are left out.
+
+    Returns:
+        Report with per-crop and total contracts, premiums, payouts, net
+        result and loss ratio, plus the daily cumulative cash balance's
+        worst drawdown
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy {policy}; use one of {', '.join(POLICIES)}")
+    pricer = pricer or PremiumPricer()
+    chunk_size = chunk_size or Config.BACKTEST_CHUNK_SIZE
+    started = datetime.now()
+
+    expiry = book.buy_day + book.expiry_days
+    settled = (expiry < len(history)) & (book.buy_day >= 0)
+    settled[settled] = ~np.isnan(history.prices[book.buy_day[settled], book.crop_index[settled]])
+    crop_index = book.crop_index[settled]
+    buy_day = book.buy_day[settled]
+    expiry = expiry[settled]
+    quantities = book.quantities[settled]
+    strikes = book.strikes[settled]
+    tenors = book.expiry_days[settled]
+    spots = history.prices[buy_day, crop_index]
+
+    # Premiums as quoted at purchase, one vectorized pricing call per crop
+    premiums = np.zeros(len(quantities))
+    for i, crop in enumerate(history.crops):
+        in_crop = crop_index == i
+        if in_crop.any():
+            unit = pricer.unit_premiums(crop, spots[in_crop], strikes[in_crop], tenors[in_crop])
+            premiums[in_crop] = np.maximum(np.round(unit * quantities[in_crop], 2), pricer.min_premium)
+
+    if policy == 'expiry':
+        exercise_day = expiry
+        exercise_price = history.prices[expiry, crop_index]
+        exercised = exercise_price < strikes
+    else:
+        exercise_day, exercise_price, exercised = _first_in_the_money(
+            history.prices, crop_index, buy_day, expiry, strikes, chunk_size
+        )
+    payouts = np.where(exercised, (strikes - np.nan_to_num(exercise_price, nan=np.inf)) * quantities, 0.0)
+    payouts = np.maximum(payouts, 0.0)
+
+    # Daily cash flows: premiums in on the buy day, payouts out on exercise
+    flows = np.bincount(buy_day, weights=premiums, minlength=len(history))
+    flows -= np.bincount(exercise_day, weights=payouts, minlength=len(history))
+    balance = np.cumsum(flows)
+
+    crops = {}
+    for i, crop in enumerate(history.crops):
+        in_crop = crop_index == i
+        crops[crop] = _summary(premiums[in_crop], payouts[in_crop], exercised[in_crop])
+    total = _summary(premiums, payouts, exercised)
+    total['max_drawdown'] = float(max(-balance.min(), 0.0)) if len(balance) else 0.0
+
+    elapsed = (datetime.now() - started).total_seconds()
+    logger.info(f"Backtested {len(quantities)} contracts over {len(history)} days in {elapsed:.2f}s")
+    return {
+        'policy': policy,
+        'days': len(history),
+        'start': history.start,
+        'skipped': int((~settled).sum()),
+        'elapsed_seconds': elapsed,
+        'crops': crops,
+        'total': total
+    }
+
+
+def _first_in_the_money(prices, crop_index, buy_day, expiry, strikes, chunk_size):
+    """
+    First day after purchase (up to expiry) each contract's price is below its strike
+
+    Contracts are processed in chunks, each as a (contracts, tenor) window
+    of prices, so memory stays bounded for large books.
+    """
+    n = len(strikes)
+    exercise_day = expiry.copy()
+    exercise_price = np.full(n, np.nan)
+    exercised = np.zeros(n, dtype=bool)
+    if n == 0:
+        return exercise_day, exercise_price, exercised
+
+    width = int((expiry - buy_day).max())
+    offsets = np.arange(1, width + 1)
+    for lo in range(0, n, chunk_size):
+        hi = min(lo + chunk_size, n)
+        days = buy_day[lo:hi, None] + offsets
+        in_term = days <= expiry[lo:hi, None]
+        window = prices[np.minimum(days, len(prices) - 1), crop_index[lo:hi, None]]
+        in_money = in_term & (window < strikes[lo:hi, None])
+
+        hit = in_money.any(axis=1)
+        first = in_money.argmax(axis=1)
+        rows = np.arange(hi - lo)
+        exercised[lo:hi] = hit
+        exercise_day[lo:hi] = np.where(hit, buy_day[lo:hi] + offsets[first], expiry[lo:hi])
+        exercise_price[lo:hi] = np.where(hit, window[rows, first], np.nan)
+    return exercise_day, exercise_price, exercised
+
+
+def _summary(premiums: np.ndarray, payouts: np.ndarray, exercised: np.ndarray) -> Dict[str, float]:
+    collected = float(premiums.sum())
+    paid = float(payouts.sum())
+    return {
+        'contracts': int(len(premiums)),
+        'exercised': int(exercised.sum()),
+        'premiums': collected,
+        'payouts': paid,
+        'net': collected - paid,
+        'loss_ratio': paid / collected if collected else 0.0
+    }
+
+
+def _forward_fill(prices: np.ndarray) -> np.ndarray:
+    """Carry each column's last price forward over missing days"""
+    rows = np.where(~np.isnan(prices), np.arange(prices.shape[0])[:, None], 0)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    filled = prices[rows, np.arange(prices.shape[1])]
+    return filled
@@ -0,0 +1,219 @@
+import logging
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config.config import Config
+from src.database.models import Crop, Future
+from src.oracle.simulator import PriceSimulator
+
+logger = logging.getLogger(__name__)
+
+
+class RiskBook:
+    """
+    Active futures book in array form, grouped for fast revaluation
+
+    Contracts are grouped by (crop, days to expiry). Within a group strikes are
+    sorted with suffix sums of quantity and quantity * strike, so the total put
+    payout of the group at any terminal price is one binary search away.
+    """
+
+    def __init__(
+        self,
+        crops: Sequence[str],
+        spots: Sequence[float],
+        crop_index: np.ndarray,
+        quantities: np.ndarray,
+        strikes: np.ndarray,
+        days: np.ndarray
+    ):
+        self.crops = list(crops)
+        self.spots = np.asarray(spots, dtype=float)
+        self.crop_index = np.asarray(crop_index, dtype=np.int64)
+        self.quantities = np.asarray(quantities, dtype=float)
+        self.strikes = np.asarray(strikes, dtype=float)
+        self.days = np.maximum(np.asarray(days, dtype=np.int64), 0)
+        self.groups = self._build_groups()
+
+    def __len__(self) -> int:
+        return len(self.quantities)
+
+    @property
+    def horizon(self) -> int:
+        """Longest time to expiry in days"""
+        return int(self.days.max()) if len(self) else 0
+
+    def _build_groups(self) -> List[tuple]:
+        groups = []
+        if not len(self):
+            return groups
+        order = np.lexsort((self.strikes, self.days, self.crop_index))
+        keys = np.stack([self.crop_index[order], self.days[order]], axis=1)
+        boundaries = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+        for chunk in np.split(order, boundaries):
+            strikes = self.strikes[chunk]
+            quantities = self.quantities[chunk]
+            q_above = np.append(np.cumsum(quantities[::-1])[::-1], 0.0)
+            qk_above = np.append(np.cumsum((quantities * strikes)[::-1])[::-1], 0.0)
+            groups.append((
+                int(self.crop_index[chunk[0]]),
+                int(self.days[chunk[0]]),
+                strikes,
+                q_above,
+                qk_above
+            ))
+        return groups
+
+
+def load_book(session, as_of: Optional[datetime] = None) -> RiskBook:
+    """Load all active futures and current crop prices into a RiskBook"""
+    as_of = as_of or datetime.now()
+    crops = session.query(Crop).order_by(Crop.id).all()
+    positions = {crop.id: i for i, crop in enumerate(crops)}
+
+    rows = (
+        session.query(Future.crop_id, Future.quantity, Future.strike_price, Future.expiration_date)
+        .filter(Future.status == 'active')
+        .yield_per(10000)
+    )
+    crop_index, quantities, strikes, days = [], [], [], []
+    for crop_id, quantity, strike_price, expiration_date in rows:
+        if crop_id not in positions:
+            continue
+        crop_index.append(positions[crop_id])
+        quantities.append(quantity)
+        strikes.append(strike_price)
+        days.append(math.ceil((expiration_date - as_of).total_seconds() / 86400))
+
+    return RiskBook(
+        crops=[crop.name for crop in crops],
+        spots=[crop.current_price for crop in crops],
+        crop_index=np.array(crop_index, dtype=np.int64),
+        quantities=np.array(quantities, dtype=float),
+        strikes=np.array(strikes, dtype=float),
+        days=np.array(days, dtype=np.int64)
+    )
+
+
+def _simulate_chunk(task: tuple) -> np.ndarray:
+    """
+    Simulate one chunk of scenarios and revalue the book under each
+
+    Returns:
+        Array of shape (scenarios, crops) with the payout owed per crop
+    """
+    seed, scenarios, simulator, horizon, groups = task
+    spots = simulator.spots
+
+    losses = np.zeros((scenarios, len(spots)))
+    if horizon > 0:
+        log_paths = simulator.log_returns(scenarios, horizon, rng=np.random.default_rng(seed))
+
+    for crop, day, strikes, q_above, qk_above in groups:
+        if day == 0:
+            prices = np.full(scenarios, spots[crop])
+        else:
+            prices = spots[crop] * np.exp(log_paths[:, day - 1, crop])
+        first_in_money = np.searchsorted(strikes, prices, side='right')
+        losses[:, crop] += qk_above[first_in_money] - prices * q_above[first_in_money]
+
+    return losses
+
+
+def _tail_stats(losses: np.ndarray, confidence: float) -> Dict[str, float]:
+    """Expected value, value-at-risk and expected shortfall of a loss sample"""
+    value_at_risk = float(np.quantile(losses, confidence))
+    tail = losses[losses >= value_at_risk]
+    return {
+        'expected_payout': float(losses.mean()),
+        'var': value_at_risk,
+        'expected_shortfall': float(tail.mean()) if len(tail) else value_at_risk
+    }
+
+
+def run_risk(
+    book: RiskBook,
+    scenarios: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    workers: Optional[int] = None,
+    confidence: Optional[float] = None,
+    seed: Optional[int] = None,
+    volatilities: Optional[Dict[str, float]] = None,
+    simulator: Optional[PriceSimulator] = None
+) -> Dict[str, object]:
+    """
+    Estimate the issuer's payout liability on the active book
+
+    Correlated daily price paths are simulated per crop, every contract is
+    paid out at its expiry date, and payouts are summed per crop and in total.
+    Scenarios are split into chunks that run on a process pool.
+
+    Args:
+        book: Active book from load_book
+        scenarios: Number of simulated scenarios
+        chunk_size: Scenarios per worker task
+        workers: Worker processes (1 runs in-process)
+        confidence: VaR / expected shortfall confidence level
+        seed: Seed for reproducible runs
+        volatilities: Annualized volatility per crop name
+        simulator: Price model to use instead of one built from Config for the book
+
+    Returns:
+        Report with per-crop and total expected payout, VaR and expected shortfall
+    """
+    scenarios = scenarios or Config.RISK_SCENARIOS
+    chunk_size = chunk_size or Config.RISK_CHUNK_SIZE
+    workers = workers or os.cpu_count() or 1
+    confidence = confidence if confidence is not None else Config.RISK_CONFIDENCE
+    if simulator is None:
+        simulator = PriceSimulator(book.crops, book.spots, volatilities=volatilities)
+
+    sizes = [chunk_size] * (scenarios // chunk_size)
+    if scenarios % chunk_size:
+        sizes.append(scenarios % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [
+        (child, size, simulator, book.horizon, book.groups)
+        for child, size in zip(seeds, sizes)
+    ]
+
+    started = datetime.now()
+    if workers == 1 or len(tasks) == 1:
+        chunks = [_simulate_chunk(task) for task in tasks]
+    else:
+        # Spawned, not forked: the scheduler runs this from a thread of the
+        # multithreaded API process, and forking it can deadlock the children
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(tasks)),
+            mp_context=multiprocessing.get_context('spawn')
+        ) as pool:
+            chunks = list(pool.map(_simulate_chunk, tasks))
+    losses = np.concatenate(chunks) if chunks else np.zeros((0, len(book.crops)))
+    elapsed = (datetime.now() - started).total_seconds()
+    logger.info(f"Simulated {scenarios} scenarios over {len(book)} contracts in {elapsed:.2f}s")
+
+    crops = {}
+    for i, name in enumerate(book.crops):
+        in_crop = book.crop_index == i
+        stats = _tail_stats(losses[:, i], confidence)
+        stats['contracts'] = int(in_crop.sum())
+        stats['open_quantity'] = float(book.quantities[in_crop].sum())
+        crops[name] = stats
+
+    total = _tail_stats(losses.sum(axis=1), confidence)
+    total['contracts'] = len(book)
+    total['open_quantity'] = float(book.quantities.sum())
+
+    return {
+        'scenarios': scenarios,
+        'confidence': confidence,
+        'elapsed_seconds': elapsed,
+        'crops': crops,
+        'total': total
+    }
@@ -1,12 +1,22 @@
 from typing import Tuple, Dict, Any
 import re
 from datetime import datetime, timedelta
+from sqlalchemy import or_, update
+from src.database.catalog import CatalogCrop, get_crop_catalog
 from src.database.models import User, Crop, Future, Wallet, UserRole
+from src.database.exposure import record_open, record_close
 from src.blockchain.stellar import StellarBlockchain
 from src.payments.rapyd import RapydClient
+from src.payments import ledger
+from src.payments.money import format_amount, from_minor, to_minor
 from .messaging import SMSMessenger
 import os
 from src.oracle.price_oracle import PriceOracle
+from src.oracle.refresher import is_price_stale, is_price_untrusted
+from src.pricing import get_pricer
+from src.fx import currency_for_phone, get_fx_rates
+from src.markets import ReferencePrice, get_market_registry, reference_price
+from config.config import Config
 
 class SMSHandler:
     def __init__(self, db_session):
@@ -15,6 +25,10 @@ class SMSHandler:
         self.rapyd = RapydClient()
         self.messenger = SMSMessenger()
         self.price_oracle = PriceOracle()
+        self.pricer = get_pricer()
+        self.fx = get_fx_rates()
+        self.markets = get_market_registry()
+        self.catalog = get_crop_catalog()
         
         # Add message templates
         self.messages = {
@@ -27,15 +41,16 @@ class SMSHandler:
 3. buy [crop] [kg] [price] - Buy protection
 4. sell - Exercise your protection
 5. balance - Check your balance""",
-                'future_created': "Future created: {quantity} kg of {crop} at {strike_price}/kg. Premium paid: {premium}",
+                'future_created': "Future created: {quantity} kg of {crop} at {strike_price} {currency}/kg. Premium paid: {premium} {currency}",
                 'insufficient_funds': "Insufficient funds in your wallet.",
                 'invalid_crop': "Invalid crop name. Available crops: corn, wheat, rice, soybeans, coffee",
                 'invalid_numbers': "Invalid quantity or price. Please enter valid numbers.",
                 'invalid_buy_format': "Invalid format. Use: buy [crop] [quantity] [strike_price]",
                 'registration_format': "To register, send: register [name] [location] [crop] [farm_size]",
-                'price_check': "Current price for {crop}: {price} KES/kg",
+                'price_check': "Current price for {crop}: {price} {currency}/kg",
+                'market_price_check': "Current price for {crop} at {market} market: {price} {currency}/kg",
                 'registration_error': "Sorry, registration failed. Please try again or contact support.",
-                'balance_check': "Your current balance is: {balance} KES",
+                'balance_check': "Your current balance is: {balance} {currency}",
                 'balance_error': "Error checking balance. Please try again.",
                 'no_wallet': "No wallet found. Please register first.",
                 'buy_error': "Sorry, there was an error creating your futures contract. Please try again.",
@@ -43,8 +58,9 @@ class SMSHandler:
                 'invalid_future_id': "Invalid future ID. Please provide a valid number.",
                 'invalid_future': "No active future contract found with that ID.",
                 'cannot_exercise': "Cannot exercise: current price is above strike price.",
-                'exercise_success': "Future exercised successfully! Payout: {payout} KES for {quantity} kg of {crop}. Strike price: {strike_price}, Current price: {current_price}",
+                'exercise_success': "Future exercised successfully! Payout: {payout} {currency} for {quantity} kg of {crop}. Strike price: {strike_price}, Current price: {current_price}",
                 'exercise_error': "Error exercising future. Please try again.",
+                'stale_price': "The {crop} price is being updated. Please try again in a few minutes.",
                 'no_wallet': "No wallet found. Please contact support.",
             },
             'sw': {
@@ -56,15 +72,16 @@ class SMSHandler:
 3. nunua [mazao] [kg] [bei] - Nunua ulinzi
 4. uza - Tumia ulinzi wako
 5. salio - Angalia salio lako""",
-                'future_created': "Mkataba umoundwa: {quantity} kg ya {crop} kwa {strike_price}/kg. Malipo: {premium}",
+                'future_created': "Mkataba umoundwa: {quantity} kg ya {crop} kwa {strike_price} {currency}/kg. Malipo: {premium} {currency}",
                 'insufficient_funds': "Salio hailitoshi kwenye pochi yako.",
                 'invalid_crop': "Jina la mazao si sahihi.",
                 'invalid_numbers': "Kiasi au bei si sahihi.",
                 'invalid_buy_format': "Muundo si sahihi. Tumia: nunua [mazao] [kiasi] [bei]",
                 'registration_format': "Kujisajili, tuma: sajili [jina] [eneo] [mazao] [ukubwa_wa_shamba]",
-                'price_check': "Bei ya sasa ya {crop}: {price} KES/kg",
+                'price_check': "Bei ya sasa ya {crop}: {price} {currency}/kg",
+                'market_price_check': "Bei ya sasa ya {crop} soko la {market}: {price} {currency}/kg",
                 'registration_error': "Samahani, usajili umeshindwa. Tafadhali jaribu tena au wasiliana na msaada.",
-                'balance_check': "Salio lako ni: {balance} KES",
+                'balance_check': "Salio lako ni: {balance} {currency}",
                 'balance_error': "Hitilafu katika kuangalia salio. Tafadhali jaribu tena.",
                 'no_wallet': "Hakuna pochi. Tafadhali jisajili kwanza.",
                 'buy_error': "Samahani, haitaji kujisajili kwanza. Tafadhali jisajili kwanza au wasiliana na msaada.",
@@ -72,8 +89,9 @@ class SMSHandler:
                 'invalid_future_id': "Nambari ya mkataba si sahihi. Tafadhali weka nambari sahihi.",
                 'invalid_future': "Hakuna mkataba hai uliopatikana na hiyo nambari.",
                 'cannot_exercise': "Haiwezi kuuzwa: bei ya sasa iko juu ya bei ya mkataba.",
-                'exercise_success': "Mkataba umeuzwa kwa mafanikio! Malipo: {payout} KES kwa {quantity} kg ya {crop}. Bei ya sasa: {strike_price}, Bei ya sasa: {current_price}",
+                'exercise_success': "Mkataba umeuzwa kwa mafanikio! Malipo: {payout} {currency} kwa {quantity} kg ya {crop}. Bei ya sasa: {strike_price}, Bei ya sasa: {current_price}",
                 'exercise_error': "Samahani, haitaji kujisajili kwanza. Tafadhali jisajili kwanza au wasiliana na msaada.",
+                'stale_price': "Bei ya {crop} inasasishwa. Tafadhali jaribu tena baada ya dakika chache.",
                 'no_wallet': "Hakuna pochi. Tafadhali jisajili kwanza.",
             }
         }
@@ -166,11 +184,19 @@ class SMSHandler:
                 primary_crop=1  # Default to first crop, update based on parts[3]
             )
             
+            # Farmers are priced at their nearest market when their location is known
+            try:
+                market = self.markets.assign(user)
+                print(f"Nearest market for {user.location}: {market.name if market else None}")  # Debug log
+            except Exception as e:
+                print(f"Market lookup failed: {str(e)}")  # Debug log
+            
             # Create wallet with the obtained Rapyd wallet ID
             wallet = Wallet(
                 user=user,
                 rapyd_wallet_id=wallet_id,
-                balance=0.0
+                balance=0,
+                currency=currency_for_phone(phone_number)
             )
             
             # Add both user and wallet to session
@@ -211,33 +237,42 @@ class SMSHandler:
             print("Failed to parse quantity or strike price")  # Debug log
             return self._get_translated_message("invalid_numbers", user.language_preference)
             
-        crop = self.session.query(Crop).filter_by(name=crop_name).first()
-        print(f"Found crop: {crop}")  # Debug log
+        crop = self.catalog.get(crop_name)
+        print(f"Found crop: {crop_name if crop else None}")  # Debug log
         
         if not crop:
             print(f"Crop not found: {crop_name}")  # Debug log
             return self._get_translated_message("invalid_crop", user.language_preference)
             
-        # Calculate premium
-        premium = self._calculate_premium(crop.current_price, strike_price, quantity)
-        print(f"Calculated premium: {premium}")  # Debug log
-        
         # Check wallet and balance
         if not user.wallet:
             print("No wallet found for user")  # Debug log
             return self._get_translated_message("no_wallet", user.language_preference)
             
-        print(f"Current wallet balance: {user.wallet.balance}")  # Debug log
+        # The farmer quotes the strike in their wallet currency; contracts are priced and stored in the base currency
+        rates = self.fx.table
+        currency = self._wallet_currency(user)
+        local_strike = strike_price
+        strike_price = round(rates.to_base(local_strike, currency), 4)
         
-        # Add initial test balance if in debug mode
-        if os.getenv('DEBUG', 'False').lower() == 'true' and user.wallet.balance == 0:
-            user.wallet.balance = 1000.0  # Give 1000 KES for testing
-            self.session.commit()
-            print("Added initial test balance")  # Debug log
+        # Calculate premium against the farmer's market price
+        reference = reference_price(self.session, crop, user.market_id)
+        premium = self._calculate_premium(crop, reference, strike_price, quantity)
+        premium_units = to_minor(premium)
+        local_premium = to_minor(rates.convert(premium, currency))
+        print(f"Calculated premium: {premium} ({format_amount(local_premium)} {currency})")  # Debug log
+        
+        self._add_test_balance(user)
         
-        if user.wallet.balance < premium:
-            print(f"Insufficient funds: {user.wallet.balance} < {premium}")  # Debug log
+        # Reserve the premium: the balance check and the decrement are one statement,
+        # so concurrent buys against the same wallet cannot both spend the same funds
+        wallet_id = user.wallet.id
+        premium_journal = ledger.debit(self.session, wallet_id, local_premium, currency, 'premium')
+        if not premium_journal:
+            self.session.rollback()
+            print(f"Insufficient funds for premium {format_amount(local_premium)} {currency}")  # Debug log
             return self._get_translated_message("insufficient_funds", user.language_preference)
+        self.session.commit()
             
         try:
             # Create Stellar contract
@@ -245,7 +280,7 @@ class SMSHandler:
                 user.stellar_public_key,
                 quantity,
                 strike_price,
-                premium
+                from_minor(premium_units)
             )
             print(f"Created Stellar contract: {contract_address}")  # Debug log
             
@@ -255,17 +290,19 @@ class SMSHandler:
                 crop_id=crop.id,
                 quantity=quantity,
                 strike_price=strike_price,
-                premium=premium,
-                expiration_date=datetime.now() + timedelta(days=90),
+                premium=premium_units,
+                expiration_date=datetime.now() + timedelta(days=Config.FUTURES_EXPIRY_DAYS),
                 contract_address=contract_address,
                 status='active',
-                created_at=datetime.now()
+                created_at=datetime.now(),
+                market_id=user.market_id
             )
             
-            # Deduct premium from wallet
-            user.wallet.balance -= premium
-            
             self.session.add(future)
+            self.session.flush()
+            # The premium was taken before the contract existed; tie it to the contract now
+            ledger.link_future(self.session, premium_journal, future.id)
+            record_open(self.session, future)
             self.session.commit()
             print("Future contract created and saved to database")  # Debug log
             
@@ -274,12 +311,16 @@ class SMSHandler:
                 user.language_preference,
                 quantity=quantity,
                 crop=crop_name,
-                strike_price=strike_price,
-                premium=premium
+                strike_price=local_strike,
+                premium=format_amount(local_premium),
+                currency=currency
             )
         except Exception as e:
             print(f"Error creating future: {str(e)}")  # Debug log
             self.session.rollback()
+            # Return the reserved premium
+            ledger.credit(self.session, wallet_id, local_premium, currency, 'premium_refund')
+            self.session.commit()
             return self._get_translated_message("buy_error", user.language_preference)
 
     def _handle_price_check(self, user: User, args: list) -> str:
@@ -295,25 +336,57 @@ class SMSHandler:
         crop_name = args[0].lower()
         print(f"Looking up crop: {crop_name}")
         
-        # Get real-time price from oracle
-        current_price = self.price_oracle.get_crop_price(crop_name)
+        # Get real-time price from oracle (may be slightly stale while it refreshes)
+        quote = self.price_oracle.get_crop_quote(crop_name)
         
-        if current_price is None:
+        if quote is None:
             return self._get_translated_message("invalid_crop", user.language_preference)
-            
-        # Update price in database
-        crop = self.session.query(Crop).filter_by(name=crop_name).first()
-        if crop:
-            crop.current_price = current_price
-            crop.last_updated = datetime.now()
+        current_price = quote.price
+            
+        # Update price in database, stamped with when it was fetched rather than now
+        crop = self.catalog.get(crop_name)
+        fetched_at = datetime.fromtimestamp(quote.fetched_at)
+        if crop and (crop.last_updated is None or fetched_at > crop.last_updated):
+            stored = self.session.execute(
+                update(Crop)
+                .where(Crop.id == crop.id, or_(Crop.last_updated.is_(None), Crop.last_updated < fetched_at))
+                .values(
+                    current_price=current_price,
+                    last_updated=fetched_at,
+                    price_sources=quote.source,
+                    price_version=Crop.price_version + 1
+                )
+                .execution_options(synchronize_session=False)
+            ).rowcount
             self.session.commit()
-            
-        response = self._get_translated_message(
-            "price_check",
-            user.language_preference,
-            crop=crop_name,
-            price=current_price
-        )
+            if stored:
+                self.catalog.invalidate()
+                crop = self.catalog.get(crop_name)
+        
+        # Farmers with a market see (and are priced at) that market's price when it has one
+        reference = reference_price(self.session, crop, user.market_id) if crop else None
+        if reference is not None:
+            # Price the strike ladder now so a following buy is a cache hit
+            self.pricer.warm(crop.name, reference.price, reference.version)
+            
+        currency = self._wallet_currency(user)
+        if reference is not None and reference.market_id is not None:
+            response = self._get_translated_message(
+                "market_price_check",
+                user.language_preference,
+                crop=crop_name,
+                market=user.market.name.title(),
+                price=self.fx.table.convert(reference.price, currency),
+                currency=currency
+            )
+        else:
+            response = self._get_translated_message(
+                "price_check",
+                user.language_preference,
+                crop=crop_name,
+                price=self.fx.table.convert(current_price, currency),
+                currency=currency
+            )
         print(f"Sending response: {response}")
         return response
 
@@ -326,18 +399,16 @@ class SMSHandler:
                 print("No wallet found for user")  # Debug log
                 return self._get_translated_message("no_wallet", user.language_preference)
                 
-            print(f"Current balance: {user.wallet.balance}")  # Debug log
-            
-            # Add initial test balance if in debug mode
-            if os.getenv('DEBUG', 'False').lower() == 'true' and user.wallet.balance == 0:
-                user.wallet.balance = 1000.0  # Give 1000 KES for testing
-                self.session.commit()
-                print("Added initial test balance")  # Debug log
+            self._add_test_balance(user)
+            # The journaled balance: last snapshot plus the entries since
+            balance = ledger.wallet_balance(self.session, user.wallet.id)
+            print(f"Current balance: {balance}")  # Debug log
                 
             response = self._get_translated_message(
                 "balance_check",
                 user.language_preference,
-                balance=user.wallet.balance
+                balance=format_amount(balance),
+                currency=self._wallet_currency(user)
             )
             print(f"Sending response: {response}")  # Debug log
             return response
@@ -373,29 +444,43 @@ class SMSHandler:
                 print(f"No active future found with ID: {future_id}")
                 return self._get_translated_message("invalid_future", user.language_preference)
                 
-            # Get current price
-            crop = self.session.query(Crop).filter_by(id=future.crop_id).first()
-            print(f"Current price for {crop.name}: {crop.current_price}")
+            # Get current price at the market the contract references
+            crop = self.catalog.get_by_id(future.crop_id)
+            reference = reference_price(self.session, crop, future.market_id)
+            print(f"Current price for {crop.name}: {reference.price} (market {reference.market_id})")
             print(f"Strike price: {future.strike_price}")
             
+            # Never pay out against a price the refresher has not confirmed recently,
+            # or against a simulated one standing in for a missing upstream price
+            if is_price_stale(reference.last_updated) or is_price_untrusted(reference.sources):
+                print(f"Price for {crop.name} is stale or simulated (last updated {reference.last_updated}, from {reference.sources})")
+                return self._get_translated_message("stale_price", user.language_preference, crop=crop.name)
+            
             # Check if future can be exercised (current price must be below strike price)
-            if crop.current_price >= future.strike_price:
+            if reference.price >= future.strike_price:
                 print("Cannot exercise: current price above strike price")
                 return self._get_translated_message("cannot_exercise", user.language_preference)
                 
-            # Calculate payout
-            payout = (future.strike_price - crop.current_price) * future.quantity
-            print(f"Calculated payout: {payout}")
+            # Calculate payout, credited in the wallet's currency
+            payout = (future.strike_price - reference.price) * future.quantity
+            rates = self.fx.table
+            currency = self._wallet_currency(user)
+            local_payout = to_minor(rates.convert(payout, currency))
+            print(f"Calculated payout: {payout} ({format_amount(local_payout)} {currency})")
             
-            # Update future status
-            future.status = 'exercised'
-            
-            # Add payout to wallet
             if not user.wallet:
                 print("No wallet found for user")
                 return self._get_translated_message("no_wallet", user.language_preference)
+            
+            # Flip the status only if the contract is still active, so a contract
+            # exercised twice at once (or settled meanwhile) pays out once
+            if not self._claim_future(future, 'exercised'):
+                self.session.rollback()
+                print(f"Future {future_id} was closed by another worker")
+                return self._get_translated_message("invalid_future", user.language_preference)
                 
-            user.wallet.balance += payout
+            ledger.credit(self.session, user.wallet.id, local_payout, currency, 'payout', future.id)
+            record_close(self.session, future)
             
             # Save changes
             self.session.commit()
@@ -404,11 +489,12 @@ class SMSHandler:
             return self._get_translated_message(
                 "exercise_success",
                 user.language_preference,
-                payout=payout,
+                payout=format_amount(local_payout),
                 crop=crop.name,
                 quantity=future.quantity,
-                strike_price=future.strike_price,
-                current_price=crop.current_price
+                strike_price=rates.convert(future.strike_price, currency),
+                current_price=rates.convert(reference.price, currency),
+                currency=currency
             )
             
         except Exception as e:
@@ -416,11 +502,46 @@ class SMSHandler:
             self.session.rollback()
             return self._get_translated_message("exercise_error", user.language_preference)
 
-    def _calculate_premium(self, current_price: float, strike_price: float, quantity: float) -> float:
-        """Calculate premium for futures contract"""
-        # Simple premium calculation (can be made more sophisticated)
-        base_premium = abs(strike_price - current_price) * quantity * 0.1
-        return max(base_premium, 1.0)  # Minimum premium of 1 unit
+    def _claim_future(self, future: Future, status: str) -> bool:
+        """Move an active future to status in one conditional UPDATE; False if it was no longer active"""
+        result = self.session.execute(
+            update(Future)
+            .where(Future.id == future.id, Future.status == 'active')
+            .values(status=status)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+
+    def _add_test_balance(self, user: User):
+        """Give an empty wallet 1000 in its currency when running in debug mode"""
+        if os.getenv('DEBUG', 'False').lower() != 'true':
+            return
+        result = self.session.execute(
+            update(Wallet)
+            .where(Wallet.id == user.wallet.id, Wallet.balance == 0)
+            .values(balance=to_minor(1000))
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            ledger.post(self.session, user.wallet.id, to_minor(1000), self._wallet_currency(user), 'test_funding')
+            print("Added initial test balance")  # Debug log
+        self.session.commit()
+
+    def _wallet_currency(self, user: User) -> str:
+        """Currency the farmer's balance, prices and payouts are shown in"""
+        if user.wallet and user.wallet.currency:
+            return user.wallet.currency
+        return currency_for_phone(user.phone_number)
+
+    def _calculate_premium(self, crop: CatalogCrop, reference: ReferencePrice, strike_price: float, quantity: float) -> float:
+        """Calculate premium for futures contract (Black-76 put, cached per price version)"""
+        return self.pricer.quote(
+            crop.name,
+            reference.price,
+            strike_price,
+            quantity,
+            price_version=reference.version
+        )
 
     def _detect_language(self, message: str) -> str:
         """Detect language from message content"""
@@ -0,0 +1,93 @@
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import update
+
+from config.config import Config
+from src.database.models import Notification, User
+
+logger = logging.getLogger(__name__)
+
+# Templates for messages the platform sends on its own, keyed like SMSHandler.messages
+NOTIFICATION_TEMPLATES = {
+    'en': {
+        'future_expired': "Your protection #{future_id} for {quantity} kg of {crop} at {strike_price} {currency}/kg has expired.",
+        'future_settled': "Your protection for {crop} was settled at expiry. Payout: {payout} {currency} for {contracts} contract(s).",
+    },
+    'sw': {
+        'future_expired': "Ulinzi wako #{future_id} wa kg {quantity} za {crop} kwa {strike_price} {currency}/kg umekwisha muda.",
+        'future_settled': "Ulinzi wako wa {crop} umelipwa mwisho wa muda. Malipo: {payout} {currency} kwa mikataba {contracts}.",
+    }
+}
+
+
+def queue_notifications(session, events: Iterable[Dict]):
+    """
+    Add events to the outbox in the caller's transaction
+
+    Each event is a dict with user_id, event_type and the template arguments.
+    """
+    now = datetime.now()
+    rows = []
+    for event in events:
+        args = {k: v for k, v in event.items() if k not in ('user_id', 'event_type')}
+        rows.append({
+            'user_id': event['user_id'],
+            'event_type': event['event_type'],
+            'payload': json.dumps(args, default=str),
+            'status': 'pending',
+            'created_at': now
+        })
+    if rows:
+        session.bulk_insert_mappings(Notification, rows)
+    return len(rows)
+
+
+def render_notification(event_type: str, language: str, payload: Dict) -> str:
+    """Render an outbox event in the farmer's language"""
+    templates = NOTIFICATION_TEMPLATES.get(language, NOTIFICATION_TEMPLATES['en'])
+    template = templates.get(event_type, NOTIFICATION_TEMPLATES['en'][event_type])
+    # Events queued before amounts carried a currency were in the default one
+    return template.format(**{'currency': Config.DEFAULT_CURRENCY, **payload})
+
+
+def deliver_pending(session, messenger, limit: Optional[int] = None) -> int:
+    """
+    Send pending notifications and mark them sent or failed
+
+    Returns:
+        Number of notifications sent
+    """
+    limit = limit or Config.NOTIFICATION_BATCH_SIZE
+    pending = (
+        session.query(Notification, User.phone_number, User.language_preference)
+        .join(User, Notification.user_id == User.id)
+        .filter(Notification.status == 'pending')
+        .order_by(Notification.id)
+        .limit(limit)
+        .all()
+    )
+
+    sent, failed = [], []
+    for notification, phone_number, language in pending:
+        try:
+            message = render_notification(notification.event_type, language, json.loads(notification.payload))
+            ok = messenger.send_sms(phone_number, message)
+        except Exception as e:
+            logger.error(f"Failed to render notification {notification.id}: {str(e)}")
+            ok = False
+        (sent if ok else failed).append(notification.id)
+
+    now = datetime.now()
+    if sent:
+        session.execute(
+            update(Notification).where(Notification.id.in_(sent)).values(status='sent', sent_at=now)
+        )
+    if failed:
+        session.execute(
+            update(Notification).where(Notification.id.in_(failed)).values(status='failed')
+        )
+    session.commit()
+    return len(sent)
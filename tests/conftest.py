@@ -0,0 +1,18 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+from src.database import db
+from src.database.models import Base
+
+@pytest.fixture
+def scoped_session():
+    """The application's thread-local Session, bound to an in-memory database for the test"""
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    original = db.session_factory.kw['bind']
+    db.Session.remove()
+    db.session_factory.configure(bind=engine)
+    yield db.Session
+    db.Session.remove()
+    db.session_factory.configure(bind=original)
+    engine.dispose()
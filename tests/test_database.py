@@ -0,0 +1,338 @@
+import pytest
+from datetime import datetime, date
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from src.database.db import create_db_engine
+from src.database.models import Base, Crop, Future, ExposureBucket, User, UserRole
+from src.database.exposure import record_open, record_close, query_exposure, rebuild_exposure
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([
+        Crop(id=1, name='corn', current_price=2.5, last_updated=datetime.now()),
+        Crop(id=2, name='wheat', current_price=3.0, last_updated=datetime.now())
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+def make_future(crop_id, quantity, strike_price, expiration_date, premium=1000, status='active'):
+    return Future(
+        user_id=1,
+        crop_id=crop_id,
+        quantity=quantity,
+        strike_price=strike_price,
+        premium=premium,
+        expiration_date=expiration_date,
+        contract_address='FUTURE_TEST',
+        status=status,
+        created_at=datetime.now()
+    )
+
+class TestExposureAggregates:
+    def test_buy_and_exercise_update_buckets(self, session):
+        """Opening adds to the bucket and closing takes it back out"""
+        future = make_future(1, 100, 2.3, datetime(2027, 3, 10))
+        session.add(future)
+        record_open(session, future)
+        record_open(session, make_future(1, 50, 2.35, datetime(2027, 3, 11)))
+        session.commit()
+
+        bucket = session.query(ExposureBucket).one()
+        assert bucket.open_contracts == 2
+        assert bucket.open_quantity == pytest.approx(150)
+        assert bucket.strike_exposure == pytest.approx(100 * 2.3 + 50 * 2.35)
+
+        record_close(session, future)
+        session.commit()
+        session.refresh(bucket)
+        assert bucket.open_contracts == 1
+        assert bucket.open_quantity == pytest.approx(50)
+
+    def test_query_protected_below_strike_in_month(self, session):
+        """How many kg of corn are protected below 2.4 expiring in March"""
+        for future in [
+            make_future(1, 100, 2.3, datetime(2027, 3, 10)),
+            make_future(1, 200, 2.5, datetime(2027, 3, 10)),
+            make_future(1, 300, 2.2, datetime(2027, 5, 10)),
+            make_future(2, 400, 2.0, datetime(2027, 3, 10))
+        ]:
+            session.add(future)
+            record_open(session, future)
+        session.commit()
+
+        rows = query_exposure(
+            session, crop='corn', strike_below=2.4,
+            expiry_from=date(2027, 3, 1), expiry_to=date(2027, 3, 31)
+        )
+        assert sum(row['open_quantity'] for row in rows) == pytest.approx(100)
+
+    def test_rebuild_matches_incremental(self, session):
+        """Rebuilding from futures reproduces the incremental aggregates"""
+        futures = [make_future(1, 10 * i, 2.0 + i / 10, datetime(2027, 3, i + 1)) for i in range(1, 8)]
+        for future in futures:
+            session.add(future)
+            record_open(session, future)
+        session.add(make_future(1, 999, 2.0, datetime(2027, 3, 1), status='expired'))
+        session.commit()
+        incremental = query_exposure(session)
+
+        rebuild_exposure(session)
+        session.commit()
+        assert query_exposure(session) == incremental
+
+class TestFutureListings:
+    @pytest.fixture
+    def listed(self, session):
+        for user_id, phone in ((1, '+254700000001'), (2, '+254700000002')):
+            session.add(User(
+                id=user_id, phone_number=phone, stellar_public_key=f'G{user_id}', stellar_private_key=f'S{user_id}',
+                role=UserRole.FARMER, created_at=datetime.now(), name=f'Farmer {user_id}', gender='F', location='Nakuru'
+            ))
+        for i in range(5):
+            future = make_future(1 + i % 2, 100, 2.4, datetime(2027, 3, 10))
+            future.user_id = 1 if i < 4 else 2
+            session.add(future)
+        session.commit()
+        session.expunge_all()
+        return session
+
+    def test_pages_load_relations_in_one_query_each(self, listed):
+        """Streaming 5 futures in pages of 2 runs 3 queries and no per-row lookups"""
+        from src.database.listings import iter_futures
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(listed.get_bind(), 'before_cursor_execute', listener)
+        try:
+            rows = [(f.id, f.user.name, f.crop.name) for f in iter_futures(listed, page_size=2)]
+        finally:
+            event.remove(listed.get_bind(), 'before_cursor_execute', listener)
+        assert [row[0] for row in rows] == [1, 2, 3, 4, 5]
+        assert rows[4][1:] == ('Farmer 2', 'corn')
+        assert len(statements) == 3
+
+    def test_keyset_filters_and_limit(self, listed):
+        """after_id, phone and limit select the expected slice"""
+        from src.database.listings import iter_futures
+
+        ids = [f.id for f in iter_futures(listed, phone='+254700000001', after_id=1, limit=2, page_size=1)]
+        assert ids == [2, 3]
+
+    def test_listing_includes_archived_futures(self, listed):
+        """include_archived lists archived contracts with their relations, in id order"""
+        from src.database.archive import archive_futures
+        from src.database.listings import iter_futures
+
+        listed.query(Future).filter(Future.id.in_([2, 3])).update({'status': 'expired'})
+        assert archive_futures(listed, datetime(2028, 1, 1), 10, datetime.now()) == 2
+        listed.commit()
+
+        assert [f.id for f in iter_futures(listed)] == [1, 4, 5]
+        history = [(f.id, f.status, f.user.name) for f in iter_futures(listed, phone='+254700000001', include_archived=True, page_size=2)]
+        assert history == [(1, 'active', 'Farmer 1'), (2, 'expired', 'Farmer 1'), (3, 'expired', 'Farmer 1'), (4, 'active', 'Farmer 1')]
+
+class TestCropCatalog:
+    @pytest.fixture
+    def catalog(self, session):
+        from src.database.catalog import CropCatalog
+        return CropCatalog(session_factory=sessionmaker(bind=session.get_bind()), check_interval=60)
+
+    def test_lookups_by_name_and_id(self, catalog):
+        """Crops are found by name (any case) and id without a query each time"""
+        assert catalog.get('Corn').current_price == 2.5
+        assert catalog.get_by_id(2).name == 'wheat'
+        assert catalog.get('barley') is None
+        assert [crop.name for crop in catalog.crops()] == ['corn', 'wheat']
+
+    def test_version_bump_reloads_after_invalidate(self, session, catalog):
+        """A price written elsewhere shows up once the catalog checks the version"""
+        from sqlalchemy import update
+
+        assert catalog.get('corn').current_price == 2.5
+        session.execute(update(Crop).where(Crop.name == 'corn').values(current_price=2.8, price_version=Crop.price_version + 1))
+        session.commit()
+        # Within the check interval the cached copy is served
+        assert catalog.get('corn').current_price == 2.5
+        catalog.invalidate()
+        assert catalog.get('corn').current_price == 2.8
+        assert catalog.get('corn').price_version == 1
+
+    def test_unchanged_version_skips_reload(self, catalog):
+        """A check that finds the same version keeps the loaded objects"""
+        corn = catalog.get('corn')
+        catalog.invalidate()
+        assert catalog.get('corn') is corn
+
+    def test_leaves_the_callers_scoped_session_open(self, scoped_session):
+        """Catalog loads use their own sessions, so objects on the thread's Session stay attached"""
+        from src.database.catalog import CropCatalog
+
+        session = scoped_session()
+        session.add(Crop(name='corn', current_price=2.5, last_updated=datetime.now()))
+        session.commit()
+        crop = session.query(Crop).one()
+
+        assert CropCatalog(check_interval=0).get('corn').current_price == 2.5
+        assert crop in scoped_session()
+
+
+class TestEngineFactory:
+    def test_sqlite_file_gets_pragmas(self, tmp_path):
+        """File databases run in WAL mode with a busy timeout"""
+        engine = create_db_engine(f"sqlite:///{tmp_path / 'agri.db'}")
+        with engine.connect() as connection:
+            assert connection.execute(text("PRAGMA journal_mode")).scalar().lower() == 'wal'
+            assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+            assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        engine.dispose()
+
+    def test_in_memory_sqlite_shares_one_connection(self):
+        """An in-memory database is visible to every session"""
+        engine = create_db_engine("sqlite://")
+        assert isinstance(engine.pool, StaticPool)
+        Base.metadata.create_all(engine)
+        factory = sessionmaker(bind=engine)
+        first = factory()
+        first.add(Crop(name='corn', current_price=2.5, last_updated=datetime.now()))
+        first.commit()
+        assert factory().query(Crop).count() == 1
+
+    def test_server_databases_are_pooled(self):
+        """Non-SQLite URLs get the configured pool settings"""
+        pytest.importorskip('psycopg2')
+        engine = create_db_engine("postgresql://agri@localhost/agri_futures", pool_size=3)
+        assert engine.pool.size() == 3
+        assert engine.pool._recycle == 1800
+
+class TestAsyncEngine:
+    def test_async_url_swaps_driver(self):
+        """Synchronous URLs map to their async drivers"""
+        from src.database.async_db import async_url
+        assert async_url("sqlite:///./agri.db").drivername == 'sqlite+aiosqlite'
+        assert async_url("postgresql+psycopg2://agri@db/agri").drivername == 'postgresql+asyncpg'
+        with pytest.raises(ValueError):
+            async_url("mysql://agri@db/agri")
+
+    def test_async_sessions_share_pragmas_and_schema(self, tmp_path):
+        """The async engine applies the same pragmas and reads what the sync engine wrote"""
+        import asyncio
+        from sqlalchemy import select
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        from src.database.async_db import create_async_db_engine
+
+        url = f"sqlite:///{tmp_path / 'agri.db'}"
+        engine = create_db_engine(url)
+        Base.metadata.create_all(engine)
+        with sessionmaker(bind=engine)() as session:
+            session.add(Crop(name='corn', current_price=2.5, last_updated=datetime.now()))
+            session.commit()
+        engine.dispose()
+
+        async def read():
+            async_engine = create_async_db_engine(url)
+            try:
+                async with async_sessionmaker(async_engine)() as session:
+                    journal_mode = (await session.execute(text("PRAGMA journal_mode"))).scalar()
+                    names = (await session.execute(select(Crop.name))).scalars().all()
+                return journal_mode, names
+            finally:
+                await async_engine.dispose()
+
+        assert asyncio.run(read()) == ('wal', ['corn'])
+
+# Tables as the original Base.metadata.create_all created them on SQLite, before migrations
+ORIGINAL_SCHEMA = [
+    "CREATE TABLE crops (id INTEGER NOT NULL, name VARCHAR NOT NULL, current_price FLOAT NOT NULL, "
+    "last_updated DATETIME NOT NULL, PRIMARY KEY (id))",
+    "CREATE TABLE users (id INTEGER NOT NULL, phone_number VARCHAR NOT NULL, stellar_public_key VARCHAR NOT NULL, "
+    "stellar_private_key VARCHAR NOT NULL, role VARCHAR(6), language_preference VARCHAR, created_at DATETIME NOT NULL, "
+    "name VARCHAR NOT NULL, gender VARCHAR NOT NULL, location VARCHAR NOT NULL, farm_size FLOAT, primary_crop INTEGER, "
+    "PRIMARY KEY (id), UNIQUE (phone_number), UNIQUE (stellar_public_key), UNIQUE (stellar_private_key), "
+    "FOREIGN KEY(primary_crop) REFERENCES crops (id))",
+    "CREATE TABLE futures (id INTEGER NOT NULL, user_id INTEGER, crop_id INTEGER, quantity FLOAT NOT NULL, "
+    "strike_price FLOAT NOT NULL, premium FLOAT NOT NULL, expiration_date DATETIME NOT NULL, "
+    "contract_address VARCHAR NOT NULL, status VARCHAR NOT NULL, created_at DATETIME NOT NULL, PRIMARY KEY (id), "
+    "FOREIGN KEY(user_id) REFERENCES users (id), FOREIGN KEY(crop_id) REFERENCES crops (id))",
+    "CREATE TABLE wallets (id INTEGER NOT NULL, user_id INTEGER, balance FLOAT, rapyd_wallet_id VARCHAR NOT NULL, "
+    "PRIMARY KEY (id), UNIQUE (user_id), FOREIGN KEY(user_id) REFERENCES users (id), UNIQUE (rapyd_wallet_id))",
+    "CREATE TABLE transactions (id INTEGER NOT NULL, wallet_id INTEGER, amount FLOAT NOT NULL, "
+    "transaction_type VARCHAR NOT NULL, status VARCHAR NOT NULL, rapyd_transaction_id VARCHAR, "
+    "created_at DATETIME NOT NULL, PRIMARY KEY (id), FOREIGN KEY(wallet_id) REFERENCES wallets (id), "
+    "UNIQUE (rapyd_transaction_id))"
+]
+
+def head_revision():
+    from alembic.script import ScriptDirectory
+    from src.database.migrations import alembic_config
+    return ScriptDirectory.from_config(alembic_config()).get_current_head()
+
+class TestMigrations:
+    def test_upgrade_builds_schema_matching_models(self, tmp_path):
+        """Migrating an empty database yields the models' tables and indexes"""
+        from alembic.autogenerate import compare_metadata
+        from alembic.runtime.migration import MigrationContext
+        from src.database.migrations import migrate
+
+        url = f"sqlite:///{tmp_path / 'agri.db'}"
+        before, after = migrate(url=url)
+        assert before is None and after == head_revision()
+
+        engine = create_db_engine(url)
+        with engine.connect() as connection:
+            context = MigrationContext.configure(connection, opts={'compare_type': True})
+            assert compare_metadata(context, Base.metadata) == []
+            indexes = {index['name'] for index in inspect(connection).get_indexes('futures')}
+        engine.dispose()
+        assert 'ix_futures_user_id_status' in indexes
+
+    def test_original_database_upgrades_to_head(self, tmp_path):
+        """A database from the original create_all is stamped at 0001 and upgraded with its data"""
+        from alembic.autogenerate import compare_metadata
+        from alembic.runtime.migration import MigrationContext
+        from src.database.migrations import migrate
+
+        url = f"sqlite:///{tmp_path / 'agri.db'}"
+        engine = create_db_engine(url)
+        with engine.begin() as connection:
+            for statement in ORIGINAL_SCHEMA:
+                connection.execute(text(statement))
+            connection.execute(text("INSERT INTO crops VALUES (1, 'corn', 2.5, '2024-01-01 00:00:00')"))
+            connection.execute(text(
+                "INSERT INTO users VALUES (1, '+254700000001', 'G1', 'S1', 'FARMER', 'sw', '2024-01-01 00:00:00', "
+                "'Jane', 'F', 'Nakuru', NULL, NULL)"
+            ))
+            connection.execute(text("INSERT INTO wallets VALUES (1, 1, 12.35, 'w1')"))
+            connection.execute(text(
+                "INSERT INTO futures VALUES (1, 1, 1, 100, 2.4, 1.5, '2024-06-01 00:00:00', 'C1', 'active', '2024-01-01 00:00:00')"
+            ))
+
+        before, after = migrate(url=url)
+        assert before == '0001' and after == head_revision()
+
+        with engine.connect() as connection:
+            context = MigrationContext.configure(connection, opts={'compare_type': True})
+            assert compare_metadata(context, Base.metadata) == []
+            assert connection.execute(text("SELECT balance, currency FROM wallets")).one() == (1235, 'KES')
+            assert connection.execute(text("SELECT premium, market_id FROM futures")).one() == (150, None)
+            assert connection.execute(text("SELECT SUM(amount) FROM ledger_entries WHERE account = 'wallet'")).scalar() == 1235
+        engine.dispose()
+
+    def test_money_migration_converts_to_minor_units(self, tmp_path):
+        """Float balances from before 0004 become integer cents"""
+        from src.database.migrations import migrate
+
+        url = f"sqlite:///{tmp_path / 'agri.db'}"
+        migrate('0003', url=url)
+        engine = create_db_engine(url)
+        with engine.begin() as connection:
+            connection.execute(text("INSERT INTO wallets (id, balance, currency, rapyd_wallet_id) VALUES (1, 12.35, 'KES', 'w1'), (2, NULL, 'KES', 'w2')"))
+        migrate('0004', url=url)
+        with engine.connect() as connection:
+            balances = connection.execute(text("SELECT balance FROM wallets ORDER BY id")).scalars().all()
+        engine.dispose()
+        assert balances == [1235, 0]
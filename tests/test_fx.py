@@ -0,0 +1,125 @@
+import json
+import time
+import pytest
+import numpy as np
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.database.models import Base, Crop, Future, Notification, User, UserRole, Wallet, Transaction
+from src.fx import FxRates, RateTable, currency_for_phone, load_rate_file
+from src.jobs.settlement import SettlementEngine
+
+@pytest.fixture
+def table():
+    return RateTable({'KES': 129.0, 'GHS': 15.5, 'TZS': 2600.0}, time.time(), 'test')
+
+class TestRateTable:
+    def test_base_currency_is_always_one(self, table):
+        """The base currency converts to itself"""
+        assert table.rate('USD') == 1.0
+        assert table.convert(2.5, 'usd') == 2.5
+
+    def test_convert_and_back(self, table):
+        """Amounts convert to local currency and strikes back to the base"""
+        assert table.convert(2.5, 'KES') == pytest.approx(322.5)
+        assert table.convert(322.5, 'GHS', 'KES') == pytest.approx(38.75)
+        assert table.to_base(322.5, 'KES') == pytest.approx(2.5)
+
+    def test_unknown_currency_raises(self, table):
+        """Missing rates are an error rather than a silent 1:1 conversion"""
+        with pytest.raises(ValueError):
+            table.rate('EUR')
+
+    def test_convert_many_matches_scalar(self, table):
+        """Vectorized conversion agrees with one-at-a-time conversion"""
+        amounts = np.array([1.0, 2.5, 40.0, 0.333])
+        currencies = ['KES', 'TZS', 'KES', 'USD']
+        converted = table.convert_many(amounts, currencies)
+        assert converted.tolist() == [table.convert(a, c) for a, c in zip(amounts, currencies)]
+
+class TestFxRates:
+    def test_rate_file_json_and_csv(self, tmp_path):
+        """Rate tables load from a saved JSON file or a CSV, rebased to USD"""
+        path = tmp_path / 'rates.json'
+        path.write_text(json.dumps({'base': 'KES', 'timestamp': 100.0, 'rates': {'KES': 1.0, 'USD': 0.008}}))
+        table = load_rate_file(str(path))
+        assert table.rate('KES') == pytest.approx(125.0)
+        assert table.fetched_at == 100.0
+
+        path = tmp_path / 'rates.csv'
+        path.write_text("currency,rate\nGHS,16.0\n")
+        assert load_rate_file(str(path)).rate('GHS') == 16.0
+
+    def test_defaults_until_a_table_loads(self, tmp_path):
+        """Without a URL or file the configured default rates are used"""
+        fx = FxRates(url='', path=str(tmp_path / 'missing.json'))
+        assert fx.table.source == 'default'
+        assert fx.table.rate('KES') > 1.0
+
+    def test_downloaded_rates_are_saved_for_offline_use(self, tmp_path, monkeypatch):
+        """A successful download is written to the rate file and reused offline"""
+        path = str(tmp_path / 'fx_rates.json')
+        response = type('Response', (), {
+            'raise_for_status': lambda self: None,
+            'json': lambda self: {'base': 'USD', 'rates': {'KES': 130.0}}
+        })()
+        session = type('Session', (), {'get': lambda self, url, timeout: response})()
+        monkeypatch.setattr('src.fx.rates.get_http_session', lambda name: session)
+
+        assert FxRates(url='http://rates', path=path).refresh().rate('KES') == 130.0
+        offline = FxRates(url='', path=path)
+        assert offline.table.source == 'file'
+        assert offline.table.rate('KES') == 130.0
+
+    def test_currency_for_phone(self):
+        """Wallet currency follows the dialing code"""
+        assert currency_for_phone('+254700000000') == 'KES'
+        assert currency_for_phone('+233200000000') == 'GHS'
+        assert currency_for_phone('255700000000') == 'TZS'
+
+class TestLocalCurrencySettlement:
+    def test_payouts_credited_in_wallet_currency(self, table):
+        """Settlement converts base-currency payouts into each wallet's currency"""
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        factory = sessionmaker(bind=engine)
+        session = factory()
+        session.add(Crop(id=1, name='corn', current_price=2.0, last_updated=datetime.now()))
+        for user_id, phone, currency in ((1, '+254700000000', 'KES'), (2, '+233200000000', 'GHS')):
+            session.add(User(
+                id=user_id,
+                phone_number=phone,
+                stellar_public_key=f'GTEST{user_id}',
+                stellar_private_key=f'STEST{user_id}',
+                role=UserRole.FARMER,
+                language_preference='en',
+                created_at=datetime.now(),
+                name='Jane',
+                gender='F',
+                location='Nakuru'
+            ))
+            session.add(Wallet(user_id=user_id, balance=0, currency=currency, rapyd_wallet_id=f'ewallet_{user_id}'))
+            session.add(Future(
+                user_id=user_id,
+                crop_id=1,
+                quantity=100,
+                strike_price=2.4,
+                premium=500,
+                expiration_date=datetime.now() - timedelta(days=1),
+                contract_address='FUTURE_TEST',
+                status='active',
+                created_at=datetime.now()
+            ))
+        session.commit()
+        session.close()
+
+        settlement = SettlementEngine(factory, prices={1: 2.0}, rates=table)
+        assert settlement.run() == 2
+        assert settlement.paid_out == pytest.approx(80.0)
+
+        session = factory()
+        balances = {wallet.currency: wallet.balance for wallet in session.query(Wallet)}
+        assert balances == {'KES': 516000, 'GHS': 62000}  # minor units
+        assert sorted(t.amount for t in session.query(Transaction)) == [62000, 516000]
+        payloads = [json.loads(n.payload) for n in session.query(Notification).order_by(Notification.user_id)]
+        assert [(p['payout'], p['currency']) for p in payloads] == [(5160.0, 'KES'), (620.0, 'GHS')]
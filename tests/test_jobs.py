@@ -0,0 +1,248 @@
+import asyncio
+import json
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.database.models import Base, Crop, Future, Notification, ExposureBucket, JobLock, User, UserRole, Wallet, Transaction, LedgerEntry, FutureArchive
+from src.database.exposure import record_open
+from src.jobs.archival import HistoryArchiver
+from src.jobs.expiry import ExpirySweeper
+from src.jobs.settlement import SettlementEngine
+from src.jobs.scheduler import JobScheduler
+from src.sms.notifications import deliver_pending
+from unittest.mock import MagicMock
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    session = factory()
+    session.add(Crop(id=1, name='corn', current_price=2.5, last_updated=datetime.now()))
+    session.add(User(
+        id=1,
+        phone_number='+254700000000',
+        stellar_public_key='GTEST',
+        stellar_private_key='STEST',
+        role=UserRole.FARMER,
+        language_preference='sw',
+        created_at=datetime.now(),
+        name='Jane',
+        gender='F',
+        location='Nakuru'
+    ))
+    session.commit()
+    session.close()
+    return factory
+
+def add_futures(factory, count, expiration_date, status='active'):
+    session = factory()
+    for _ in range(count):
+        future = Future(
+            user_id=1,
+            crop_id=1,
+            quantity=100,
+            strike_price=2.4,
+            premium=500,
+            expiration_date=expiration_date,
+            contract_address='FUTURE_TEST',
+            status=status,
+            created_at=datetime.now()
+        )
+        session.add(future)
+        if status == 'active':
+            record_open(session, future)
+    session.commit()
+    session.close()
+
+class TestExpirySweeper:
+    def test_expires_only_lapsed_contracts_in_batches(self, session_factory):
+        """Lapsed futures expire in bounded batches; live ones are untouched"""
+        now = datetime.now()
+        add_futures(session_factory, 7, now - timedelta(days=1))
+        add_futures(session_factory, 3, now + timedelta(days=30))
+
+        assert ExpirySweeper(session_factory, batch_size=3).run(now) == 7
+
+        session = session_factory()
+        assert session.query(Future).filter_by(status='expired').count() == 7
+        assert session.query(Future).filter_by(status='active').count() == 3
+        assert session.query(Notification).filter_by(event_type='future_expired').count() == 7
+        assert sum(b.open_contracts for b in session.query(ExposureBucket)) == 3
+
+    def test_second_run_is_a_no_op(self, session_factory):
+        """Already expired contracts are not swept again"""
+        now = datetime.now()
+        add_futures(session_factory, 2, now - timedelta(days=1))
+        sweeper = ExpirySweeper(session_factory)
+        assert sweeper.run(now) == 2
+        assert sweeper.run(now) == 0
+
+class TestNotifications:
+    def test_deliver_pending_in_farmer_language(self, session_factory):
+        """Queued expiry events are sent once in the farmer's language"""
+        now = datetime.now()
+        add_futures(session_factory, 1, now - timedelta(days=1))
+        ExpirySweeper(session_factory).run(now)
+
+        messenger = MagicMock()
+        messenger.send_sms.return_value = True
+        session = session_factory()
+        assert deliver_pending(session, messenger) == 1
+        assert deliver_pending(session, messenger) == 0
+
+        phone, message = messenger.send_sms.call_args[0]
+        assert phone == '+254700000000'
+        assert 'umekwisha' in message
+        assert session.query(Notification).one().status == 'sent'
+
+class TestSettlementEngine:
+    def test_in_the_money_contracts_are_paid_at_expiry(self, session_factory):
+        """Lapsed contracts below strike are exercised and credited in bulk"""
+        session = session_factory()
+        session.add(Wallet(user_id=1, balance=1000, currency='USD', rapyd_wallet_id='ewallet_1'))
+        session.commit()
+        session.close()
+
+        now = datetime.now()
+        add_futures(session_factory, 3, now - timedelta(days=1))  # strike 2.4, 100 kg
+
+        engine = SettlementEngine(session_factory, prices={1: 2.0})
+        assert engine.run(now) == 3
+        assert engine.settled == 3
+        assert engine.paid_out == pytest.approx(3 * 40.0)
+
+        session = session_factory()
+        assert session.query(Wallet).one().balance == 13000  # minor units
+        assert session.query(Future).filter_by(status='exercised').count() == 3
+        assert session.query(Transaction).filter_by(transaction_type='payout').count() == 3
+        assert session.query(LedgerEntry).filter_by(account='payout_expense').count() == 3
+        notification = session.query(Notification).one()
+        assert notification.event_type == 'future_settled'
+        assert json.loads(notification.payload)['contracts'] == 3
+
+    def test_out_of_the_money_contracts_expire(self, session_factory):
+        """Lapsed contracts above strike expire with no payout"""
+        now = datetime.now()
+        add_futures(session_factory, 2, now - timedelta(days=1))
+
+        engine = SettlementEngine(session_factory, prices={1: 3.0})
+        assert engine.run(now) == 2
+        assert engine.settled == 0
+
+        session = session_factory()
+        assert session.query(Future).filter_by(status='expired').count() == 2
+        assert session.query(Transaction).count() == 0
+
+    def test_simulated_prices_are_never_settled(self, session_factory):
+        """Contracts wait while their crop's price is simulated, however fresh"""
+        session = session_factory()
+        session.query(Crop).update({'current_price': 1.0, 'price_sources': 'simulated'})
+        session.add(Wallet(user_id=1, balance=0, currency='USD', rapyd_wallet_id='ewallet_1'))
+        session.commit()
+        now = datetime.now()
+        add_futures(session_factory, 2, now - timedelta(days=1))
+
+        engine = SettlementEngine(session_factory)
+        assert engine.run(now) == 0
+        assert session.query(Future).filter_by(status='active').count() == 2
+
+        session.query(Crop).update({'price_sources': 'alpha_vantage'})
+        session.commit()
+        assert engine.run(now) == 2
+        assert engine.settled == 2
+
+class TestHistoryArchiver:
+    def test_moves_closed_futures_and_old_transactions(self, session_factory):
+        """Only closed, long-expired futures and old settled transactions leave the hot tables"""
+        now = datetime.now()
+        add_futures(session_factory, 5, now - timedelta(days=60), status='expired')
+        add_futures(session_factory, 2, now - timedelta(days=60))
+        add_futures(session_factory, 1, now - timedelta(days=1), status='exercised')
+        session = session_factory()
+        for i, status in enumerate(('completed', 'failed', 'pending', 'completed')):
+            session.add(Transaction(
+                wallet_id=1, amount=100, transaction_type='deposit', status=status,
+                created_at=now - timedelta(days=120 if i < 3 else 1)
+            ))
+        session.commit()
+
+        moved = HistoryArchiver(session_factory, batch_size=2).run(now)
+
+        assert moved == {'futures': 5, 'transactions': 2}
+        assert session.query(Future).count() == 3
+        assert session.query(FutureArchive).filter_by(status='expired').count() == 5
+        assert {t.status for t in session.query(Transaction)} == {'pending', 'completed'}
+        assert HistoryArchiver(session_factory).run(now) == {'futures': 0, 'transactions': 0}
+
+    def test_newest_row_is_never_archived(self, session_factory):
+        """The highest id stays behind so SQLite cannot hand it out again"""
+        now = datetime.now()
+        add_futures(session_factory, 3, now - timedelta(days=60), status='expired')
+
+        assert HistoryArchiver(session_factory).run(now)['futures'] == 2
+        add_futures(session_factory, 1, now + timedelta(days=30))
+        session = session_factory()
+        assert [f.id for f in session.query(Future).order_by(Future.id)] == [3, 4]
+
+@pytest.fixture
+def lock_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+class TestJobScheduler:
+    def test_database_lock_prevents_double_runs(self, lock_factory):
+        """A job that just ran on one worker is not run again by another"""
+        calls = []
+        first, second = JobScheduler(lock_factory), JobScheduler(lock_factory)
+        for scheduler in (first, second):
+            scheduler.register('refresh', lambda: calls.append(1), interval=60)
+
+        assert asyncio.run(first.run_once('refresh')) is True
+        assert asyncio.run(second.run_once('refresh')) is False
+        assert len(calls) == 1
+        assert second.jobs['refresh'].skipped == 1
+
+        lock = lock_factory().get(JobLock, 'refresh')
+        assert lock.last_status == 'success'
+        assert lock.locked_until is None
+        assert lock.run_count == 1
+
+    def test_failures_are_recorded(self, lock_factory):
+        """A failing job is counted and its error kept"""
+        def broken():
+            raise RuntimeError("upstream down")
+
+        scheduler = JobScheduler(lock_factory)
+        scheduler.register('broken', broken, interval=60)
+        asyncio.run(scheduler.run_once('broken'))
+
+        metrics = scheduler.metrics()['broken']
+        assert metrics['failures'] == 1
+        assert metrics['last_error'] == "upstream down"
+        assert lock_factory().get(JobLock, 'broken').last_status == 'failed'
+
+    def test_loop_respects_concurrency_limit(self, lock_factory):
+        """Slow runs are not overlapped beyond max_concurrency"""
+        state = {'running': 0, 'peak': 0}
+
+        async def slow():
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+            await asyncio.sleep(0.05)
+            state['running'] -= 1
+
+        async def scenario():
+            scheduler = JobScheduler(lock_factory)
+            scheduler.register('slow', slow, interval=0.01, jitter=0, singleton=False, max_concurrency=2)
+            await scheduler.start()
+            await asyncio.sleep(0.3)
+            await scheduler.stop()
+            return scheduler
+
+        scheduler = asyncio.run(scenario())
+        assert state['peak'] == 2
+        assert scheduler.jobs['slow'].runs >= 4
+        assert scheduler.jobs['slow'].skipped > 0
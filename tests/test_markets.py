@@ -0,0 +1,136 @@
+import random
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from src.database.models import Base, Crop, Future, Market, MarketPrice, User, UserRole, Wallet
+from src.fx import RateTable
+from src.jobs.settlement import SettlementEngine
+from src.markets import Gazetteer, KDTree, MarketRegistry, haversine_km, reference_price
+from src.oracle.refresher import PriceRefresher
+from src.oracle.sources import FileFeedSource
+from unittest.mock import MagicMock
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={'check_same_thread': False})
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    session = factory()
+    session.add(Crop(id=1, name='corn', current_price=2.5, last_updated=datetime.now()))
+    session.add(Market(id=1, name='nairobi', latitude=-1.2864, longitude=36.8172))
+    session.add(Market(id=2, name='eldoret', latitude=0.5143, longitude=35.2698))
+    session.add(Market(id=3, name='kumasi', latitude=6.6885, longitude=-1.6244))
+    session.commit()
+    session.close()
+    return factory
+
+def make_user(location, **kwargs):
+    return User(
+        phone_number='+254700000000',
+        stellar_public_key='GTEST',
+        stellar_private_key='STEST',
+        role=UserRole.FARMER,
+        language_preference='en',
+        created_at=datetime.now(),
+        name='Jane',
+        gender='F',
+        location=location,
+        **kwargs
+    )
+
+class TestKDTree:
+    def test_matches_brute_force(self):
+        """The tree finds the same nearest point as a linear haversine scan"""
+        rng = random.Random(7)
+        points = [(rng.uniform(-35, 35), rng.uniform(-20, 50)) for _ in range(300)]
+        tree = KDTree(points)
+        for _ in range(200):
+            lat, lon = rng.uniform(-40, 40), rng.uniform(-25, 55)
+            index, distance = tree.nearest(lat, lon)
+            expected = min(range(len(points)), key=lambda i: haversine_km(lat, lon, *points[i]))
+            assert index == expected
+            assert distance == pytest.approx(haversine_km(lat, lon, *points[index]), rel=1e-6)
+
+    def test_empty_tree(self):
+        """An empty index finds nothing"""
+        assert KDTree([]).nearest(0.0, 0.0) is None
+
+class TestMarketRegistry:
+    def test_gazetteer_lookups(self):
+        """Place names resolve regardless of case and extra words"""
+        gazetteer = Gazetteer({'nakuru': (-0.3031, 36.08), 'dar es salaam': (-6.79, 39.21)}, path='')
+        assert gazetteer.geocode('Nakuru Town') == (-0.3031, 36.08)
+        assert gazetteer.geocode('Dar es Salaam') == (-6.79, 39.21)
+        assert gazetteer.geocode('Atlantis') is None
+
+    def test_assign_nearest_market(self, session_factory):
+        """A farmer is geocoded and attached to the closest market"""
+        registry = MarketRegistry(session_factory)
+        user = make_user('Naivasha')
+        market = registry.assign(user)
+        assert market.name == 'nairobi'
+        assert user.market_id == 1
+        assert user.latitude == pytest.approx(-0.7172)
+        assert registry.assign(make_user('Kitale')).name == 'eldoret'
+
+        unknown = make_user('Atlantis')
+        assert registry.assign(unknown) is None
+        assert unknown.market_id is None
+
+    def test_reference_price_falls_back_to_global(self, session_factory):
+        """Fresh market prices win; stale or missing ones fall back to the crop price"""
+        session = session_factory()
+        crop = session.get(Crop, 1)
+        session.add(MarketPrice(market_id=1, crop_id=1, price=2.1, last_updated=datetime.now()))
+        session.add(MarketPrice(market_id=2, crop_id=1, price=1.9, last_updated=datetime.now() - timedelta(days=1)))
+        session.commit()
+
+        assert reference_price(session, crop, 1).price == 2.1
+        assert reference_price(session, crop, 1).market_id == 1
+        assert reference_price(session, crop, 2).price == 2.5
+        assert reference_price(session, crop, None).market_id is None
+
+class TestMarketPricing:
+    def test_refresher_stores_market_feed_prices(self, session_factory, tmp_path):
+        """Feed files named after a market update that market's prices"""
+        (tmp_path / 'nairobi.csv').write_text(f"crop,price,timestamp\ncorn,2.2,{datetime.now().timestamp()}\n")
+        (tmp_path / 'cooperative.csv').write_text("crop,price\ncorn,2.6\n")
+        oracle = MagicMock()
+        oracle.sources = [FileFeedSource(str(tmp_path))]
+
+        refresher = PriceRefresher(oracle, session_factory)
+        assert refresher.store_market_prices() == 1
+        assert refresher.store_market_prices() == 0
+
+        row = session_factory().query(MarketPrice).one()
+        assert (row.market_id, row.price, row.source) == (1, 2.2, 'feed:nairobi')
+
+    def test_settlement_uses_contract_market_price(self, session_factory):
+        """Contracts settle at their market's price, others at the global price"""
+        session = session_factory()
+        session.add(make_user('Naivasha', id=1, market_id=1))
+        session.add(Wallet(user_id=1, balance=0, currency='USD', rapyd_wallet_id='ewallet_1'))
+        for market_id in (1, None):
+            session.add(Future(
+                user_id=1,
+                crop_id=1,
+                quantity=100,
+                strike_price=2.4,
+                premium=500,
+                expiration_date=datetime.now() - timedelta(days=1),
+                contract_address='FUTURE_TEST',
+                status='active',
+                created_at=datetime.now(),
+                market_id=market_id
+            ))
+        session.commit()
+        session.close()
+
+        rates = RateTable({}, datetime.now().timestamp(), 'test')
+        engine = SettlementEngine(session_factory, prices={1: 2.5}, rates=rates, market_prices={(1, 1): 2.0})
+        assert engine.run() == 2
+        assert engine.settled == 1
+        assert engine.paid_out == pytest.approx(40.0)
+        assert session_factory().query(Wallet).one().balance == 4000
@@ -0,0 +1,481 @@
+import json
+import os
+import time
+import threading
+import numpy as np
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from config.config import Config
+from src.database.models import Base, Crop
+from src.oracle.cache import SharedPriceCache
+from src.oracle.price_oracle import PriceOracle
+from src.oracle.refresher import PriceRefresher, is_price_stale
+from src.oracle.http import CircuitBreaker
+from src.oracle.simulator import PriceSimulator
+from src.oracle.sources import FileFeedSource, PriceSource, SourceQuote, aggregate
+from src.oracle import volatility as volatility_module
+from src.oracle.volatility import VolatilityEstimator, VolatilityTracker
+from src.oracle.throttle import QuotaLimiter, SingleFlight
+from src.oracle.ticks import SEGMENT_SECONDS, TickStore, downsample
+from unittest.mock import MagicMock
+
+def memory_session_factory():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={'check_same_thread': False})
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+@pytest.fixture
+def cache_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'prices.db')
+    monkeypatch.setattr(Config, 'PRICE_CACHE_PATH', path)
+    monkeypatch.setattr(Config, 'TICK_STORE_PATH', str(tmp_path / 'ticks'))
+    monkeypatch.setattr(volatility_module, '_tracker', VolatilityTracker(memory_session_factory()))
+    return path
+
+@pytest.fixture
+def cache(cache_path):
+    return SharedPriceCache(cache_path, ttls={'coffee': 1}, default_ttl=60)
+
+class TestSharedPriceCache:
+    def test_fresh_and_stale_reads(self, cache):
+        """Prices are fresh within their crop's TTL"""
+        cache.set('corn', 2.5, 'alpha_vantage')
+        cache.set('coffee', 10.0, 'alpha_vantage', fetched_at=time.time() - 5)
+
+        assert cache.get_fresh('corn').price == 2.5
+        assert cache.get_fresh('coffee') is None
+        assert cache.get('coffee').price == 10.0
+        assert cache.stats() == {'hits': 1, 'misses': 1}
+
+    def test_visible_across_instances(self, cache, cache_path):
+        """A second instance (another worker) sees the same prices"""
+        cache.set('wheat', 3.0, 'simulated')
+        other = SharedPriceCache(cache_path)
+        assert other.get('wheat').source == 'simulated'
+
+    def test_only_one_refresh_lease(self, cache, cache_path):
+        """Only one worker can claim a stale crop until it stores a price"""
+        other = SharedPriceCache(cache_path, default_ttl=60)
+        assert cache.claim_refresh('rice') is True
+        assert other.claim_refresh('rice') is False
+        cache.set('rice', 4.0, 'alpha_vantage')
+        # Fresh again, so nobody needs to refresh
+        assert other.claim_refresh('rice') is False
+
+class TestPriceOracleCaching:
+    def test_concurrent_misses_hit_upstream_once(self, cache_path, monkeypatch):
+        """Many workers asking for a stale price cause one upstream call"""
+        calls = []
+
+        def slow_upstream(self, crop_name):
+            calls.append(crop_name)
+            time.sleep(0.2)
+            return 2.75
+
+        monkeypatch.setattr(PriceOracle, '_get_alpha_vantage_price', slow_upstream)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(PriceOracle().get_crop_price('corn')))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert calls == ['corn']
+        assert results == [2.75] * 8
+
+    def test_unsupported_crop(self, cache_path):
+        """Unknown crops return None"""
+        assert PriceOracle().get_crop_price('cassava') is None
+
+class TestStaleWhileRevalidate:
+    def test_stale_price_served_while_refreshing(self, cache_path, monkeypatch):
+        """A stale price is returned at once and replaced in the background"""
+        monkeypatch.setattr(PriceOracle, '_get_alpha_vantage_price', lambda self, crop: 2.9)
+        oracle = PriceOracle()
+        oracle.price_cache.set('corn', 2.5, 'alpha_vantage', fetched_at=time.time() - 1000)
+
+        quote = oracle.get_crop_quote('corn')
+        assert quote.price == 2.5
+        assert oracle.price_cache.wait_for_fresh('corn', timeout=2).price == 2.9
+
+    def test_very_old_price_is_fetched_synchronously(self, cache_path, monkeypatch):
+        """Prices past the grace period are not served"""
+        monkeypatch.setattr(PriceOracle, '_get_alpha_vantage_price', lambda self, crop: 2.9)
+        oracle = PriceOracle()
+        oracle.price_cache.set('corn', 2.5, 'alpha_vantage', fetched_at=time.time() - 2 * Config.PRICE_STALE_GRACE)
+        assert oracle.get_crop_price('corn') == 2.9
+
+class TestPriceRefresher:
+    def test_refresh_all_writes_crops_in_one_batch(self, cache_path, monkeypatch):
+        """Every crop is refreshed and stored with its fetch time"""
+        engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={'check_same_thread': False})
+        Base.metadata.create_all(engine)
+        factory = sessionmaker(bind=engine)
+        session = factory()
+        old = datetime.now() - timedelta(hours=2)
+        session.add_all([Crop(name=name, current_price=1.0, last_updated=old) for name in ('corn', 'wheat')])
+        session.commit()
+
+        monkeypatch.setattr(PriceOracle, '_get_alpha_vantage_price', lambda self, crop: 7.5)
+        quotes = PriceRefresher(session_factory=factory).refresh_all()
+
+        assert set(quotes) == {'corn', 'wheat', 'rice', 'soybeans', 'coffee'}
+        session.expire_all()
+        for crop in session.query(Crop):
+            assert crop.current_price == 7.5
+            assert not is_price_stale(crop.last_updated)
+
+    def test_stale_prices_are_rejected(self):
+        """Exercise and settlement refuse old or missing prices"""
+        assert is_price_stale(None)
+        assert is_price_stale(datetime.now() - timedelta(seconds=Config.MAX_EXERCISE_PRICE_AGE + 60))
+        assert not is_price_stale(datetime.now())
+
+class TestUpstreamFetching:
+    def test_circuit_opens_after_repeated_failures(self):
+        """The breaker short-circuits after the threshold and lets one trial through later"""
+        breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=0.1)
+        for _ in range(3):
+            assert breaker.allow()
+            breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+
+        time.sleep(0.15)
+        assert breaker.allow()
+        assert not breaker.allow()  # only one trial while half-open
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_open_circuit_falls_back_without_calling_upstream(self, cache_path):
+        """With the circuit open the oracle serves a simulated price immediately"""
+        oracle = PriceOracle()
+        oracle.http = MagicMock()
+        oracle.breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=60)
+        oracle.breaker.record_failure()
+        oracle.ticks = TickStore(Config.TICK_STORE_PATH)
+        oracle.volatility = MagicMock()
+
+        assert oracle.get_crop_price('corn') is not None
+        oracle.http.get.assert_not_called()
+        assert oracle.price_cache.get('corn').source == 'simulated'
+        # Simulated prices never enter the price history or volatility estimates
+        assert len(oracle.ticks.range('corn', time.time() - 60, time.time() + 1)) == 0
+        oracle.volatility.record.assert_not_called()
+
+    def test_requests_use_timeouts(self, cache_path):
+        """Every upstream request carries connect and read timeouts"""
+        oracle = PriceOracle()
+        oracle.http = MagicMock()
+        oracle.http.get.return_value.json.return_value = {'Global Quote': {'05. price': '4.321'}}
+        oracle.breaker = CircuitBreaker('test')
+
+        assert oracle._get_alpha_vantage_price('rice') == 4.32
+        assert oracle.http.get.call_args.kwargs['timeout'] == (
+            Config.PRICE_FETCH_CONNECT_TIMEOUT, Config.PRICE_FETCH_READ_TIMEOUT
+        )
+
+    def test_all_crops_fetched_concurrently(self, cache_path, monkeypatch):
+        """Refreshing every crop takes about one upstream round trip, not five"""
+        def slow_upstream(self, crop_name):
+            time.sleep(0.2)
+            return 1.0
+
+        monkeypatch.setattr(PriceOracle, '_get_alpha_vantage_price', slow_upstream)
+        started = time.monotonic()
+        quotes = PriceOracle().fetch_all_prices()
+        assert len(quotes) == 5
+        assert time.monotonic() - started < 0.6
+
+class TestTickStore:
+    def test_range_spans_daily_segments(self, tmp_path):
+        """Ticks are split into one file per day and read back in order"""
+        store = TickStore(str(tmp_path))
+        day = 19000 * SEGMENT_SECONDS
+        timestamps = day + np.arange(0, 3 * SEGMENT_SECONDS, 3600.0)
+        store.append_many('corn', timestamps, np.arange(len(timestamps), dtype=float))
+
+        assert len(os.listdir(tmp_path / 'corn')) == 3
+        ticks = store.range('corn', day + 1800, day + 2 * SEGMENT_SECONDS)
+        assert ticks['ts'][0] == day + 3600
+        assert len(ticks) == 47
+        assert np.all(np.diff(ticks['ts']) > 0)
+        assert len(store.range('wheat', day, day + SEGMENT_SECONDS)) == 0
+
+    def test_out_of_order_appends_are_sorted(self, tmp_path):
+        """Late writers do not break range queries"""
+        store = TickStore(str(tmp_path))
+        base = 19000 * SEGMENT_SECONDS
+        for offset in (30, 10, 20):
+            store.append('rice', float(offset), base + offset)
+
+        ticks = store.range('rice', base, base + 60)
+        assert ticks['price'].tolist() == [10.0, 20.0, 30.0]
+
+    def test_ohlc_bars(self):
+        """Downsampling keeps open, high, low, close and count per bar"""
+        ticks = np.zeros(5, dtype=[('ts', '<f8'), ('price', '<f8')])
+        ticks['ts'] = [0, 20, 40, 60, 130]
+        ticks['price'] = [2.0, 3.0, 1.0, 5.0, 4.0]
+
+        bars = downsample(ticks, 60)
+        assert bars['ts'].tolist() == [0, 60, 120]
+        assert bars['open'].tolist() == [2.0, 5.0, 4.0]
+        assert bars['high'].tolist() == [3.0, 5.0, 4.0]
+        assert bars['low'].tolist() == [1.0, 5.0, 4.0]
+        assert bars['close'].tolist() == [1.0, 5.0, 4.0]
+        assert bars['count'].tolist() == [3, 1, 1]
+
+    def test_oracle_records_fetched_prices(self, cache_path, monkeypatch):
+        """Every upstream fetch lands in the tick store"""
+        monkeypatch.setattr(PriceOracle, '_get_alpha_vantage_price', lambda self, crop: 3.3)
+        oracle = PriceOracle()
+        oracle.ticks = TickStore(Config.TICK_STORE_PATH)
+        oracle.refresh('soybeans')
+
+        ticks = oracle.ticks.range('soybeans', time.time() - 60, time.time() + 1)
+        assert ticks['price'].tolist() == [3.3]
+
+class TestThrottling:
+    def test_single_flight_coalesces_concurrent_calls(self):
+        """Callers arriving during a call share its result"""
+        flight = SingleFlight()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return 4.2
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do('corn', fetch))) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert results == [4.2] * 6
+        assert flight.coalesced == 5
+        assert flight.do('corn', lambda: 5.0) == 5.0  # nothing is cached afterwards
+
+    def test_quota_is_shared_and_refills(self, cache_path):
+        """Workers draw from one bucket per limit, refilled over its period"""
+        limits = {'minute': (3, 0.3), 'day': (5, 86400.0)}
+        first = QuotaLimiter('test', limits, cache_path)
+        second = QuotaLimiter('test', limits, cache_path)
+
+        assert [first.acquire(), second.acquire(), first.acquire()] == [True, True, True]
+        assert not second.acquire()
+        time.sleep(0.2)
+        assert first.acquire()
+        assert second.remaining()['day'] == pytest.approx(1.0, abs=0.01)
+
+    def test_refresh_spacing_follows_quota(self, cache_path):
+        """Refreshes are spread so the daily quota lasts the whole day"""
+        limiter = QuotaLimiter('test', {'minute': (5, 60.0), 'day': (500, 86400.0)}, cache_path)
+        assert limiter.spacing(5) == pytest.approx(864.0)
+
+        oracle = PriceOracle()
+        oracle.quota = limiter
+        assert oracle.refresh_interval('corn') == pytest.approx(864.0)
+
+    def test_exhausted_quota_keeps_cached_price(self, cache_path, monkeypatch):
+        """Out of quota, the last real price is kept instead of a simulated one"""
+        upstream = MagicMock(return_value=9.9)
+        monkeypatch.setattr(PriceOracle, '_get_alpha_vantage_price', upstream)
+        oracle = PriceOracle()
+        oracle.quota = QuotaLimiter('test', {'minute': (1, 60.0)}, cache_path)
+        oracle.quota.acquire()
+        oracle.price_cache.set('wheat', 3.1, 'alpha_vantage', fetched_at=time.time() - 2 * Config.PRICE_STALE_GRACE)
+
+        quote = oracle.get_crop_quote('wheat')
+        assert (quote.price, quote.source) == (3.1, 'alpha_vantage')
+        upstream.assert_not_called()
+
+class StaticSource(PriceSource):
+    def __init__(self, name, price, weight=1.0):
+        super().__init__(weight)
+        self.name = name
+        self.price = price
+
+    def fetch(self, crop_name):
+        return [SourceQuote(self.name, self.price, time.time())]
+
+class TestPriceSources:
+    def test_outliers_are_rejected(self):
+        """One wild source does not move the price"""
+        now = time.time()
+        quotes = [(SourceQuote(name, price, now), 1.0) for name, price in (('a', 10.0), ('b', 10.2), ('c', 9.9), ('d', 55.0))]
+        combined = aggregate(quotes, now=now)
+        assert combined.price == 10.0
+        assert combined.sources == ['a', 'b', 'c']
+        assert combined.rejected == ['d']
+
+    def test_fresher_quotes_weigh_more(self):
+        """An old quote loses to a recent one and expired quotes are ignored"""
+        now = time.time()
+        quotes = [
+            (SourceQuote('old', 10.0, now - 4 * 3600), 1.0),
+            (SourceQuote('new', 10.1, now), 1.0),
+            (SourceQuote('ancient', 10.05, now - 3 * 86400), 5.0)
+        ]
+        combined = aggregate(quotes, now=now, half_life=3600, max_age=86400)
+        assert combined.price == 10.1
+        assert combined.fetched_at == now
+        assert aggregate([quotes[2]], now=now, max_age=86400) is None
+
+    def test_file_feeds(self, tmp_path):
+        """CSV and JSON files are separate sources using their newest row"""
+        (tmp_path / 'nairobi.csv').write_text(
+            "crop,price,timestamp\n"
+            "corn,2.40,2026-01-01T08:00:00\n"
+            "corn,2.45,2026-01-01T09:00:00\n"
+            "wheat,3.10,\n"
+        )
+        (tmp_path / 'kampala.json').write_text(json.dumps([{'crop': 'Corn', 'price': 2.5, 'timestamp': 1767254400}]))
+        source = FileFeedSource(str(tmp_path))
+
+        quotes = {quote.source: quote for quote in source.fetch('corn')}
+        assert quotes['feed:nairobi'].price == 2.45
+        assert quotes['feed:nairobi'].fetched_at == datetime(2026, 1, 1, 9).timestamp()
+        assert quotes['feed:kampala'].price == 2.5
+        assert source.fetch('wheat')[0].fetched_at == os.path.getmtime(tmp_path / 'nairobi.csv')
+
+    def test_oracle_records_sources(self, cache_path):
+        """The stored price names the sources that agreed on it"""
+        oracle = PriceOracle()
+        oracle.sources = [
+            StaticSource('alpha_vantage', 2.5),
+            StaticSource('feed:x', 2.52),
+            StaticSource('feed:y', 2.51),
+            StaticSource('feed:z', 9.0)
+        ]
+
+        quote = oracle.get_crop_quote('corn')
+        assert quote.price == 2.51
+        assert quote.source == 'alpha_vantage,feed:x,feed:y'
+
+class TestPriceSimulator:
+    def test_seeded_paths_are_reproducible(self):
+        """The same seed gives the same paths, with one column per crop"""
+        first = PriceSimulator(['corn', 'wheat'], [2.5, 3.0], seed=42).paths(100, 30)
+        second = PriceSimulator(['corn', 'wheat'], [2.5, 3.0], seed=42).paths(100, 30)
+        assert first.shape == (100, 30, 2)
+        assert np.array_equal(first, second)
+        assert np.all(first > 0)
+
+    def test_paths_are_correlated(self):
+        """Daily returns follow the configured correlation"""
+        correlation = np.array([[1.0, 0.8], [0.8, 1.0]])
+        simulator = PriceSimulator(['corn', 'wheat'], [2.5, 3.0], correlation=correlation, seed=1)
+        returns = np.diff(simulator.log_returns(2000, 20), axis=1).reshape(-1, 2)
+        assert np.corrcoef(returns.T)[0, 1] == pytest.approx(0.8, abs=0.03)
+
+    def test_gbm_is_a_martingale_without_drift(self):
+        """The mean terminal price stays at spot"""
+        simulator = PriceSimulator(['corn'], [2.5], volatilities={'corn': 0.3}, drifts={}, seed=3)
+        assert simulator.paths(20000, 90)[:, -1, 0].mean() == pytest.approx(2.5, rel=0.01)
+
+    def test_mean_reversion_pulls_towards_long_run(self):
+        """Mean-reverting crops drift to their long-run level"""
+        simulator = PriceSimulator(
+            ['coffee'], [10.0], volatilities={'coffee': 0.1},
+            mean_reversion={'coffee': 20.0}, long_run={'coffee': 8.0}, seed=5
+        )
+        terminal = simulator.paths(2000, 180)[:, -1, 0]
+        assert np.median(terminal) == pytest.approx(8.0, rel=0.02)
+
+    def test_seasonality_starts_at_spot(self):
+        """The seasonal factor is relative to the start date"""
+        simulator = PriceSimulator(
+            ['corn'], [2.5], volatilities={'corn': 1e-9}, seasonality={'corn': (0.1, 200)},
+            start=datetime(2026, 1, 1), seed=0
+        )
+        prices = simulator.paths(1, 365)[0, :, 0]
+        assert prices[-1] == pytest.approx(2.5, rel=1e-3)
+        assert prices.argmax() + 1 == pytest.approx(199, abs=1)
+
+    def test_live_path_feeds_the_oracle_fallback(self, cache_path):
+        """Simulated oracle prices come from one continuous path"""
+        simulator = PriceSimulator(['corn'], [2.5], seed=9)
+        assert simulator.advance(0)['corn'] == 2.5
+        moved = simulator.advance(86400)['corn']
+        assert moved != 2.5
+        assert simulator.advance(0)['corn'] == moved
+        assert PriceOracle()._get_simulated_price('wheat') > 0
+
+def gbm_ticks(volatility, days, step=3600, seed=0, start=1_700_000_000):
+    rng = np.random.default_rng(seed)
+    n = int(days * 86400 / step)
+    dt = step / (365.0 * 86400)
+    log_prices = np.cumsum(volatility * np.sqrt(dt) * rng.standard_normal(n))
+    return start + step * np.arange(1, n + 1), 2.5 * np.exp(log_prices)
+
+class TestVolatility:
+    def test_estimates_converge_to_true_volatility(self):
+        """EWMA and realized windows recover the volatility of simulated ticks"""
+        estimator = VolatilityEstimator()
+        timestamps, prices = gbm_ticks(0.3, 60)
+        for ts, price in zip(timestamps, prices):
+            estimator.update(price, ts)
+
+        assert estimator.observations == len(prices) - 1
+        assert estimator.ewma_volatility == pytest.approx(0.3, rel=0.15)
+        realized = estimator.realized(now=timestamps[-1])
+        assert realized['30d'] == pytest.approx(0.3, rel=0.1)
+        assert realized['1d'] is not None
+        # No ticks for two days: the one-day window is empty
+        assert estimator.realized(now=timestamps[-1] + 2 * 86400)['1d'] is None
+
+    def test_close_ticks_fold_into_one_return(self):
+        """Ticks closer than the minimum interval do not create returns"""
+        estimator = VolatilityEstimator(min_interval=60)
+        for offset, price in ((0, 2.0), (10, 2.5), (20, 1.5), (60, 2.2)):
+            estimator.update(price, 1000.0 + offset)
+        assert estimator.observations == 1
+        assert estimator.anchor_price == 2.2
+
+    def test_tracker_persists_and_gates_on_observations(self, monkeypatch):
+        """Estimates survive a restart and are used only with enough data"""
+        monkeypatch.setattr(Config, 'VOLATILITY_MIN_OBSERVATIONS', 10)
+        factory = memory_session_factory()
+        tracker = VolatilityTracker(factory, cache_ttl=0)
+        timestamps, prices = gbm_ticks(0.5, 1, seed=2)
+        for ts, price in list(zip(timestamps, prices))[:5]:
+            tracker.record('corn', price, ts)
+        assert tracker.volatility('corn') is None
+        assert tracker.volatilities(['corn'])['corn'] == Config.CROP_VOLATILITIES['corn']
+
+        restarted = VolatilityTracker(factory, cache_ttl=0)
+        for ts, price in list(zip(timestamps, prices))[5:]:
+            restarted.record('corn', price, ts)
+        assert restarted.estimate('corn')['observations'] == len(prices) - 1
+        assert Config.VOLATILITY_FLOOR <= restarted.volatility('corn') <= Config.VOLATILITY_CAP
+
+    def test_tracker_leaves_the_callers_scoped_session_alone(self, scoped_session):
+        """Recording a tick neither closes nor commits the thread's Session"""
+        session = scoped_session()
+        session.add(Crop(name='corn', current_price=2.5, last_updated=datetime.now()))
+        session.commit()
+        crop = session.query(Crop).one()
+        crop.current_price = 2.7
+
+        VolatilityTracker(cache_ttl=0).record('corn', 2.5, time.time())
+        assert crop in scoped_session()
+        session.rollback()
+        assert crop.current_price == 2.5
+
+    def test_oracle_fetches_update_estimates(self, cache_path, monkeypatch):
+        """Every fetched price is fed to the crop's estimator"""
+        monkeypatch.setattr(PriceOracle, '_get_alpha_vantage_price', lambda self, crop: 3.0)
+        oracle = PriceOracle()
+        oracle.refresh('rice')
+        assert oracle.volatility.estimate('rice')['observations'] == 0
+        assert oracle.volatility.estimate('rice')['as_of'] is not None
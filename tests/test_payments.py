@@ -1,4 +1,10 @@
 import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.database.models import Base, LedgerEntry, Wallet
+from datetime import datetime, timedelta
+from src.payments import ledger
+from src.payments.money import credit_wallet, debit_wallet, format_amount, from_minor, to_minor
 from src.payments.rapyd import RapydClient
 from unittest.mock import patch, MagicMock
 
@@ -75,4 +81,97 @@ class TestRapydMobileMoneyIntegration:
                 currency='KES'
             )
             
-            assert result == 'payout_123' 
\ No newline at end of file
+            assert result == 'payout_123' 
+
+@pytest.fixture
+def wallet_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'wallets.db'}")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    session = factory()
+    session.add(Wallet(id=1, user_id=1, balance=to_minor(10), currency='KES', rapyd_wallet_id='ewallet_1'))
+    session.commit()
+    session.close()
+    return factory
+
+class TestMinorUnits:
+    def test_conversions_round_half_up(self):
+        """Amounts convert to whole cents exactly"""
+        assert to_minor(12.345) == 1235
+        assert to_minor(0.1 + 0.2) == 30
+        assert from_minor(1235) == pytest.approx(12.35)
+        assert format_amount(1235) == '12.35'
+        assert format_amount(-5) == '-0.05'
+
+    def test_debit_refuses_overdraft(self, wallet_factory):
+        """A debit larger than the balance changes nothing"""
+        session = wallet_factory()
+        assert debit_wallet(session, 1, to_minor(6))
+        assert not debit_wallet(session, 1, to_minor(6))
+        credit_wallet(session, 1, 50)
+        session.commit()
+        assert session.query(Wallet).one().balance == 450
+
+    def test_concurrent_debits_cannot_double_spend(self, wallet_factory):
+        """Two sessions that both saw enough funds cannot both spend them"""
+        first, second = wallet_factory(), wallet_factory()
+        assert first.query(Wallet).one().balance == second.query(Wallet).one().balance == 1000
+        assert debit_wallet(first, 1, 700)
+        first.commit()
+        assert not debit_wallet(second, 1, 700)
+        second.commit()
+        assert wallet_factory().query(Wallet).one().balance == 300
+
+class TestLedger:
+    def test_movements_are_journaled_in_balanced_pairs(self, wallet_factory):
+        """Every debit and credit writes a wallet leg and an offsetting platform leg"""
+        session = wallet_factory()
+        ledger.post(session, 1, 1000, 'KES', 'opening')
+        assert ledger.debit(session, 1, 300, 'KES', 'premium')
+        assert not ledger.debit(session, 1, 5000, 'KES', 'premium')
+        ledger.credit(session, 1, 50, 'KES', 'payout', future_id=7)
+        session.commit()
+
+        entries = session.query(LedgerEntry).order_by(LedgerEntry.id).all()
+        assert len(entries) == 6
+        assert sum(entry.amount for entry in entries) == 0
+        assert [e.account for e in entries if e.journal_id == entries[-1].journal_id] == ['wallet', 'payout_expense']
+        assert session.query(Wallet).one().balance == ledger.wallet_balance(session, 1) == 750
+
+    def test_premium_is_linked_to_the_future_it_bought(self, wallet_factory):
+        """A premium debited before its future existed ends up carrying the future's id on both legs"""
+        session = wallet_factory()
+        journal_id = ledger.debit(session, 1, 300, 'KES', 'premium')
+        other = ledger.debit(session, 1, 100, 'KES', 'premium')
+        ledger.link_future(session, journal_id, 7)
+        session.commit()
+
+        linked = {(entry.journal_id, entry.future_id) for entry in session.query(LedgerEntry)}
+        assert linked == {(journal_id, 7), (other, None)}
+
+    def test_snapshot_plus_tail_equals_balance(self, wallet_factory):
+        """Balances read from a snapshot include entries written after it"""
+        session = wallet_factory()
+        ledger.post(session, 1, 1000, 'KES', 'opening')
+        ledger.credit(session, 1, 200, 'KES', 'deposit')
+        session.commit()
+        assert ledger.snapshot_balances(session, lag=0, now=datetime.now() + timedelta(seconds=1)) == 1
+        session.commit()
+
+        ledger.debit(session, 1, 500, 'KES', 'premium')
+        session.commit()
+        assert ledger.wallet_balance(session, 1) == 700
+        report = ledger.verify_ledger(session, batch_size=2)
+        assert report['ok'] and report['entries'] == 6
+        assert report['accounts'] == {'opening_balance:KES': -1000, 'premium_income:KES': 500, 'rapyd_clearing:KES': -200}
+
+    def test_verify_reports_balances_changed_outside_the_ledger(self, wallet_factory):
+        """A balance edited without a journal shows up as a mismatch"""
+        session = wallet_factory()
+        ledger.post(session, 1, 1000, 'KES', 'opening')
+        credit_wallet(session, 1, 1)
+        session.commit()
+
+        report = ledger.verify_ledger(session)
+        assert not report['ok']
+        assert report['mismatched'] == [{'wallet_id': 1, 'balance': 1001, 'ledger': 1000, 'snapshot': 1000}]
@@ -0,0 +1,82 @@
+import pytest
+import numpy as np
+from src.pricing.options import PremiumPricer, black76_put, norm_cdf
+
+@pytest.fixture
+def pricer():
+    return PremiumPricer(
+        volatilities={'corn': 0.25},
+        rate=0.05,
+        expiry_days=90,
+        strike_tick=0.01,
+        min_premium=1.0
+    )
+
+class TestBlack76:
+    def test_norm_cdf_reference_values(self):
+        """CDF approximation matches known values"""
+        values = norm_cdf([-1.96, 0.0, 1.0])
+        assert values == pytest.approx([0.0249979, 0.5, 0.8413447], abs=1e-6)
+
+    def test_at_the_money_put_has_time_value(self):
+        """An at-the-money put is worth more than zero before expiry"""
+        premium = float(black76_put(2.5, 2.5, 0.25, 0.25, 0.05))
+        # Brenner-Subrahmanyam approximation: 0.4 * F * sigma * sqrt(T)
+        assert premium == pytest.approx(0.4 * 2.5 * 0.25 * 0.5, rel=0.05)
+
+    def test_expired_put_is_intrinsic(self):
+        """With no time left the premium is the intrinsic value"""
+        assert float(black76_put(2.0, 2.5, 0.25, 0.0, 0.05)) == pytest.approx(0.5)
+        assert float(black76_put(3.0, 2.5, 0.25, 0.0, 0.05)) == 0.0
+
+    def test_put_increases_with_strike_and_volatility(self):
+        """Higher strikes and higher volatility cost more"""
+        by_strike = black76_put(2.5, np.array([2.0, 2.5, 3.0]), 0.25, 0.25, 0.05)
+        assert np.all(np.diff(by_strike) > 0)
+        by_vol = black76_put(2.5, 2.5, np.array([0.1, 0.3, 0.5]), 0.25, 0.05)
+        assert np.all(np.diff(by_vol) > 0)
+
+class TestPremiumPricer:
+    def test_premium_scales_with_quantity(self, pricer):
+        """Premium for a farmer's contract is the per-kg premium times quantity"""
+        small = pricer.quote('corn', 2.5, 2.5, 100, price_version=1)
+        large = pricer.quote('corn', 2.5, 2.5, 1000, price_version=1)
+        assert small > 1.0
+        assert large == pytest.approx(small * 10, abs=0.1)
+
+    def test_minimum_premium(self, pricer):
+        """Deep out-of-the-money protection still costs the minimum"""
+        assert pricer.quote('corn', 2.5, 0.5, 50, price_version=1) == 1.0
+
+    def test_batch_matches_single_quotes(self, pricer):
+        """Vectorized batch quotes agree with one-at-a-time quotes"""
+        strikes = [2.0, 2.4, 2.5, 2.8]
+        quantities = [100, 200, 300, 400]
+        batch = pricer.quote_batch('corn', 2.5, strikes, quantities, price_version=1)
+        pricer.clear()
+        single = [pricer.quote('corn', 2.5, k, q, price_version=1) for k, q in zip(strikes, quantities)]
+        assert batch.tolist() == pytest.approx(single)
+
+    def test_warm_ladder_serves_buys_from_cache(self, pricer):
+        """After warming, quotes hit the cache until the price version changes"""
+        pricer.warm('corn', 2.5, price_version=7)
+        misses = pricer.misses
+        pricer.quote('corn', 2.5, 2.37, 100, price_version=7)
+        assert pricer.misses == misses
+        pricer.quote('corn', 2.6, 2.37, 100, price_version=8)
+        assert pricer.misses == misses + 1
+
+    def test_cache_is_bounded(self):
+        """Old quotes are evicted once the cache is full"""
+        pricer = PremiumPricer(volatilities={'corn': 0.25}, cache_size=10)
+        pricer.warm('corn', 2.5, price_version=1)
+        assert len(pricer._cache) == 10
+
+    def test_live_volatility_estimate_overrides_config(self):
+        """Premiums use the crop's estimated volatility once there is one"""
+        estimates = {'corn': 0.5}
+        pricer = PremiumPricer(volatilities={'corn': 0.25, 'wheat': 0.3}, estimates=estimates.get)
+        assert pricer.volatility('corn') == 0.5
+        assert pricer.volatility('wheat') == 0.3
+        calm = PremiumPricer(volatilities={'corn': 0.25})
+        assert pricer.quote('corn', 2.5, 2.5, 100, price_version=1) > calm.quote('corn', 2.5, 2.5, 100, price_version=1)
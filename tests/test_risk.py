@@ -0,0 +1,131 @@
+import pytest
+import numpy as np
+from src.oracle.simulator import PriceSimulator, correlation_matrix
+from datetime import date
+from src.risk.backtest import BacktestBook, PriceHistory, run_backtest, synthetic_book
+from src.pricing.options import PremiumPricer
+from src.risk.montecarlo import RiskBook, run_risk, _simulate_chunk
+
+@pytest.fixture
+def book():
+    rng = np.random.default_rng(1)
+    n = 500
+    return RiskBook(
+        crops=['corn', 'wheat'],
+        spots=[2.5, 3.0],
+        crop_index=rng.integers(0, 2, n),
+        quantities=rng.uniform(50, 1000, n),
+        strikes=rng.uniform(2.0, 3.2, n),
+        days=rng.integers(0, 91, n)
+    )
+
+class TestRiskBook:
+    def test_grouped_revaluation_matches_brute_force(self, book):
+        """Suffix-sum revaluation equals summing each contract's payout"""
+        volatilities = np.array([0.25, 0.3])
+        simulator = PriceSimulator(book.crops, book.spots, volatilities={'corn': 0.25, 'wheat': 0.3}, correlation=np.eye(2))
+        task = (np.random.SeedSequence(3), 50, simulator, book.horizon, book.groups)
+        grouped = _simulate_chunk(task)
+
+        # Replay the same random draws and pay each contract individually
+        rng = np.random.default_rng(np.random.SeedSequence(3))
+        shocks = rng.standard_normal((50, book.horizon, 2))
+        dt = 1 / 365.0
+        log_paths = np.cumsum(-0.5 * volatilities ** 2 * dt + volatilities * np.sqrt(dt) * shocks, axis=1)
+        expected = np.zeros((50, 2))
+        for crop, quantity, strike, day in zip(book.crop_index, book.quantities, book.strikes, book.days):
+            price = book.spots[crop] * (np.exp(log_paths[:, day - 1, crop]) if day else 1.0)
+            expected[:, crop] += quantity * np.maximum(strike - price, 0.0)
+
+        assert grouped == pytest.approx(expected)
+
+    def test_expired_contracts_pay_intrinsic(self):
+        """Contracts at expiry pay a known amount in every scenario"""
+        book = RiskBook(['corn'], [2.0], [0], [100.0], [2.5], [0])
+        report = run_risk(book, scenarios=100, chunk_size=50, workers=1, seed=1)
+        assert report['total']['expected_payout'] == pytest.approx(50.0)
+        assert report['total']['var'] == pytest.approx(50.0)
+
+class TestRunRisk:
+    def test_report_shape_and_ordering(self, book):
+        """Expected payout <= VaR <= expected shortfall for each crop"""
+        report = run_risk(book, scenarios=2000, chunk_size=500, workers=1, seed=7)
+        assert set(report['crops']) == {'corn', 'wheat'}
+        for stats in list(report['crops'].values()) + [report['total']]:
+            assert 0 <= stats['expected_payout'] <= stats['var'] <= stats['expected_shortfall']
+        assert report['total']['contracts'] == len(book)
+
+    def test_process_pool_is_reproducible(self, book):
+        """Same seed gives the same answer in-process and across workers"""
+        serial = run_risk(book, scenarios=1000, chunk_size=250, workers=1, seed=11)
+        parallel = run_risk(book, scenarios=1000, chunk_size=250, workers=2, seed=11)
+        assert parallel['total']['var'] == pytest.approx(serial['total']['var'])
+
+    def test_correlation_matrix_is_valid(self):
+        """Configured correlations give a symmetric positive definite matrix"""
+        matrix = correlation_matrix(['corn', 'wheat', 'rice', 'soybeans', 'coffee'])
+        assert np.allclose(matrix, matrix.T)
+        assert np.linalg.eigvalsh(matrix).min() > 0
+
+@pytest.fixture
+def history():
+    prices = PriceSimulator(['corn', 'wheat'], [2.5, 3.0], seed=4).paths(1, 400)[0]
+    return PriceHistory(date(2024, 1, 1), ['corn', 'wheat'], prices)
+
+class TestBacktest:
+    def test_history_forward_fills_missing_days(self):
+        """Days without a price carry the previous price; days before the first stay empty"""
+        history = PriceHistory.from_rows([
+            (date(2024, 1, 1), 'corn', 2.0),
+            (date(2024, 1, 4), 'corn', 2.3),
+            (date(2024, 1, 2), 'wheat', 3.0)
+        ])
+        assert len(history) == 4
+        assert history.prices[:, 0].tolist() == [2.0, 2.0, 2.0, 2.3]
+        assert np.isnan(history.prices[0, 1])
+        assert history.prices[3, 1] == 3.0
+
+    def test_csv_history(self, tmp_path):
+        """Long-format CSV files load by date, using the first simulated path only"""
+        path = tmp_path / 'prices.csv'
+        path.write_text("path,date,crop,price\n0,2024-01-01,corn,2.0\n1,2024-01-01,corn,9.0\n0,2024-01-02,corn,2.1\n")
+        history = PriceHistory.from_csv(str(path))
+        assert history.start == date(2024, 1, 1)
+        assert history.prices[:, 0].tolist() == [2.0, 2.1]
+
+    def test_expiry_policy_matches_contract_by_contract_replay(self, history):
+        """Vectorized premiums and payouts equal pricing and settling each contract"""
+        book = synthetic_book(history, 300, seed=5)
+        pricer = PremiumPricer()
+        report = run_backtest(history, book, policy='expiry', pricer=pricer)
+
+        premiums = payouts = 0.0
+        for crop, day, quantity, strike, tenor in zip(book.crop_index, book.buy_day, book.quantities, book.strikes, book.expiry_days):
+            name = history.crops[crop]
+            premiums += pricer.quote(name, history.prices[day, crop], strike, quantity, price_version=day, expiry_days=tenor)
+            payouts += quantity * max(strike - history.prices[day + tenor, crop], 0.0)
+
+        assert report['total']['contracts'] == 300
+        assert report['total']['premiums'] == pytest.approx(premiums)
+        assert report['total']['payouts'] == pytest.approx(payouts)
+
+    def test_first_itm_exercises_on_first_day_below_strike(self):
+        """Farmers exercise as soon as the price drops below the strike"""
+        prices = np.array([[3.0], [2.9], [2.4], [2.0], [1.0], [3.0]])
+        history = PriceHistory(date(2024, 1, 1), ['corn'], prices)
+        book = BacktestBook([0, 0], [0, 0], [100.0, 100.0], [2.5, 1.5], [4, 4])
+
+        report = run_backtest(history, book, policy='first_itm')
+        assert report['total']['exercised'] == 2
+        assert report['total']['payouts'] == pytest.approx(100 * (2.5 - 2.4) + 100 * (1.5 - 1.0))
+
+        at_expiry = run_backtest(history, book, policy='expiry')
+        assert at_expiry['total']['payouts'] == pytest.approx(100 * 1.5 + 100 * 0.5)
+        assert at_expiry['total']['max_drawdown'] > 0
+
+    def test_contracts_past_the_history_are_skipped(self, history):
+        """Contracts that have not expired by the end of the data are left out"""
+        book = BacktestBook([0], [len(history) - 10], [100.0], [2.5], [90])
+        report = run_backtest(history, book)
+        assert report['skipped'] == 1
+        assert report['total']['contracts'] == 0
@@ -61,7 +61,7 @@ class TestSMSHandler:
         user = User(
             phone_number='+254700000000',
             stellar_public_key='G...',
-            wallet=Wallet(balance=1000.0)  # Has enough balance for premium
+            wallet=Wallet(balance=100000)  # Has enough balance for premium (minor units)
         )
         crop = Crop(
             name='mahindi',